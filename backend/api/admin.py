@@ -2,7 +2,7 @@ from django.contrib import admin
 
 # Register your models here.
 from django.contrib import admin
-from .models import Sensor, Measurement, AuditLog, Profile
+from .models import Sensor, Measurement, AuditLog, Profile, Notification, MeasurementRollup, SensorEscalationState, AlertRule
 from . import models
 
 
@@ -29,4 +29,25 @@ class AuditLogAdmin(admin.ModelAdmin):
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ("user", "role", "manager")
     search_fields = ("user__username", "role")
-    list_filter = ("role",)
\ No newline at end of file
+    list_filter = ("role",)
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ("channel", "recipient", "level", "sensor", "status", "attempts", "next_attempt_at", "sent_at")
+    list_filter = ("status", "channel", "level")
+    search_fields = ("recipient", "last_error")
+
+@admin.register(MeasurementRollup)
+class MeasurementRollupAdmin(admin.ModelAdmin):
+    list_display = ("sensor", "resolution", "bucket", "count", "alert_count", "temperature_min", "temperature_max")
+    list_filter = ("resolution", "sensor")
+
+@admin.register(SensorEscalationState)
+class SensorEscalationStateAdmin(admin.ModelAdmin):
+    list_display = ("sensor", "level", "alert_count", "level_reached_at", "last_alert_at")
+    list_filter = ("level",)
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ("sensor", "metric", "operator", "threshold", "hysteresis", "duration", "active")
+    list_filter = ("metric", "active")
@@ -0,0 +1,142 @@
+"""
+Détection d'anomalies en flux, par capteur, en complément des seuils min/max.
+
+État en O(1) par capteur, mis à jour à chaque mesure sans relire l'historique :
+- SPIKE : écart à la moyenne mobile exponentielle (EWMA) > ANOMALY_Z écarts-types ;
+- RATE  : variation de température plus rapide que ANOMALY_MAX_RATE °C/min ;
+- STUCK : même couple température/humidité reçu ANOMALY_STUCK_COUNT fois de suite.
+
+L'état vit en mémoire du processus qui ingère (subscriber MQTT en production) et il est
+sauvegardé toutes les ANOMALY_CHECKPOINT_INTERVAL secondes dans AnomalyCheckpoint.
+"""
+import math
+import threading
+import time
+
+from django.conf import settings
+
+from .models import AnomalyCheckpoint
+
+MIN_RATE_INTERVAL = 1.0  # secondes
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+class DetectorState:
+    """Statistiques glissantes d'un capteur (sérialisables pour le checkpoint)."""
+
+    FIELDS = ("count", "mean", "var", "last_temperature", "last_humidity", "last_ts", "stuck_run")
+
+    def __init__(self, count=0, mean=0.0, var=0.0, last_temperature=None, last_humidity=None,
+                 last_ts=None, stuck_run=0):
+        self.count = count
+        self.mean = mean
+        self.var = var
+        self.last_temperature = last_temperature
+        self.last_humidity = last_humidity
+        self.last_ts = last_ts  # epoch (s)
+        self.stuck_run = stuck_run
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{field: data[field] for field in cls.FIELDS if field in data})
+
+    def update(self, temperature, humidity, moment):
+        """Intègre une mesure ; retourne les anomalies détectées [(type, détail)]."""
+        anomalies = []
+        ts = moment.timestamp()
+
+        # Écart à l'EWMA, évalué avant d'intégrer la mesure (après un temps de chauffe)
+        std = math.sqrt(self.var)
+        if self.count >= setting("ANOMALY_WARMUP", 20) and std >= setting("ANOMALY_MIN_STD", 0.1):
+            z = (temperature - self.mean) / std
+            if abs(z) > setting("ANOMALY_Z", 4.0):
+                anomalies.append(("SPIKE", f"Temp={temperature} à {z:+.1f}σ de la moyenne {self.mean:.2f}"))
+
+        # Horodatage serveur : les mesures d'un même lot sont trop rapprochées pour une vitesse
+        if self.last_temperature is not None and self.last_ts is not None and ts - self.last_ts >= MIN_RATE_INTERVAL:
+            rate = (temperature - self.last_temperature) / ((ts - self.last_ts) / 60)
+            if abs(rate) > setting("ANOMALY_MAX_RATE", 2.0):
+                anomalies.append(("RATE", f"Variation de {rate:+.2f} °C/min"))
+
+        if (temperature, humidity) == (self.last_temperature, self.last_humidity):
+            self.stuck_run += 1
+            # Signalé une seule fois par série
+            if self.stuck_run + 1 == setting("ANOMALY_STUCK_COUNT", 30):
+                anomalies.append(("STUCK", f"Temp={temperature}, Hum={humidity} identiques {self.stuck_run + 1} fois"))
+        else:
+            self.stuck_run = 0
+
+        # Mise à jour incrémentale de la moyenne et de la variance exponentielles
+        alpha = setting("ANOMALY_ALPHA", 0.1)
+        if self.count == 0:
+            self.mean, self.var = temperature, 0.0
+        else:
+            diff = temperature - self.mean
+            increment = alpha * diff
+            self.mean += increment
+            self.var = (1 - alpha) * (self.var + diff * increment)
+        self.count += 1
+        self.last_temperature, self.last_humidity, self.last_ts = temperature, humidity, ts
+        return anomalies
+
+
+class AnomalyEngine:
+
+    def __init__(self):
+        self._states = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._checkpointed_at = time.monotonic()
+
+    def prime(self, sensor_pks):
+        """Charge les checkpoints des capteurs pas encore en mémoire (aucune requête sinon)."""
+        missing = [pk for pk in sensor_pks if pk not in self._states]
+        if not missing:
+            return
+        saved = dict(AnomalyCheckpoint.objects.filter(sensor_id__in=missing).values_list("sensor_id", "state"))
+        with self._lock:
+            for pk in missing:
+                self._states.setdefault(pk, DetectorState.from_dict(saved.get(pk, {})))
+
+    def observe(self, measurements):
+        """Met à jour les détecteurs dans l'ordre du lot ; retourne [(mesure, type, détail)]."""
+        self.prime({m.sensor.pk for m in measurements})
+        found = []
+        with self._lock:
+            for m in measurements:
+                state = self._states[m.sensor.pk]
+                for kind, detail in state.update(m.temperature, m.humidity, m.timestamp):
+                    found.append((m, kind, detail))
+                self._dirty.add(m.sensor.pk)
+        return found
+
+    def checkpoint(self, force=False):
+        """Sauvegarde l'état des capteurs modifiés, au plus une fois par intervalle."""
+        if not force and time.monotonic() - self._checkpointed_at < setting("ANOMALY_CHECKPOINT_INTERVAL", 60):
+            return 0
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            rows = [AnomalyCheckpoint(sensor_id=pk, state=self._states[pk].as_dict()) for pk in dirty]
+            self._checkpointed_at = time.monotonic()
+        AnomalyCheckpoint.objects.bulk_create(
+            rows, update_conflicts=True, unique_fields=["sensor"], update_fields=["state", "updated_at"]
+        )
+        return len(rows)
+
+    def forget(self, sensor_pk=None):
+        with self._lock:
+            if sensor_pk is None:
+                self._states.clear()
+                self._dirty.clear()
+            else:
+                self._states.pop(sensor_pk, None)
+                self._dirty.discard(sensor_pk)
+
+
+engine = AnomalyEngine()
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .partitions import drop_view_before_migrate, rebuild_view_after_migrate
+
+        # Vue api_measurement_history : supprimée pendant les migrations, recréée ensuite
+        # avec les colonnes actuelles du modèle
+        pre_migrate.connect(drop_view_before_migrate, sender=self)
+        post_migrate.connect(rebuild_view_after_migrate, sender=self)
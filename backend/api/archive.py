@@ -0,0 +1,167 @@
+"""
+Archivage à froid : les lignes plus anciennes que la rétention de leur table sont écrites
+dans archive/<table>/<AAAA-MM-JJ>.jsonl.gz (un fichier par jour) puis supprimées par lots.
+
+- Mesures : seulement celles déjà intégrées aux agrégats (id <= watermark de compact_rollups)
+  et sans accusé de réception ; les MeasurementRollup ne sont jamais touchés.
+- Un lot est d'abord écrit (membre gzip ajouté au fichier du jour) puis supprimé : après
+  une interruption entre les deux, le lot peut être réécrit, read_archive() dédoublonne par id.
+"""
+import gzip
+import json
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import latest, partitions
+from .models import AuditLog, Dht11, Measurement, RollupWatermark, Sensor
+from .rollups import WATERMARK
+
+
+class ArchiveSpec:
+
+    def __init__(self, model, time_field, fields, keys):
+        self.model = model
+        self.time_field = time_field
+        self.fields = fields  # colonnes values_list()
+        self.keys = keys      # clés JSON correspondantes
+
+    @property
+    def time_key(self):
+        return self.keys[self.fields.index(self.time_field)]
+
+    def eligible(self):
+        return self.model.objects.all()
+
+    def deleted(self, rows):
+        """Appelé dans la transaction qui vient de supprimer les lignes d'un lot."""
+
+
+class MeasurementArchiveSpec(ArchiveSpec):
+
+    def eligible(self):
+        watermark = RollupWatermark.objects.filter(name=WATERMARK).values_list("last_id", flat=True).first()
+        if watermark is None:
+            return Measurement.objects.none()
+        return Measurement.objects.filter(id__lte=watermark, acknowledgements__isnull=True)
+
+    def deleted(self, rows):
+        # Listes en cache (ETag) et dernière mesure des capteurs concernés à rafraîchir
+        sensor_ids = {row[1] for row in rows if row[1] is not None}
+        Sensor.objects.filter(sensor_id__in=sensor_ids).update(generation=F("generation") + 1)
+        for sensor_id in sensor_ids:
+            transaction.on_commit(lambda sensor_id=sensor_id: latest.forget(sensor_id))
+
+
+ARCHIVES = {
+    "measurement": MeasurementArchiveSpec(
+        Measurement, "timestamp",
+        fields=("id", "sensor__sensor_id", "timestamp", "temperature", "humidity", "status", "created_at"),
+        keys=("id", "sensor_id", "timestamp", "temperature", "humidity", "status", "created_at"),
+    ),
+    "auditlog": ArchiveSpec(
+        AuditLog, "created_at",
+        fields=("id", "action", "sensor__sensor_id", "details", "created_at"),
+        keys=("id", "action", "sensor_id", "details", "created_at"),
+    ),
+    "dht11": ArchiveSpec(
+        Dht11, "dt",
+        fields=("id", "temperature", "humidity", "dt"),
+        keys=("id", "temperature", "humidity", "dt"),
+    ),
+}
+
+
+def archive_dir():
+    return Path(getattr(settings, "ARCHIVE_DIR", settings.BASE_DIR / "archive"))
+
+
+def day_file(table, day):
+    return archive_dir() / table / f"{day.isoformat()}.jsonl.gz"
+
+
+def write_batch(table, spec, rows):
+    """Ajoute les lignes aux fichiers de leur jour (un membre gzip par fichier et par lot)."""
+    by_day = {}
+    for row in rows:
+        record = dict(zip(spec.keys, row))
+        day = timezone.localtime(record[spec.time_key]).date()
+        by_day.setdefault(day, []).append(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False))
+
+    for day, lines in by_day.items():
+        path = day_file(table, day)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def archive_table(table, retention_days, batch_size=5000, dry_run=False):
+    """
+    Archive puis supprime, par lots de `batch_size`, les lignes de `table` plus anciennes
+    que `retention_days` jours. Retourne le nombre de lignes archivées.
+    Mesures : les mois scellés (api/partitions.py) entièrement antérieurs à la limite sont
+    archivés puis supprimés d'un bloc ; un mois à cheval sur la limite attend d'être sorti en entier.
+    """
+    spec = ARCHIVES[table]
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    candidates = spec.eligible().filter(**{f"{spec.time_field}__lt": cutoff}).order_by("id")
+
+    expired = partitions.expired(cutoff) if table == "measurement" else []
+
+    if dry_run:
+        return candidates.count() + sum(partitions.row_count(month) for month in expired)
+
+    total = 0
+    last_id = 0
+    while True:
+        rows = list(candidates.filter(id__gt=last_id).values_list(*spec.fields)[:batch_size])
+        if not rows:
+            break
+        write_batch(table, spec, rows)
+        ids = [row[0] for row in rows]
+        with transaction.atomic():
+            spec.model.objects.filter(id__in=ids).delete()
+            spec.deleted(rows)
+        total += len(rows)
+        last_id = ids[-1]
+
+    for month in expired:
+        total += partitions.drop_partition(month, archive=True)
+    return total
+
+
+def read_archive(table, start=None, end=None, sensor_id=None):
+    """
+    Relit les lignes archivées de `table` entre `start` et `end` (datetimes, bornes incluses),
+    filtrées par capteur si demandé. Ne lit que les fichiers des jours concernés.
+    """
+    spec = ARCHIVES[table]
+    folder = archive_dir() / table
+    if not folder.exists():
+        return
+
+    first_day = timezone.localtime(start).date() if start else None
+    last_day = timezone.localtime(end).date() if end else None
+    for path in sorted(folder.glob("*.jsonl.gz")):
+        day = path.name.split(".")[0]
+        if (first_day and day < first_day.isoformat()) or (last_day and day > last_day.isoformat()):
+            continue
+        seen = set()  # doublons possibles seulement dans le fichier d'un même jour
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["id"] in seen:
+                    continue
+                seen.add(record["id"])
+                if sensor_id is not None and str(record.get("sensor_id")) != str(sensor_id):
+                    continue
+                moment = parse_datetime(record[spec.time_key])
+                if (start and moment < start) or (end and moment > end):
+                    continue
+                yield record
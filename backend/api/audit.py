@@ -1,8 +1,61 @@
+import threading
+import time
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+
 from .models import AuditLog
 
+# Tampon par thread (une requête ou un worker) vidé en un seul bulk_create
+_local = threading.local()
+
+
 def create_audit(action, sensor=None, details=""):
-    AuditLog.objects.create(
-        action=action,
-        sensor=sensor,
-        details=details
-    )
+    entry = AuditLog(action=action, sensor=sensor, details=details)
+
+    # Mode synchrone (tests, scripts) : un INSERT immédiat comme avant
+    if getattr(settings, "AUDIT_SYNC", False):
+        entry.save()
+        return
+
+    if connection.in_atomic_block:
+        # Conservé seulement si la transaction est validée
+        transaction.on_commit(partial(_enqueue, entry))
+    else:
+        _enqueue(entry)
+
+
+def _enqueue(entry):
+    buffer = getattr(_local, "buffer", None)
+    if not buffer:
+        buffer = _local.buffer = []
+        _local.started = time.monotonic()
+    buffer.append(entry)
+
+    if (len(buffer) >= getattr(settings, "AUDIT_BUFFER_SIZE", 100)
+            or time.monotonic() - _local.started >= getattr(settings, "AUDIT_BUFFER_MAX_AGE", 5)):
+        flush_audit()
+
+
+def flush_audit():
+    """Écrit les entrées en attente du thread courant (un seul INSERT)."""
+    buffer = getattr(_local, "buffer", None)
+    if not buffer:
+        return 0
+    _local.buffer = []
+    AuditLog.objects.bulk_create(buffer)
+    return len(buffer)
+
+
+class AuditFlushMiddleware:
+    """Vide le tampon d'audit à la fin de chaque requête."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            flush_audit()
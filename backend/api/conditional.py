@@ -0,0 +1,44 @@
+"""
+GET conditionnels (ETag / If-None-Match) sur les lectures des tableaux de bord.
+
+Le validateur vient de Sensor.generation (incrémenté à chaque mesure et modification) :
+une seule petite requête suffit à répondre 304 sans lancer la requête principale
+ni la sérialisation.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Sum
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Sensor
+
+
+def sensors_version():
+    """Version de l'ensemble des capteurs (ajout, suppression, modification, nouvelle mesure)."""
+    agg = Sensor.objects.aggregate(count=Count("id"), generations=Sum("generation"), last=Max("id"))
+    return f"{agg['count']}.{agg['generations'] or 0}.{agg['last'] or 0}"
+
+
+def sensor_version(sensor_id):
+    generation = Sensor.objects.filter(sensor_id=sensor_id).values_list("generation", flat=True).first()
+    return "none" if generation is None else str(generation)
+
+
+def make_etag(request, *parts):
+    """ETag d'une ressource : version + paramètres de la requête (filtres, curseur, page)."""
+    query = hashlib.md5(request.get_full_path().encode()).hexdigest()[:12]
+    return quote_etag("-".join([*map(str, parts), query]))
+
+
+def conditional(request, etag, build):
+    """304 si le client a déjà cette version, sinon build() ; l'ETag est posé dans les deux cas."""
+    known = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in known or "*" in known:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = build()
+    if response.status_code in (200, 304):
+        response["ETag"] = etag
+    return response
@@ -1,5 +1,10 @@
-from .models import Sensor, Profile, Ticket, AuditLog
-from .utils import send_alert_email, send_alert_telegram, send_twilio_alert
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import Sensor, SensorEscalationState, Ticket
+from .registry import registry, resolve_chain
+from .notifications import enqueue_alert
 from .audit import create_audit
 
 def notify_user(user, sensor, measurement, level="USER"):
@@ -8,18 +13,62 @@ def notify_user(user, sensor, measurement, level="USER"):
     if not user or not user.email:
         print(f"⚠ Impossible d'envoyer l'alerte à level {level} : email manquant")
         return
-    send_alert_email(user, sensor, measurement, message)
-    send_alert_telegram(user, sensor, measurement, message)
 
-    # Twilio pour le SUPERVISOR (Niveau 3)
-    if level == "SUPERVISOR":
-        send_twilio_alert(message, sensor, measurement)
+    # Email + Telegram (+ Twilio pour le SUPERVISOR) mis en file dans l'outbox :
+    # l'envoi est fait par la commande dispatch_notifications
+    enqueue_alert(user, sensor, measurement, level, message)
+
+# Premier compteur (après incrément) de chaque niveau
+LEVEL_THRESHOLDS = [("SUPERVISOR", 7), ("MANAGER", 4), ("USER", 1)]
+
+
+def level_for(count):
+    return next((level for level, first in LEVEL_THRESHOLDS if count >= first), "NONE")
 
-    create_audit(
-        action="EMAIL_SENT",
-        sensor=sensor,
-        details=f"Alerte envoyée à {user.email} (niveau {level})"
+
+def record_alert(sensor, moment=None):
+    """
+    Incrémente le compteur d'alertes du capteur en un UPDATE atomique (aucun incrément
+    perdu entre l'API REST et le subscriber MQTT) ; le niveau et sa date ne changent
+    qu'au franchissement d'un seuil. Retourne l'état à jour.
+    """
+    moment = moment or timezone.now()
+    # Dans le SET, F() désigne l'ancienne valeur : nouveau compteur = alert_count + 1
+    level = Case(
+        *[When(alert_count__gte=first - 1, then=Value(name)) for name, first in LEVEL_THRESHOLDS],
+        default=Value("NONE"),
+    )
+    reached = Case(
+        *[When(alert_count=first - 1, then=Value(moment)) for _, first in LEVEL_THRESHOLDS],
+        default=F("level_reached_at"),
     )
+    states = SensorEscalationState.objects.filter(sensor_id=sensor.pk)
+    changes = dict(alert_count=F("alert_count") + 1, level=level, level_reached_at=reached, last_alert_at=moment)
+
+    if not states.update(**changes):
+        try:
+            with transaction.atomic():
+                SensorEscalationState.objects.create(
+                    sensor_id=sensor.pk, alert_count=1, level=level_for(1),
+                    level_reached_at=moment, last_alert_at=moment,
+                )
+        except IntegrityError:
+            # Créé entre-temps par une ingestion concurrente
+            states.update(**changes)
+    return states.get()
+
+
+def reset_escalation(sensor_pks, moment=None):
+    """
+    Retour à la normale : UPDATE conditionnel, aucune ligne écrite si le capteur
+    n'était pas en escalade. Retourne le nombre de capteurs réinitialisés.
+    """
+    if not sensor_pks:
+        return 0
+    return SensorEscalationState.objects.filter(sensor_id__in=sensor_pks, alert_count__gt=0).update(
+        alert_count=0, level="NONE", level_reached_at=moment or timezone.now()
+    )
+
 
 def escalation_process(sensor, measurement):
     """
@@ -29,19 +78,25 @@ def escalation_process(sensor, measurement):
     3- Alerte 6 → notifier SUPERVISOR
     """
 
-    # Incrémenter compteur du sensor
-    sensor.alert_count += 1
-    sensor.save()
+    # Incrémenter compteur (état d'escalade, UPDATE atomique) ; Sensor.alert_count en est
+    # la copie affichée. UPDATE direct : pas de post_save, l'entrée du registre et sa
+    # chaîne d'escalade restent en cache pendant une rafale d'alertes
+    state = record_alert(sensor, measurement.timestamp)
+    Sensor.objects.filter(pk=sensor.pk).update(alert_count=state.alert_count)
+    sensor.alert_count = state.alert_count
+
+    # Chaîne USER → MANAGER → SUPERVISOR résolue une fois par capteur (registre en mémoire)
+    entry = registry.get(sensor.sensor_id)
+    chain = entry.chain if entry is not None and entry.user_id == sensor.user_id else resolve_chain(sensor)
 
     # Verifier que le capteur a un utilisateur assigné
-    responsible_user = sensor.user
-    if not responsible_user:
+    if not sensor.user_id:
         print("⚠ Aucun utilisateur assigné à ce capteur")
         return
 
-    # Recuperer le profil utilisateur
-    profile = Profile.objects.filter(user=responsible_user).first()
-    if not profile:
+    # Pas de profil → pas de chaîne d'escalade
+    responsible_user = chain["USER"]
+    if not responsible_user:
         print("⚠ Aucun profil associé à l’utilisateur")
         return
 
@@ -57,11 +112,11 @@ def escalation_process(sensor, measurement):
 
     # Étape 2 — 3 alertes → notifier MANAGER
     if sensor.alert_count > 3 and sensor.alert_count <= 6:
-        if profile.manager:  # Le user a un manager dans Profile
-            notify_user(profile.manager, sensor, measurement, "MANAGER")
+        if chain["MANAGER"]:  # Le user a un manager dans Profile
+            notify_user(chain["MANAGER"], sensor, measurement, "MANAGER")
             create_and_assign_ticket(
                 sensor=sensor,
-                assigned_user=profile.manager,
+                assigned_user=chain["MANAGER"],
                 priority="MEDIUM"
             )
         else:
@@ -70,11 +125,9 @@ def escalation_process(sensor, measurement):
 
     # Étape 3 — 6 alertes → notifier SUPERVISOR
     if sensor.alert_count > 6:
-        # On récupère le profil du manager pour accéder à son manager (supervisor)
-        manager_profile = Profile.objects.filter(user=profile.manager).first()
-
-        if manager_profile and manager_profile.manager:
-            supervisor = manager_profile.manager
+        # Le manager du manager, déjà résolu dans la chaîne
+        supervisor = chain["SUPERVISOR"]
+        if supervisor:
             notify_user(supervisor, sensor, measurement, "SUPERVISOR")
             create_and_assign_ticket(
                 sensor=sensor,
@@ -94,7 +147,7 @@ def create_and_assign_ticket(sensor, assigned_user, priority="MEDIUM"):
             priority=priority
         )
 
-        AuditLog.objects.create(
+        create_audit(
             action="TICKET_CREATED",
             sensor=sensor,
             details=f"Ticket #{ticket.id} créé et assigné à {assigned_user.username}"
@@ -0,0 +1,177 @@
+"""
+Pub/sub en mémoire pour le flux temps réel (SSE, /api/stream/).
+
+Chaque événement est encodé une seule fois puis remis tel quel à chaque abonné :
+diffuser une mesure à N navigateurs ne coûte ni requête ni sérialisation de plus.
+publish() peut être appelé depuis n'importe quel thread (ingestion, vues synchrones) ;
+les files des abonnés vivent dans la boucle asyncio du serveur ASGI.
+
+Les événements restent dans ce processus : le flux voit les mesures reçues par l'API
+(Bridge, POST /api/mesures/), pas celles du subscriber MQTT lancé à part.
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+ALL_SENSORS = None
+
+
+class Subscription:
+
+    def __init__(self, loop, sensor_ids, maxsize):
+        self.loop = loop
+        self.sensor_ids = sensor_ids
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def _put(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Client trop lent : le flux est fermé, EventSource se reconnecte
+            self.overflowed = True
+
+    def deliver(self, frame):
+        self.loop.call_soon_threadsafe(self._put, frame)
+
+
+class EventBroker:
+
+    def __init__(self):
+        self._subscribers = {}  # sensor_id (ou ALL_SENSORS) -> {Subscription}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, sensor_ids=None, maxsize=100):
+        """À appeler depuis la boucle asyncio qui lira subscription.queue."""
+        subscription = Subscription(asyncio.get_running_loop(), sensor_ids, maxsize)
+        with self._lock:
+            for key in sensor_ids or [ALL_SENSORS]:
+                self._subscribers.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for key in subscription.sensor_ids or [ALL_SENSORS]:
+                subscribers = self._subscribers.get(key)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[key]
+
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def publish(self, event, data, sensor_id=None):
+        """
+        Diffuse un événement aux abonnés de `sensor_id` et à ceux de tous les capteurs.
+        Sans sensor_id (ex: état de la LED), l'événement est remis à tous les abonnés.
+        """
+        with self._lock:
+            if sensor_id is None:
+                targets = set().union(*self._subscribers.values())
+            else:
+                targets = self._subscribers.get(ALL_SENSORS, set()) | self._subscribers.get(sensor_id, set())
+        if not targets:
+            return 0
+
+        frame = encode(next(self._ids), event, data)
+        for subscription in targets:
+            try:
+                subscription.deliver(frame)
+            except RuntimeError:
+                # Boucle fermée (serveur arrêté) : abonné abandonné
+                self.unsubscribe(subscription)
+        return len(targets)
+
+
+def encode(event_id, event, data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":"))
+    return f"id: {event_id}\nevent: {event}\ndata: {payload}\n\n".encode()
+
+
+broker = EventBroker()
+
+
+# Long-poll de l'état LED (threads synchrones) : version incrémentée à chaque commande
+_led_changed = threading.Condition()
+_led_version = 0
+
+
+def led_version():
+    return _led_version
+
+
+def notify_led(state, last_updated):
+    """Nouvelle commande LED : flux SSE et réveil des long-polls de ce processus."""
+    global _led_version
+    broker.publish("led", {"state": state, "last_updated": last_updated})
+    with _led_changed:
+        _led_version += 1
+        _led_changed.notify_all()
+
+
+def wait_led(seen, timeout):
+    """Attend une commande postérieure à la version `seen` ; False si le délai expire."""
+    with _led_changed:
+        return _led_changed.wait_for(lambda: _led_version != seen, timeout)
+
+
+async def stream(sensor_ids=None):
+    """
+    Générateur SSE d'un client : événements de ses capteurs, commentaire keep-alive
+    toutes les EVENT_STREAM_HEARTBEAT secondes. Se termine si le client décroche.
+    """
+    subscription = broker.subscribe(sensor_ids, maxsize=getattr(settings, "EVENT_STREAM_QUEUE", 100))
+    heartbeat = getattr(settings, "EVENT_STREAM_HEARTBEAT", 15)
+    try:
+        yield b"retry: 3000\n\n"
+        while not subscription.overflowed:
+            try:
+                yield await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def publish_measurements(measurements, data, previous_status):
+    """
+    Nouvelles mesures (déjà sérialisées) et changements d'état OK/ALERT par capteur.
+    previous_status : {sensor_id: statut de la dernière mesure connue avant ce lot}
+    """
+    status = dict(previous_status)
+    for m, item in zip(measurements, data):
+        sensor_id = m.sensor.sensor_id
+        broker.publish("measurement", item, sensor_id)
+
+        before = status.get(sensor_id)
+        if m.status != before and (before is not None or m.status == "ALERT"):
+            broker.publish("alert", {
+                "sensor_id": sensor_id,
+                "status": m.status,
+                "previous": before,
+                "measurement_id": m.id,
+                "temperature": m.temperature,
+                "timestamp": m.timestamp,
+            }, sensor_id)
+        status[sensor_id] = m.status
+
+
+def publish_anomalies(anomalies):
+    """Anomalies détectées par api/anomaly.py : [(mesure, type, détail)]."""
+    for m, kind, detail in anomalies:
+        sensor_id = m.sensor.sensor_id
+        broker.publish("anomaly", {
+            "sensor_id": sensor_id,
+            "kind": kind,
+            "detail": detail,
+            "measurement_id": m.id,
+            "temperature": m.temperature,
+            "humidity": m.humidity,
+            "timestamp": m.timestamp,
+        }, sensor_id)
@@ -0,0 +1,64 @@
+"""
+Exports en flux (CSV ou JSONL compressé gzip).
+
+Les lignes sont lues par paquets côté serveur (.iterator()) et envoyées au fil de l'eau :
+la mémoire utilisée reste constante quelle que soit la taille de la table.
+"""
+import csv
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+OUTPUTS = ("csv", "jsonl")
+CHUNK_SIZE = 2000
+GZIP_FLUSH_BYTES = 64 * 1024
+
+
+class Echo:
+    """Pseudo-fichier pour csv.writer : renvoie la ligne au lieu de l'écrire."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(header, rows, formatters=None):
+    writer = csv.writer(Echo(), delimiter=",")
+    yield writer.writerow(header)
+    for row in rows:
+        if formatters:
+            row = [fmt(value) if fmt else value for fmt, value in zip(formatters, row)]
+        yield writer.writerow(row)
+
+
+def gzip_jsonl(fields, rows):
+    """Un objet JSON par ligne, compressé au fil de l'eau (conteneur gzip)."""
+    compressor = zlib.compressobj(wbits=31)
+    pending, size = [], 0
+    for row in rows:
+        line = json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+        pending.append(line)
+        size += len(line)
+        if size >= GZIP_FLUSH_BYTES:
+            chunk = compressor.compress("".join(pending).encode())
+            pending, size = [], 0
+            if chunk:
+                yield chunk
+    yield compressor.compress("".join(pending).encode()) + compressor.flush()
+
+
+def stream_export(queryset, fields, header, filename, output="csv", formatters=None, keys=None):
+    """
+    Réponse en flux pour un queryset values_list(*fields).
+    output : "csv" (en-tête `header`) ou "jsonl" (clés `keys`, par défaut `fields` ; fichier .jsonl.gz).
+    """
+    rows = queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    if output == "jsonl":
+        response = StreamingHttpResponse(gzip_jsonl(keys or fields, rows), content_type="application/gzip")
+        filename += ".jsonl.gz"
+    else:
+        response = StreamingHttpResponse(csv_lines(header, rows, formatters), content_type="text/csv")
+        filename += ".csv"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
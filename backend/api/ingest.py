@@ -0,0 +1,207 @@
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import Case, F, Value, When
+
+from .models import Sensor, Measurement, IncidentAcknowledgement, AuditLog, Ticket
+from .escalation import escalation_process, reset_escalation
+from .registry import registry
+from . import events, latest
+from .anomaly import engine as anomaly_engine
+from .rules import engine as rules_engine
+
+ACK_LEVELS = ["USER", "MANAGER", "SUPERVISOR"]
+
+
+def resolve_sensors(sensor_ids, user=None):
+    """
+    Entrées du registre pour chaque sensor_id ; les capteurs inconnus sont créés
+    (rattachés à `user`), ou ignorés si `user` est None.
+    Aucune requête si tous les capteurs sont déjà en cache ; sinon les absents sont
+    chargés ensemble, quel que soit leur nombre.
+    """
+    entries = registry.get_many(sensor_ids)
+    missing = set(sensor_ids) - entries.keys()
+
+    if missing and user is not None:
+        Sensor.objects.bulk_create(
+            [Sensor(sensor_id=sid, name=f"Sensor-{sid}", user=user) for sid in sorted(missing)],
+            ignore_conflicts=True,
+        )
+        entries.update(registry.load_many(
+            Sensor.objects.select_related("user").prefetch_related("alert_rules").filter(sensor_id__in=missing)
+        ))
+
+    return entries
+
+
+def ingest_batch(readings, user=None):
+    """
+    Pipeline d'ingestion commun (API REST, lot du Bridge, subscriber MQTT).
+    readings : liste de dicts {"sensor_id", "temperature", "humidity"} déjà validés.
+
+    Le statut est calculé avant l'INSERT et tout est écrit dans une seule transaction :
+    mesures, accusés de réception et journal d'audit en un INSERT groupé chacun.
+    Retourne la liste des Measurement créées, alignée sur `readings`
+    (None pour un capteur inconnu quand `user` est None).
+    """
+    if not readings:
+        return []
+
+    with transaction.atomic():
+        entries = resolve_sensors({r["sensor_id"] for r in readings}, user)
+        sensors = {sid: entry.as_sensor() for sid, entry in entries.items()}
+
+        # Règles compilées évaluées par capteur, sur toutes ses mesures du lot à la fois
+        moment = timezone.now()
+        verdicts = {}
+        for sid, entry in entries.items():
+            own = [(r["temperature"], r["humidity"]) for r in readings if r["sensor_id"] == sid]
+            verdicts[sid] = iter(rules_engine.evaluate(entry.pk, entry.rules, own, moment))
+
+        results = []
+        evaluated = []
+        for r in readings:
+            entry = entries.get(r["sensor_id"])
+            if entry is None:
+                results.append(None)
+                continue
+            verdict = next(verdicts[r["sensor_id"]])
+            m = Measurement(
+                sensor=sensors[r["sensor_id"]],
+                temperature=r["temperature"],
+                humidity=r["humidity"],
+                status=verdict.status,
+            )
+            results.append(m)
+            evaluated.append((m, verdict))
+
+        measurements = [m for m, _ in evaluated]
+        if not measurements:
+            return results
+        Measurement.objects.bulk_create(measurements)
+        # Détecteurs en flux (EWMA, vitesse de variation, capteur figé), sans relire l'historique
+        anomalies = anomaly_engine.observe(measurements)
+        # Cache de la dernière mesure et flux temps réel, seulement si le lot est validé.
+        # robust : une erreur (Redis, base verrouillée...) est journalisée sans transformer
+        # en 500 un lot déjà enregistré, que le Bridge renverrait en double
+        transaction.on_commit(lambda: broadcast(measurements, anomalies), robust=True)
+
+        # Accusés de réception et audit au passage OK → ALERT seulement : une mesure maintenue
+        # en alerte (bande d'hystérésis) garde son statut sans rien écrire de plus
+        triggered = [m for m, verdict in evaluated if verdict.triggered]
+
+        IncidentAcknowledgement.objects.bulk_create([
+            IncidentAcknowledgement(measurement=m, level=level)
+            for m in triggered
+            for level in ACK_LEVELS
+        ])
+
+        audits = [
+            AuditLog(
+                action="MEASUREMENT_RECEIVED",
+                sensor=m.sensor,
+                details=f"Temp={m.temperature}, Hum={m.humidity}"
+            )
+            for m in measurements
+        ]
+        audits += [
+            AuditLog(
+                action="ALERT_TRIGGERED",
+                sensor=m.sensor,
+                details=f"Temp={m.temperature} dépasse les seuils autorisés : [{m.sensor.min_temp} - {m.sensor.max_temp}]"
+            )
+            for m in triggered
+        ]
+        audits += [
+            AuditLog(action="ANOMALY_DETECTED", sensor=m.sensor, details=f"{kind} : {detail}")
+            for m, kind, detail in anomalies
+        ]
+        AuditLog.objects.bulk_create(audits)
+
+        # Une seule mise à jour des capteurs du lot : génération (validateur ETag) incrémentée,
+        # compteur d'alertes remis à zéro pour les capteurs sans alerte dans le lot
+        alerting = {m.sensor.pk for m in measurements if m.status == "ALERT"}
+        normal = {m.sensor.pk for m in measurements} - alerting
+        Sensor.objects.filter(pk__in=normal | alerting).update(
+            generation=F("generation") + 1,
+            alert_count=Case(When(pk__in=normal, then=Value(0)), default=F("alert_count")),
+        )
+        for m in measurements:
+            if m.status == "OK":
+                m.sensor.alert_count = 0
+        # État d'escalade : UPDATE conditionnel, aucune ligne écrite si déjà à la normale
+        reset_escalation(normal)
+
+        # Escalade au déclenchement puis tant que le seuil reste franchi d'une mesure à l'autre
+        escalating = {m.sensor.pk for m, verdict in evaluated if verdict.triggered or verdict.sustained}
+        if not escalating:
+            return results
+
+        # Escalade dans l'ordre du lot, sur l'état à jour des capteurs en alerte
+        fresh = Sensor.objects.select_related("user").in_bulk(escalating)
+        for m, verdict in evaluated:
+            sensor = fresh.get(m.sensor.pk)
+            if sensor is None:
+                continue
+            if verdict.triggered or verdict.sustained:
+                m.sensor = sensor
+                escalation_process(sensor, m)
+
+                if verdict.triggered and not Ticket.objects.filter(sensor=sensor, status__in=["OPEN", "ASSIGNED"]).exists():
+                    Ticket.objects.create(sensor=sensor, priority="HIGH", status="OPEN")
+            elif m.status == "OK" and sensor.alert_count > 0:
+                # Retour à la normale au milieu du lot : remis à zéro tout de suite, l'alerte
+                # suivante repart de 1 comme si les mesures arrivaient une par une
+                sensor.alert_count = 0
+                Sensor.objects.filter(pk=sensor.pk).update(alert_count=0)
+                reset_escalation({sensor.pk})
+
+    return results
+
+
+def broadcast(measurements, anomalies=()):
+    """
+    Après COMMIT : dernière mesure de chaque capteur dans le cache "latest" et diffusion
+    aux abonnés du flux. Sans abonné, seules les dernières mesures sont sérialisées.
+    L'état des détecteurs d'anomalies est sauvegardé au plus une fois par intervalle.
+    Le lot est déjà enregistré : chaque étape journalise ses erreurs sans bloquer les suivantes.
+    """
+    from .serializers import MeasurementSerializer
+
+    try:
+        anomaly_engine.checkpoint()
+    except Exception as e:
+        print(f"❌ Sauvegarde des détecteurs d'anomalies : {e}")
+
+    subscribers = events.broker.has_subscribers()
+    if subscribers:
+        cached, data = measurements, MeasurementSerializer(measurements, many=True).data
+        final = data[-1]
+    else:
+        # Ordre de première apparition des capteurs : la dernière mesure du lot est passée à part
+        cached = list({m.sensor.sensor_id: m for m in measurements}.values())
+        data = MeasurementSerializer(cached, many=True).data
+        final = next(item for m, item in zip(cached, data) if m is measurements[-1])
+
+    previous = {}
+    try:
+        if subscribers:
+            previous = latest.statuses({m.sensor.sensor_id for m in measurements})
+        latest.remember(cached, data, final)
+    except Exception as e:
+        print(f"❌ Cache de la dernière mesure : {e}")
+
+    try:
+        events.publish_anomalies(anomalies)
+        if subscribers:
+            events.publish_measurements(measurements, data, previous)
+    except Exception as e:
+        print(f"❌ Diffusion temps réel : {e}")
+
+
+def ingest_reading(sensor_id, temperature, humidity, user=None):
+    """Ingestion d'une mesure unique ; None si le capteur est inconnu et `user` absent."""
+    return ingest_batch(
+        [{"sensor_id": sensor_id, "temperature": temperature, "humidity": humidity}],
+        user,
+    )[0]
@@ -0,0 +1,55 @@
+"""
+Dernière mesure de chaque capteur, déjà sérialisée, dans le cache "latest".
+
+Écrite par l'ingestion après COMMIT ; measurement_latest la lit sans requête SQL
+et ne retombe sur la base qu'en cas d'absence.
+"""
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+CACHE_ALIAS = "latest"
+ANY_SENSOR = "all"
+
+
+def cache_key(sensor_id=None):
+    return f"latest:{ANY_SENSOR if sensor_id in (None, '') else sensor_id}"
+
+
+def get_latest(sensor_id=None):
+    return caches[CACHE_ALIAS].get(cache_key(sensor_id))
+
+
+def store(sensor_id, data):
+    caches[CACHE_ALIAS].set(cache_key(sensor_id), data)
+
+
+def shared():
+    """
+    Cache commun à tous les processus (Redis, fichiers...). Une mémoire locale n'est pas
+    invalidée par les ingestions des autres processus : elle n'y est écrite qu'après COMMIT.
+    """
+    return not isinstance(caches[CACHE_ALIAS], LocMemCache)
+
+
+def statuses(sensor_ids):
+    """Statut de la dernière mesure en cache de chaque capteur : {sensor_id: "OK" | "ALERT"}."""
+    cached = caches[CACHE_ALIAS].get_many([cache_key(sid) for sid in sensor_ids])
+    return {sid: cached[cache_key(sid)]["status"] for sid in sensor_ids if cache_key(sid) in cached}
+
+
+def remember(measurements, data, last=None):
+    """
+    Garde la dernière mesure de chaque capteur d'un lot (appelé après COMMIT).
+    `last` : dernière mesure du lot tous capteurs confondus, data[-1] par défaut.
+    """
+    values = {}
+    for m, item in zip(measurements, data):
+        values[cache_key(m.sensor.sensor_id)] = item
+    if values:
+        values[cache_key()] = data[-1] if last is None else last
+        caches[CACHE_ALIAS].set_many(values)
+
+
+def forget(sensor_id):
+    """Configuration du capteur modifiée : l'entrée (capteur imbriqué) n'est plus à jour."""
+    caches[CACHE_ALIAS].delete_many([cache_key(sensor_id), cache_key()])
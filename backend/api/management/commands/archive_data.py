@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.archive import ARCHIVES, archive_table
+
+
+class Command(BaseCommand):
+    help = "Archive (fichiers .jsonl.gz par jour) puis supprime les lignes plus anciennes que la rétention"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--table", action="append", choices=sorted(ARCHIVES),
+            help="Table à traiter (répétable, toutes par défaut)"
+        )
+        parser.add_argument("--batch-size", type=int, default=5000, help="Lignes archivées puis supprimées par lot")
+        parser.add_argument("--dry-run", action="store_true", help="Compter les lignes concernées sans rien modifier")
+
+    def handle(self, *args, **options):
+        retention = settings.RETENTION_DAYS
+        for table in options["table"] or sorted(ARCHIVES):
+            days = retention.get(table, 0)
+            if not days:
+                self.stdout.write(f"⏭️ {table} : conservation illimitée")
+                continue
+
+            count = archive_table(table, days, batch_size=options["batch_size"], dry_run=options["dry_run"])
+            verb = "à archiver" if options["dry_run"] else "archivée(s)"
+            self.stdout.write(self.style.SUCCESS(f"✅ {table} : {count} ligne(s) {verb} (> {days} jours)"))
@@ -0,0 +1,26 @@
+import time
+from django.core.management.base import BaseCommand
+from api.rollups import compact
+
+
+class Command(BaseCommand):
+    help = "Met à jour les agrégats minute/heure/jour des mesures depuis le dernier watermark"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000, help="Mesures lues par transaction")
+        parser.add_argument(
+            "--loop", type=float, default=0,
+            help="Tourner en continu avec cette pause (s) entre deux passes (0 = une seule passe)"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                count = compact(batch_size=options["batch_size"])
+                if count or not options["loop"]:
+                    self.stdout.write(self.style.SUCCESS(f"✅ {count} mesure(s) intégrée(s) aux agrégats"))
+                if not options["loop"]:
+                    break
+                time.sleep(options["loop"])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("\n⏹️ Arrêt de la compaction"))
@@ -0,0 +1,43 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.audit import flush_audit
+from api.notifications import dispatch_pending
+
+
+class Command(BaseCommand):
+    help = "Envoie les notifications en attente (outbox) avec reprises et backoff exponentiel"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Traiter les notifications échues puis quitter")
+        parser.add_argument("--interval", type=float, default=2, help="Attente (s) quand l'outbox est vide")
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--workers", type=int, default=4, help="Envois simultanés")
+        parser.add_argument(
+            "--max-attempts", type=int, default=getattr(settings, "NOTIFICATION_MAX_ATTEMPTS", 5),
+            help="Nombre d'essais avant abandon (statut FAILED)"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write("📨 Dispatcher de notifications démarré")
+
+        try:
+            while True:
+                sent, failed = dispatch_pending(
+                    batch_size=options["batch_size"],
+                    max_workers=options["workers"],
+                    max_attempts=options["max_attempts"],
+                )
+                flush_audit()
+                if sent or failed:
+                    self.stdout.write(self.style.SUCCESS(f"✅ {sent} envoyée(s), ❌ {failed} en échec"))
+
+                if options["once"]:
+                    if not (sent or failed):
+                        break
+                    continue
+
+                if not (sent or failed):
+                    time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("\n⏹️ Arrêt du dispatcher"))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.seal_partitions import parse_month
+from api.partitions import drop_partition
+
+
+class Command(BaseCommand):
+    help = "Supprime la partition mensuelle d'un mois (DROP TABLE), archivée au préalable si demandé"
+
+    def add_arguments(self, parser):
+        parser.add_argument("month", type=parse_month, help="Mois de la partition, AAAA-MM")
+        parser.add_argument("--archive", action="store_true", help="Écrire les mesures dans archive/measurement/ avant suppression")
+
+    def handle(self, *args, **options):
+        month = options["month"]
+        try:
+            archived = drop_partition(month, archive=options["archive"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options["archive"]:
+            self.stdout.write(f"🗄️ {archived} mesure(s) archivée(s)")
+        self.stdout.write(self.style.SUCCESS(f"✅ Partition {month:%Y-%m} supprimée"))
@@ -1,20 +1,97 @@
 import json
+import re
+import threading
 import paho.mqtt.client as mqtt
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from api.models import Dht11, Sensor, Measurement, Ticket, IncidentAcknowledgement, AuditLog
-from api.escalation import escalation_process
-from django.utils import timezone
+from api.models import Dht11
+from api.ingest import ingest_reading
+from api.anomaly import engine as anomaly_engine
+from api.workers import PartitionedWorkerPool
 
 
 class Command(BaseCommand):
     help = 'MQTT Subscriber pour recevoir les données des capteurs IoT'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers", type=int, default=getattr(settings, "MQTT_WORKERS", 4),
+            help="Nombre de workers (une partition par worker, ordre garanti par capteur)"
+        )
+        parser.add_argument(
+            "--queue-depth", type=int, default=getattr(settings, "MQTT_QUEUE_DEPTH", 1000),
+            help="Taille max de la file de chaque worker"
+        )
+        parser.add_argument(
+            "--stats-interval", type=int, default=60,
+            help="Intervalle (s) d'affichage des compteurs de file (0 = désactivé)"
+        )
+
+    def process_reading(self, item):
+        """
+        Traitement d'une mesure (exécuté dans un worker, hors du thread réseau paho).
+        """
+        topic, sensor_id, temperature, humidity = item
+
+        # Sauvegarder dans Dht11 (table existante)
+        Dht11.objects.create(
+            temperature=temperature,
+            humidity=humidity
+        )
+
+        # --- Sauvegarder dans Measurement (pour le Frontend React) ---
+        # Pipeline commun avec l'API REST (api/ingest.py) : statut, accusés, audit, escalade
+        try:
+            m = ingest_reading(sensor_id, temperature, humidity)
+
+            if m is None:
+                self.stdout.write(self.style.WARNING(f"⚠️ Capteur ID {sensor_id} non trouvé en base. Créez-le dans l'admin."))
+            else:
+                if m.status == "ALERT":
+                    self.stdout.write(self.style.WARNING(f"🔥 Alerte détectée sur {sensor_id}: {temperature}°C"))
+                self.stdout.write(self.style.SUCCESS(f"✅ Saved to Measurement (Sensor {sensor_id})"))
+
+        except Exception as db_err:
+            self.stdout.write(self.style.ERROR(f"❌ Erreur DB Measurement: {db_err}"))
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"📊 Données reçues: {temperature}°C / {humidity}% | Topic: {topic}"
+            )
+        )
+
+    def report_stats(self, pool, interval, stop):
+        while not stop.wait(interval):
+            s = pool.stats()
+            self.stdout.write(
+                f"📈 File MQTT : reçus={s['submitted']} traités={s['processed']} "
+                f"erreurs={s['failed']} perdus={s['dropped']} en attente={s['queued']} "
+                f"lag moy={s['lag_avg']:.3f}s max={s['lag_max']:.3f}s"
+            )
+
     def handle(self, *args, **options):
         # Configuration MQTT
         BROKER = "127.0.0.1"
         PORT = 1883
         TOPIC_SENSORS = "sensors/+/dht11"  # Wildcards pour tous les capteurs
 
+        pool = PartitionedWorkerPool(
+            self.process_reading,
+            workers=options["workers"],
+            queue_depth=options["queue_depth"],
+            name="mqtt-worker",
+        )
+        pool.start()
+        self.stdout.write(f"🧵 {options['workers']} worker(s), file max {options['queue_depth']} par worker")
+
+        stop_stats = threading.Event()
+        if options["stats_interval"] > 0:
+            threading.Thread(
+                target=self.report_stats,
+                args=(pool, options["stats_interval"], stop_stats),
+                daemon=True
+            ).start()
+
         def on_connect(client, userdata, flags, rc):
             if rc == 0:
                 self.stdout.write(self.style.SUCCESS("✅ MQTT connecté au broker"))
@@ -24,88 +101,20 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.ERROR(f"❌ Connexion échouée, code: {rc}"))
 
         def on_message(client, userdata, msg):
+            # Décodage uniquement : le traitement (DB, alertes, escalade) est fait par les workers
             try:
                 topic = msg.topic
                 payload = msg.payload.decode('utf-8')
                 data = json.loads(payload)
 
-                temperature = data.get('temperature')
-                humidity = data.get('humidity')
-
-                # Sauvegarder dans Dht11 (table existante)
-                Dht11.objects.create(
-                    temperature=temperature,
-                    humidity=humidity
-                )
-
-                # --- NOUVEAU: Sauvegarder dans Measurement (pour le Frontend React) ---
-                try:
-                    # Extraction ID capteur depuis topic: "sensors/esp8266-001/dht11"
-                    # On cherche un chiffre, sinon par défaut 1
-                    import re
-                    match = re.search(r'(\d+)', topic)
-                    sensor_id = int(match.group(1)) if match else 1
-
-                    # Récupérer le capteur
-                    sensor_obj = Sensor.objects.filter(sensor_id=sensor_id).first()
-                    
-                    if sensor_obj:
-                        Measurement.objects.create(
-                            sensor=sensor_obj,
-                            temperature=temperature,
-                            humidity=humidity,
-                            status="OK"
-                        )
-                        # --- VERIFICATION ALERTE ---
-                        m = Measurement.objects.filter(sensor=sensor_obj).last()
-
-                        # 1. Loguer la réception (comme le fait le Serializer)
-                        AuditLog.objects.create(
-                            action="MEASUREMENT_RECEIVED",
-                            sensor=sensor_obj,
-                            details=f"Temp={temperature}, Hum={humidity}"
-                        )
-
-                        if temperature < sensor_obj.min_temp or temperature > sensor_obj.max_temp:
-                            self.stdout.write(self.style.WARNING(f"🔥 Alerte détectée sur {sensor_id}: {temperature}°C"))
-                            m.status = "ALERT"
-                            m.save()
-                            
-                            # Accusés de réception
-                            for level in ["USER", "MANAGER", "SUPERVISOR"]:
-                                IncidentAcknowledgement.objects.get_or_create(
-                                    measurement=m,
-                                    level=level
-                                )
-
-                            # Log Audit Alerte
-                            AuditLog.objects.create(
-                                action="ALERT_TRIGGERED",
-                                sensor=sensor_obj,
-                                details=f"Temp={temperature} dépasse [{sensor_obj.min_temp} - {sensor_obj.max_temp}]"
-                            )
-
-                            # Escalade (Mail/Telegram)
-                            escalation_process(sensor_obj, m)
-                            
-                        else:
-                            if sensor_obj.alert_count > 0:
-                                sensor_obj.alert_count = 0
-                                sensor_obj.save()
-                                self.stdout.write(self.style.SUCCESS(f"✅ Retour à la normale pour {sensor_id}"))
-
-                        self.stdout.write(self.style.SUCCESS(f"✅ Saved to Measurement (Sensor {sensor_id})"))
-                    else:
-                        self.stdout.write(self.style.WARNING(f"⚠️ Capteur ID {sensor_id} non trouvé en base. Créez-le dans l'admin."))
-
-                except Exception as db_err:
-                    self.stdout.write(self.style.ERROR(f"❌ Erreur DB Measurement: {db_err}"))
-
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"📊 Données reçues: {temperature}°C / {humidity}% | Topic: {topic}"
-                    )
-                )
+                # Extraction ID capteur depuis topic: "sensors/esp8266-001/dht11"
+                # On cherche un chiffre, sinon par défaut 1
+                match = re.search(r'(\d+)', topic)
+                sensor_id = int(match.group(1)) if match else 1
+
+                item = (topic, sensor_id, data.get('temperature'), data.get('humidity'))
+                if not pool.submit(sensor_id, item):
+                    self.stdout.write(self.style.ERROR(f"❌ File pleine, mesure perdue (Sensor {sensor_id})"))
 
             except json.JSONDecodeError:
                 self.stdout.write(self.style.ERROR(f"❌ JSON invalide: {msg.payload}"))
@@ -132,3 +141,9 @@ class Command(BaseCommand):
             client.disconnect()
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"❌ Erreur de connexion: {str(e)}"))
+        finally:
+            stop_stats.set()
+            self.stdout.write("⏳ Traitement des mesures en file...")
+            pool.stop()
+            # Dernier état des détecteurs d'anomalies, repris au prochain démarrage
+            anomaly_engine.checkpoint(force=True)
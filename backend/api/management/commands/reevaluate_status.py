@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Sensor
+from api.reevaluate import reevaluate_sensor
+
+
+class Command(BaseCommand):
+    help = "Recalcule le statut OK/ALERT de l'historique des mesures avec les règles actuelles des capteurs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sensor", type=int, action="append", help="sensor_id à traiter (répétable, tous par défaut)")
+        parser.add_argument("--chunk-size", type=int, default=50000, help="Mesures chargées par paquet")
+
+    def handle(self, *args, **options):
+        sensors = Sensor.objects.order_by("sensor_id")
+        if options["sensor"]:
+            sensors = sensors.filter(sensor_id__in=options["sensor"])
+
+        for sensor in sensors:
+            started = time.monotonic()
+            seen, changed = reevaluate_sensor(sensor, chunk_size=options["chunk_size"])
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Capteur {sensor.sensor_id} : {changed} statut(s) modifié(s) sur {seen} mesure(s) "
+                f"en {time.monotonic() - started:.1f}s"
+            ))
@@ -0,0 +1,52 @@
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import Measurement
+from api.partitions import next_month, partitions, seal_month, supported
+
+
+def parse_month(value):
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise CommandError(f"Mois invalide : {value} (format AAAA-MM attendu)")
+
+
+class Command(BaseCommand):
+    help = "Déplace les mesures des mois révolus vers leurs partitions mensuelles (SQLite)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--month", action="append", type=parse_month, help="Mois à sceller, AAAA-MM (répétable)")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Mesures déplacées par transaction")
+
+    def handle(self, *args, **options):
+        if not supported():
+            raise CommandError("Partitionnement disponible uniquement avec SQLite")
+
+        months = options["month"]
+        if not months:
+            # Par défaut : tous les mois plus anciens que les PARTITION_HOT_MONTHS derniers
+            today = timezone.localdate()
+            limit = date(today.year, today.month, 1)
+            for _ in range(settings.PARTITION_HOT_MONTHS):
+                limit = date(limit.year - (limit.month == 1), (limit.month - 2) % 12 + 1, 1)
+            oldest = Measurement.objects.order_by("timestamp").values_list("timestamp", flat=True).first()
+            months = []
+            if oldest:
+                oldest = timezone.localtime(oldest).date()
+                month = date(oldest.year, oldest.month, 1)
+                while month < limit:
+                    months.append(month)
+                    month = next_month(month)
+
+        for month in months:
+            try:
+                moved = seal_month(month, batch_size=options["batch_size"])
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f"✅ {month:%Y-%m} : {moved} mesure(s) déplacée(s)"))
+
+        self.stdout.write(f"📦 Partitions : {', '.join(f'{m:%Y-%m}' for m, _ in partitions()) or 'aucune'}")
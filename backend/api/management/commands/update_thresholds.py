@@ -1,9 +1,26 @@
 from django.core.management.base import BaseCommand
+from django.db.models import F
 from api.models import Sensor
+from api.registry import registry
+from api.reevaluate import reevaluate_sensor
 
 class Command(BaseCommand):
     help = 'Updates all sensors to the new default thresholds (15-25°C)'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reevaluate", action="store_true",
+            help="Recalculer aussi le statut de l'historique des mesures (voir reevaluate_status)"
+        )
+
     def handle(self, *args, **options):
-        count = Sensor.objects.update(min_temp=15.0, max_temp=25.0)
+        count = Sensor.objects.update(min_temp=15.0, max_temp=25.0, generation=F("generation") + 1)
+        # update() ne déclenche pas post_save ; les autres processus
+        # se resynchronisent au plus tard après SENSOR_REGISTRY_TTL
+        registry.invalidate()
         self.stdout.write(self.style.SUCCESS(f'Successfully updated {count} sensors to Min: 15°C, Max: 25°C'))
+
+        if options["reevaluate"]:
+            for sensor in Sensor.objects.order_by("sensor_id"):
+                seen, changed = reevaluate_sensor(sensor)
+                self.stdout.write(f"🔁 Capteur {sensor.sensor_id} : {changed}/{seen} statut(s) modifié(s)")
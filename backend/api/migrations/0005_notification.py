@@ -0,0 +1,46 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_ledstate'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sensor',
+            name='max_temp',
+            field=models.FloatField(default=25),
+        ),
+        migrations.AlterField(
+            model_name='sensor',
+            name='min_temp',
+            field=models.FloatField(default=15),
+        ),
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('channel', models.CharField(choices=[('EMAIL', 'Email'), ('TELEGRAM', 'Telegram'), ('TWILIO', 'Twilio')], max_length=20)),
+                ('recipient', models.CharField(blank=True, max_length=255)),
+                ('subject', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField()),
+                ('level', models.CharField(blank=True, max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('SENT', 'Sent'), ('FAILED', 'Failed')], default='PENDING', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('sensor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='api.sensor')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='api_notific_status_b83244_idx')],
+            },
+        ),
+    ]
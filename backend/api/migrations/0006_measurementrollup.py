@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MeasurementRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('alert_count', models.PositiveIntegerField(default=0)),
+                ('temperature_min', models.FloatField()),
+                ('temperature_max', models.FloatField()),
+                ('temperature_sum', models.FloatField(default=0)),
+                ('humidity_min', models.FloatField()),
+                ('humidity_max', models.FloatField()),
+                ('humidity_sum', models.FloatField(default=0)),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.sensor')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('sensor', 'resolution', 'bucket'), name='unique_rollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_measurementrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['sensor', 'timestamp', 'id'], name='measurement_sensor_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='measurement',
+            index=models.Index(fields=['timestamp', 'id'], name='measurement_ts_idx'),
+        ),
+    ]
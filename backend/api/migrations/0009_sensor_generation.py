@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensor',
+            name='generation',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
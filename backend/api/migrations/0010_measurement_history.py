@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_sensor_generation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MeasurementHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('temperature', models.FloatField(default=0)),
+                ('humidity', models.FloatField(default=0)),
+                ('timestamp', models.DateTimeField(auto_now_add=True)),
+                ('status', models.CharField(choices=[('OK', 'OK'), ('ALERT', 'ALERT')], default='OK', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'api_measurement_history',
+                'ordering': ['-timestamp'],
+                'abstract': False,
+                'managed': False,
+            },
+        ),
+        migrations.RunSQL(
+            # La vue est créée par le signal post_migrate (api/partitions.py) avec les
+            # colonnes actuelles de Measurement, et supprimée avant chaque migrate
+            sql=migrations.RunSQL.noop,
+            reverse_sql="DROP VIEW IF EXISTS api_measurement_history",
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_states(apps, schema_editor):
+    # Capteurs déjà en alerte : reprise du compteur existant
+    Sensor = apps.get_model("api", "Sensor")
+    SensorEscalationState = apps.get_model("api", "SensorEscalationState")
+    SensorEscalationState.objects.bulk_create([
+        SensorEscalationState(
+            sensor_id=pk,
+            alert_count=count,
+            level="SUPERVISOR" if count > 6 else "MANAGER" if count > 3 else "USER",
+        )
+        for pk, count in Sensor.objects.filter(alert_count__gt=0).values_list("pk", "alert_count")
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_measurement_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorEscalationState',
+            fields=[
+                ('sensor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='escalation', serialize=False, to='api.sensor')),
+                ('alert_count', models.PositiveIntegerField(default=0)),
+                ('level', models.CharField(choices=[('NONE', 'None'), ('USER', 'User'), ('MANAGER', 'Manager'), ('SUPERVISOR', 'Supervisor')], default='NONE', max_length=20)),
+                ('level_reached_at', models.DateTimeField(blank=True, null=True)),
+                ('last_alert_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(seed_states, migrations.RunPython.noop),
+    ]
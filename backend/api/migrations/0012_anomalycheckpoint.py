@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_sensorescalationstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnomalyCheckpoint',
+            fields=[
+                ('sensor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='anomaly_checkpoint', serialize=False, to='api.sensor')),
+                ('state', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_anomalycheckpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('temperature', 'Température (°C)'), ('humidity', 'Humidité (%)'), ('rate', 'Variation de température (°C/min)')], default='temperature', max_length=20)),
+                ('operator', models.CharField(choices=[('gt', 'Au-dessus'), ('lt', 'En dessous')], default='gt', max_length=2)),
+                ('threshold', models.FloatField()),
+                ('hysteresis', models.FloatField(default=0)),
+                ('duration', models.PositiveIntegerField(default=0)),
+                ('active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='api.sensor')),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 18:39
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_alertrule'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ticket',
+            name='ticket_open_sensor_idx',
+        ),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models import F, Value, Window
+from django.db.models.functions import Lag
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 
 class Dht11(models.Model):
@@ -29,30 +32,208 @@ class Sensor(models.Model):
     alert_count = models.IntegerField(default=0)
     min_temp = models.FloatField(default=15)
     max_temp = models.FloatField(default=25)
+    # Incrémenté à chaque mesure reçue et à chaque modification : sert de validateur ETag
+    generation = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return f"{self.name} (#{self.sensor_id})"
 
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            return super().save(*args, **kwargs)
 
-class Measurement(models.Model):
+        # Incrément atomique : une ingestion concurrente ne peut pas être écrasée
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "generation"}
+        self.generation = F("generation") + 1
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=["generation"])
+
+
+class MeasurementQuerySet(models.QuerySet):
+
+    def collapse_alert_runs(self):
+        """
+        Garde les mesures OK et seulement la première ALERT de chaque série d'alertes consécutives.
+        Calculé en SQL (LAG sur le statut précédent du même capteur) : le queryset reste paresseux
+        et les filtres/tri/pagination ajoutés ensuite ne changent pas la détection des séries.
+        """
+        runs = self.order_by().annotate(
+            prev_status=Window(
+                Lag("status", default=Value("OK")),
+                partition_by=F("sensor_id"),
+                order_by=[F("timestamp").asc(), F("id").asc()],
+            )
+        ).exclude(status="ALERT", prev_status="ALERT")
+        return self.filter(pk__in=runs.values("pk"))
+
+
+class MeasurementBase(models.Model):
+    """Colonnes communes à la table active et aux partitions mensuelles."""
     STATUS_CHOICES = [
         ("OK", "OK"),
         ("ALERT", "ALERT"),
     ]
 
-    sensor = models.ForeignKey("Sensor", on_delete=models.CASCADE, related_name="measurements")
     temperature = models.FloatField(default=0)
     humidity = models.FloatField(default=0)
     timestamp = models.DateTimeField(auto_now_add=True)  # <-- auto_now_add
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="OK")
     created_at = models.DateTimeField(auto_now_add=True)  # <-- auto_now_add
 
+    objects = MeasurementQuerySet.as_manager()
+
     class Meta:
+        abstract = True
         ordering = ["-timestamp"]
 
     def __str__(self):
         return f"Sensor {self.sensor.sensor_id}: {self.temperature}°C / {self.humidity}%"
 
+
+class Measurement(MeasurementBase):
+    sensor = models.ForeignKey("Sensor", on_delete=models.CASCADE, related_name="measurements")
+
+    class Meta(MeasurementBase.Meta):
+        indexes = [
+            # Historique d'un capteur et pagination par curseur (timestamp, id)
+            models.Index(fields=["sensor", "timestamp", "id"], name="measurement_sensor_ts_idx"),
+            models.Index(fields=["timestamp", "id"], name="measurement_ts_idx"),
+        ]
+
+
+class MeasurementHistory(MeasurementBase):
+    """
+    Lecture seule : vue UNION ALL de la table active et des partitions mensuelles
+    (api_measurement_AAAAMM), maintenue par api/partitions.py.
+    """
+    sensor = models.ForeignKey("Sensor", on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+
+    class Meta(MeasurementBase.Meta):
+        managed = False
+        db_table = "api_measurement_history"
+
+
+class MeasurementRollup(models.Model):
+    """
+    Agrégats par capteur et par intervalle (minute / heure / jour),
+    maintenus incrémentalement par la commande compact_rollups.
+    """
+    RESOLUTION_CHOICES = [
+        ("minute", "Minute"),
+        ("hour", "Hour"),
+        ("day", "Day"),
+    ]
+
+    sensor = models.ForeignKey("Sensor", on_delete=models.CASCADE, related_name="rollups")
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    bucket = models.DateTimeField()  # début de l'intervalle (UTC)
+
+    count = models.PositiveIntegerField(default=0)
+    alert_count = models.PositiveIntegerField(default=0)
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    temperature_sum = models.FloatField(default=0)
+    humidity_min = models.FloatField()
+    humidity_max = models.FloatField()
+    humidity_sum = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["sensor", "resolution", "bucket"], name="unique_rollup_bucket"),
+        ]
+
+    @property
+    def temperature_avg(self):
+        return self.temperature_sum / self.count if self.count else None
+
+    @property
+    def humidity_avg(self):
+        return self.humidity_sum / self.count if self.count else None
+
+    def __str__(self):
+        return f"Sensor {self.sensor_id} {self.resolution} {self.bucket}: {self.count} mesure(s)"
+
+
+class RollupWatermark(models.Model):
+    """
+    Dernière mesure (id) déjà intégrée dans les agrégats.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
+
+
+class SensorEscalationState(models.Model):
+    """
+    État d'escalade d'un capteur (compteur d'alertes consécutives, niveau atteint et quand).
+    Modifié uniquement par des UPDATE atomiques / conditionnels (api/escalation.py).
+    """
+    LEVEL_CHOICES = [
+        ("NONE", "None"),
+        ("USER", "User"),
+        ("MANAGER", "Manager"),
+        ("SUPERVISOR", "Supervisor"),
+    ]
+
+    sensor = models.OneToOneField("Sensor", on_delete=models.CASCADE, primary_key=True, related_name="escalation")
+    alert_count = models.PositiveIntegerField(default=0)
+    level = models.CharField(max_length=20, choices=LEVEL_CHOICES, default="NONE")
+    level_reached_at = models.DateTimeField(null=True, blank=True)
+    last_alert_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Sensor {self.sensor_id}: {self.level} ({self.alert_count} alerte(s))"
+
+
+class AlertRule(models.Model):
+    """
+    Règle d'alerte déclarative d'un capteur, compilée par api/rules.py.
+    Sans règle de seuil sur la température, min_temp / max_temp du capteur s'appliquent.
+    """
+    METRIC_CHOICES = [
+        ("temperature", "Température (°C)"),
+        ("humidity", "Humidité (%)"),
+        ("rate", "Variation de température (°C/min)"),
+    ]
+    OPERATOR_CHOICES = [
+        ("gt", "Au-dessus"),
+        ("lt", "En dessous"),
+    ]
+
+    sensor = models.ForeignKey("Sensor", on_delete=models.CASCADE, related_name="alert_rules")
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES, default="temperature")
+    operator = models.CharField(max_length=2, choices=OPERATOR_CHOICES, default="gt")
+    threshold = models.FloatField()
+    # Bande de retour à la normale : l'alerte ne cesse qu'une fois le seuil franchi de cette marge
+    hysteresis = models.FloatField(default=0)
+    # La condition doit tenir au moins `duration` secondes avant de déclencher l'alerte
+    duration = models.PositiveIntegerField(default=0)
+    active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        sign = ">" if self.operator == "gt" else "<"
+        return f"Sensor {self.sensor_id}: {self.metric} {sign} {self.threshold}"
+
+
+class AnomalyCheckpoint(models.Model):
+    """
+    Sauvegarde périodique de l'état du détecteur d'anomalies d'un capteur (api/anomaly.py) :
+    un redémarrage reprend les statistiques sans relire l'historique.
+    """
+    sensor = models.OneToOneField("Sensor", on_delete=models.CASCADE, primary_key=True, related_name="anomaly_checkpoint")
+    state = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Sensor {self.sensor_id}: checkpoint {self.updated_at}"
+
+
 class LedState(models.Model):
     """
     Stocke l'état de la LED (ON/OFF) pour le polling par le Bridge
@@ -99,10 +280,55 @@ class AuditLog(models.Model):
     details = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Journal affiché et exporté du plus récent au plus ancien
+            models.Index(fields=["created_at"], name="auditlog_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.action} - {self.created_at}"
 
 
+class Notification(models.Model):
+    """
+    Outbox des notifications d'alerte : écrite dans la même transaction que l'alerte,
+    envoyée ensuite par la commande dispatch_notifications (avec reprises).
+    """
+    CHANNEL_CHOICES = [
+        ("EMAIL", "Email"),
+        ("TELEGRAM", "Telegram"),
+        ("TWILIO", "Twilio"),
+    ]
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("SENT", "Sent"),
+        ("FAILED", "Failed"),
+    ]
+
+    channel = models.CharField(max_length=20, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=255, blank=True)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField()
+    level = models.CharField(max_length=20, blank=True)
+    sensor = models.ForeignKey("Sensor", on_delete=models.SET_NULL, null=True, blank=True)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.channel} -> {self.recipient or '-'} ({self.status})"
+
+
 class Profile(models.Model):
     ROLE_CHOICES = [
         ("user", "User"),
@@ -144,3 +370,10 @@ class Ticket(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
     closed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Sert aussi "un ticket est-il déjà ouvert pour ce capteur ?" à chaque alerte
+            models.Index(fields=["sensor", "status"], name="ticket_sensor_status_idx"),
+            models.Index(fields=["created_at"], name="ticket_created_idx"),
+        ]
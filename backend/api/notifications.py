@@ -0,0 +1,158 @@
+"""
+Outbox des notifications : mise en file dans la transaction de l'alerte,
+envoi asynchrone par dispatch_pending() (commande dispatch_notifications).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils import timezone
+
+from .audit import create_audit
+from .models import Notification
+from .utils import alert_email_content, alert_telegram_text, alert_twiml
+
+
+def enqueue_alert(user, sensor, measurement, level, message):
+    """
+    Crée les notifications d'une alerte (email + Telegram, appel Twilio au niveau SUPERVISOR).
+    Aucun appel réseau ici : seulement un INSERT groupé dans l'outbox.
+    """
+    subject, email_body = alert_email_content(sensor, measurement, message)
+    notifications = [
+        Notification(channel="EMAIL", recipient=user.email, subject=subject,
+                     body=email_body, level=level, sensor=sensor),
+        Notification(channel="TELEGRAM", recipient=user.email,
+                     body=alert_telegram_text(user, sensor, measurement, message), level=level, sensor=sensor),
+    ]
+    if level == "SUPERVISOR":
+        notifications.append(
+            Notification(channel="TWILIO", body=alert_twiml(sensor, measurement), level=level, sensor=sensor)
+        )
+    return Notification.objects.bulk_create(notifications)
+
+
+# --- Transports (lèvent une exception en cas d'échec) ---
+
+def deliver_email(notification):
+    send_mail(
+        notification.subject,
+        notification.body,
+        settings.DEFAULT_FROM_EMAIL,
+        [notification.recipient],
+        fail_silently=False,
+    )
+
+
+def deliver_telegram(notification):
+    url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+    payload = {"chat_id": settings.TELEGRAM_CHAT_ID, "text": notification.body, "parse_mode": "Markdown"}
+    response = requests.post(url, data=payload, timeout=10)
+    response.raise_for_status()
+
+
+def deliver_twilio(notification):
+    account_sid = getattr(settings, 'TWILIO_ACCOUNT_SID', None)
+    if not account_sid or "CHANGE_ME" in account_sid:
+        raise RuntimeError("Twilio non configuré (SID manquant)")
+
+    from twilio.rest import Client
+    client = Client(account_sid, settings.TWILIO_AUTH_TOKEN)
+    client.calls.create(
+        twiml=notification.body,
+        to=notification.recipient or settings.TARGET_PHONE_NUMBER,
+        from_=settings.TWILIO_PHONE_NUMBER,
+    )
+
+
+TRANSPORTS = {
+    "EMAIL": deliver_email,
+    "TELEGRAM": deliver_telegram,
+    "TWILIO": deliver_twilio,
+}
+
+SENT_AUDIT = {
+    "EMAIL": ("EMAIL_SENT", lambda n: f"Alerte envoyée à {n.recipient} (niveau {n.level})"),
+    "TELEGRAM": ("TELEGRAM_SENT", lambda n: "Telegram alert sent"),
+    "TWILIO": ("Twilio_SENT", lambda n: f"Voice call sent to {n.recipient or settings.TARGET_PHONE_NUMBER}"),
+}
+
+
+def backoff_delay(attempts):
+    """Délai avant la prochaine tentative : base * 2^(tentatives-1), plafonné."""
+    base = getattr(settings, "NOTIFICATION_BACKOFF_BASE", 30)
+    cap = getattr(settings, "NOTIFICATION_BACKOFF_MAX", 3600)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), cap))
+
+
+def claim_due(batch_size, lease):
+    """
+    Réserve jusqu'à `batch_size` notifications échues.
+    La réservation repousse next_attempt_at de `lease` par un UPDATE conditionnel :
+    deux dispatchers ne peuvent pas prendre la même ligne.
+    """
+    now = timezone.now()
+    candidates = Notification.objects.filter(
+        status="PENDING", next_attempt_at__lte=now
+    ).order_by("next_attempt_at", "id").values_list("id", "next_attempt_at")[:batch_size]
+
+    claimed = []
+    for pk, due in candidates:
+        if Notification.objects.filter(pk=pk, status="PENDING", next_attempt_at=due).update(
+            next_attempt_at=now + lease
+        ):
+            claimed.append(pk)
+    return list(Notification.objects.select_related("sensor").filter(pk__in=claimed).order_by("id"))
+
+
+def _send(transports, notification):
+    transport = transports.get(notification.channel)
+    if transport is None:
+        return f"Canal inconnu : {notification.channel}"
+    try:
+        transport(notification)
+    except Exception as e:
+        return str(e) or e.__class__.__name__
+    return None
+
+
+def dispatch_pending(transports=None, batch_size=50, max_workers=4, max_attempts=None):
+    """
+    Envoie un lot de notifications en parallèle (les transports sont des appels réseau)
+    puis enregistre les résultats. Retourne (envoyées, en échec).
+    """
+    transports = transports or TRANSPORTS
+    max_attempts = max_attempts or getattr(settings, "NOTIFICATION_MAX_ATTEMPTS", 5)
+
+    notifications = claim_due(batch_size, lease=timedelta(minutes=5))
+    if not notifications:
+        return 0, 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        errors = list(executor.map(lambda n: _send(transports, n), notifications))
+
+    sent = failed = 0
+    now = timezone.now()
+    for notification, error in zip(notifications, errors):
+        notification.attempts += 1
+        if error is None:
+            notification.status = "SENT"
+            notification.sent_at = now
+            notification.last_error = ""
+            action, details = SENT_AUDIT[notification.channel]
+            create_audit(action, sensor=notification.sensor, details=details(notification))
+            sent += 1
+        else:
+            notification.last_error = error
+            if notification.attempts >= max_attempts:
+                notification.status = "FAILED"
+            else:
+                notification.next_attempt_at = now + backoff_delay(notification.attempts)
+            failed += 1
+
+    Notification.objects.bulk_update(
+        notifications, ["status", "attempts", "sent_at", "last_error", "next_attempt_at"]
+    )
+    return sent, failed
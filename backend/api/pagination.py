@@ -0,0 +1,123 @@
+"""
+Pagination par curseur (keyset) sur (timestamp, id).
+
+Chaque page est une recherche dans l'index (sensor, timestamp, id) à partir de la
+dernière ligne renvoyée : son coût ne dépend ni de la taille de la table ni de la page.
+"""
+import base64
+import binascii
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(timestamp, pk, reverse=False):
+    raw = f"{'p' if reverse else 'n'}|{timestamp.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Retourne (reverse, timestamp, id). Lève NotFound si le curseur est invalide."""
+    try:
+        direction, raw_timestamp, raw_pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        timestamp = parse_datetime(raw_timestamp)
+        pk = int(raw_pk)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise NotFound("Curseur invalide")
+    if timestamp is None or direction not in ("n", "p"):
+        raise NotFound("Curseur invalide")
+    return direction == "p", timestamp, pk
+
+
+def seek(queryset, timestamp, pk, reverse=False):
+    """
+    Lignes qui suivent (timestamp, id) dans l'ordre décroissant, ou qui le précèdent si reverse.
+    La borne sur timestamp seule sert l'index, la condition sur id départage les égalités.
+    """
+    if reverse:
+        return queryset.filter(timestamp__gte=timestamp).filter(
+            Q(timestamp__gt=timestamp) | Q(id__gt=pk)
+        ).order_by("timestamp", "id")
+    return queryset.filter(timestamp__lte=timestamp).filter(
+        Q(timestamp__lt=timestamp) | Q(id__lt=pk)
+    ).order_by("-timestamp", "-id")
+
+
+class MeasurementCursorPagination(BasePagination):
+    """Pages de mesures, des plus récentes aux plus anciennes (?cursor=...&limit=...)."""
+
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+    max_limit = 1000
+
+    def __init__(self, page_size=None, position=None):
+        self.page_size = page_size or settings.REST_FRAMEWORK.get("PAGE_SIZE", 20)
+        # (timestamp, id) d'une ligne ; à fournir pour un queryset values_list()
+        self.position = position or (lambda row: (row.timestamp, row.pk))
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(limit, max(self.max_limit, self.page_size)))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_limit(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+
+        reverse = False
+        if cursor:
+            reverse, timestamp, pk = decode_cursor(cursor)
+            queryset = seek(queryset, timestamp, pk, reverse)
+        else:
+            queryset = queryset.order_by("-timestamp", "-id")
+
+        # Une ligne de plus pour savoir s'il reste une page dans ce sens
+        rows = list(queryset[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if reverse:
+            rows.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                self.next_cursor = encode_cursor(*self.position(rows[-1]))
+            if (has_more and reverse) or (cursor and not reverse):
+                self.previous_cursor = encode_cursor(*self.position(rows[0]), reverse=True)
+        return rows
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._link(self.next_cursor)
+
+    def get_previous_link(self):
+        return self._link(self.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
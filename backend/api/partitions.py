@@ -0,0 +1,260 @@
+"""
+Partitions mensuelles des mesures (SQLite).
+
+api_measurement reste la table active : l'ingestion y écrit toujours.
+seal_month() déplace les mesures d'un mois révolu vers api_measurement_AAAAMM (même
+structure et mêmes index, DDL recopié depuis sqlite_master) ; drop_partition() supprime
+un mois entier par un simple DROP TABLE ; archive_table("measurement") le fait pour les
+mois entièrement sortis de la rétention.
+La vue api_measurement_history (modèle MeasurementHistory) réunit la table active et les
+partitions ; measurement_source() ne lit que la table active quand la plage demandée
+commence après le dernier mois scellé.
+"""
+from datetime import date, datetime, time, timezone as dt_timezone
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Measurement, MeasurementHistory, RollupWatermark, Sensor
+from .rollups import WATERMARK
+
+HOT_TABLE = Measurement._meta.db_table
+VIEW = MeasurementHistory._meta.db_table
+
+
+def supported():
+    return connection.vendor == "sqlite"
+
+
+def quote(name):
+    return connection.ops.quote_name(name)
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def month_bounds(month):
+    """[début, fin[ du mois en datetimes conscients du fuseau."""
+    tz = timezone.get_current_timezone()
+    return (
+        datetime.combine(month, time.min, tzinfo=tz),
+        datetime.combine(next_month(month), time.min, tzinfo=tz),
+    )
+
+
+def partition_table(month):
+    return f"{HOT_TABLE}_{month:%Y%m}"
+
+
+def partitions(using=DEFAULT_DB_ALIAS):
+    """Mois scellés, du plus ancien au plus récent : [(1er du mois, nom de table)]."""
+    if connections[using].vendor != "sqlite":
+        return []
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB %s",
+            [f"{HOT_TABLE}_[0-9][0-9][0-9][0-9][0-9][0-9]"],
+        )
+        names = sorted(row[0] for row in cursor.fetchall())
+    return [(date(int(name[-6:-2]), int(name[-2:]), 1), name) for name in names]
+
+
+def measurement_source(start=None):
+    """
+    Queryset de lecture pour une plage commençant à `start` : la table active seule si
+    aucune mesure antérieure à `start` n'a pu être déplacée, sinon la vue complète.
+    """
+    sealed = partitions()
+    if not sealed:
+        return Measurement.objects.all()
+    boundary = month_bounds(sealed[-1][0])[1]
+    if start is not None and start >= boundary:
+        return Measurement.objects.all()
+    return MeasurementHistory.objects.all()
+
+
+def drop_view(using=DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DROP VIEW IF EXISTS {quote(VIEW)}")
+
+
+def rebuild_view(exclude=(), using=DEFAULT_DB_ALIAS):
+    """
+    (Re)crée la vue à partir des champs actuels de Measurement. Une partition scellée
+    avant l'ajout d'une colonne la renvoie à NULL.
+    """
+    conn = connections[using]
+    fields = [f.column for f in Measurement._meta.concrete_fields]
+    tables = [HOT_TABLE] + [table for _, table in partitions(using) if table not in exclude]
+    with conn.cursor() as cursor:
+        selects = []
+        for table in tables:
+            present = {col.name for col in conn.introspection.get_table_description(cursor, table)}
+            columns = ", ".join(
+                quote(column) if column in present else f"NULL AS {quote(column)}" for column in fields
+            )
+            selects.append(f"SELECT {columns} FROM {quote(table)}")
+        cursor.execute(f"DROP VIEW IF EXISTS {quote(VIEW)}")
+        cursor.execute(f"CREATE VIEW {quote(VIEW)} AS " + " UNION ALL ".join(selects))
+
+
+def drop_view_before_migrate(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    # Une vue qui lit api_measurement empêche SQLite de reconstruire la table (AlterField...)
+    drop_view(using)
+
+
+def rebuild_view_after_migrate(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    with connections[using].cursor() as cursor:
+        if HOT_TABLE in connections[using].introspection.table_names(cursor):
+            rebuild_view(using=using)
+
+
+def create_partition(month):
+    """Crée la table du mois (et ses index) à l'identique de la table active."""
+    table = partition_table(month)
+    suffix = f"{month:%Y%m}"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT type, name, sql FROM sqlite_master WHERE tbl_name = %s AND sql IS NOT NULL "
+            "ORDER BY type = 'index'",
+            [HOT_TABLE],
+        )
+        for kind, name, sql in cursor.fetchall():
+            if kind == "table":
+                sql = sql.replace(f"CREATE TABLE {quote(HOT_TABLE)}", f"CREATE TABLE IF NOT EXISTS {quote(table)}", 1)
+            else:
+                sql = sql.replace(f"CREATE INDEX {quote(name)}", f"CREATE INDEX IF NOT EXISTS {quote(f'{name}_{suffix}')}", 1)
+                sql = sql.replace(f" ON {quote(HOT_TABLE)}", f" ON {quote(table)}", 1)
+            cursor.execute(sql)
+    return table
+
+
+def seal_month(month, batch_size=5000):
+    """
+    Déplace par lots les mesures du mois vers sa partition. Seules les mesures déjà
+    intégrées aux agrégats (watermark) et sans accusé de réception sont déplacées.
+    Retourne le nombre de mesures déplacées (aucune table créée s'il n'y en a pas).
+    """
+    if not supported():
+        raise RuntimeError("Partitionnement disponible uniquement avec SQLite")
+    start, end = month_bounds(month)
+    if end > timezone.now():
+        raise ValueError(f"Le mois {month:%Y-%m} n'est pas terminé")
+
+    watermark = RollupWatermark.objects.filter(name=WATERMARK).values_list("last_id", flat=True).first() or 0
+    candidates = Measurement.objects.filter(
+        timestamp__gte=start, timestamp__lt=end, id__lte=watermark, acknowledgements__isnull=True
+    ).order_by("id")
+    if not candidates.exists():
+        return 0
+
+    with transaction.atomic():
+        table = create_partition(month)
+        rebuild_view()
+    columns = ", ".join(quote(f.column) for f in Measurement._meta.concrete_fields)
+
+    moved = 0
+    while True:
+        ids = list(candidates.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            break
+        placeholders = ", ".join(["%s"] * len(ids))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {quote(table)} ({columns}) "
+                f"SELECT {columns} FROM {quote(HOT_TABLE)} WHERE id IN ({placeholders})",
+                ids,
+            )
+            cursor.execute(f"DELETE FROM {quote(HOT_TABLE)} WHERE id IN ({placeholders})", ids)
+        moved += len(ids)
+    return moved
+
+
+def partition_rows(table, batch_size=5000):
+    """Lignes d'une partition au format de l'archive des mesures (voir api/archive.py)."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT m.id, s.sensor_id, m.timestamp, m.temperature, m.humidity, m.status, m.created_at "
+            f"FROM {quote(table)} m LEFT JOIN {quote('api_sensor')} s ON s.id = m.sensor_id ORDER BY m.id"
+        )
+        while rows := cursor.fetchmany(batch_size):
+            yield [
+                (pk, sensor_id, as_datetime(ts), temperature, humidity, status, as_datetime(created))
+                for pk, sensor_id, ts, temperature, humidity, status, created in rows
+            ]
+
+
+def as_datetime(value):
+    # SQL brut : SQLite renvoie le texte stocké (UTC)
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    return value.replace(tzinfo=dt_timezone.utc) if timezone.is_naive(value) else value
+
+
+def expired(cutoff):
+    """Mois scellés entièrement antérieurs à `cutoff` (rétention de archive_table)."""
+    return [month for month, _ in partitions() if month_bounds(month)[1] <= cutoff]
+
+
+def row_count(month):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {quote(partition_table(month))}")
+        return cursor.fetchone()[0]
+
+
+def delete_sensor_rows(sensor_pk):
+    """
+    Mesures d'un capteur supprimé. La cascade de Django ne connaît pas les partitions :
+    sans cela, la clé étrangère recopiée dans leur DDL ferait échouer Sensor.delete().
+    """
+    with connection.cursor() as cursor:
+        for _, table in partitions():
+            cursor.execute(f"DELETE FROM {quote(table)} WHERE sensor_id = %s", [sensor_pk])
+
+
+def drop_partition(month, archive=False):
+    """Supprime la partition du mois (DROP TABLE), après l'avoir archivée si demandé."""
+    from .archive import ARCHIVES, write_batch
+
+    table = partition_table(month)
+    if table not in {name for _, name in partitions()}:
+        raise ValueError(f"Aucune partition pour {month:%Y-%m}")
+
+    count = 0
+    if archive:
+        for rows in partition_rows(table):
+            write_batch("measurement", ARCHIVES["measurement"], rows)
+            count += len(rows)
+
+    with transaction.atomic():
+        rebuild_view(exclude={table})
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT DISTINCT sensor_id FROM {quote(table)}")
+            sensor_pks = [row[0] for row in cursor.fetchall()]
+            cursor.execute(f"DROP TABLE {quote(table)}")
+        # Listes en cache (ETag) des capteurs concernés à rafraîchir, comme api/archive.py
+        Sensor.objects.filter(pk__in=sensor_pks).update(generation=F("generation") + 1)
+    return count
+
+
+def set_status(ids, status):
+    """
+    Met à jour le statut de mesures, où qu'elles soient (table active ou partitions).
+    Un UPDATE par table, chacun réduit à des accès par clé primaire.
+    """
+    if not ids:
+        return 0
+    updated = Measurement.objects.filter(id__in=ids).update(status=status)
+    if updated == len(ids):
+        return updated
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        for _, table in partitions():
+            cursor.execute(f"UPDATE {quote(table)} SET status = %s WHERE id IN ({placeholders})", [status, *ids])
+            updated += cursor.rowcount
+            if updated == len(ids):
+                break
+    return updated
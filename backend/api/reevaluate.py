@@ -0,0 +1,136 @@
+"""
+Réévaluation vectorisée du statut OK / ALERT de l'historique d'un capteur avec ses
+règles actuelles (seuils min/max ou AlertRule, api/rules.py).
+
+L'historique (table active + partitions) est lu par paquets en tableaux NumPy ; chaque
+règle est évaluée sur tout le paquet sans boucle Python, y compris l'hystérésis et la
+durée minimale (remplissage vers l'avant des déclenchements / retours à la normale).
+Seules les lignes dont le statut change sont écrites (un UPDATE par statut et par paquet),
+et les compteurs d'alertes des agrégats déjà calculés sont corrigés.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import latest
+from .models import MeasurementHistory, MeasurementRollup, RollupWatermark, Sensor
+from .partitions import set_status
+from .rollups import RESOLUTIONS, WATERMARK, bucket_start
+from .rules import MIN_RATE_INTERVAL, compile_rules
+
+UPDATE_BATCH = 5000  # ids par UPDATE (limite de paramètres SQLite)
+
+
+def ffill(values, mask, initial):
+    """Dernière valeur de `values` là où `mask` est vrai, `initial` avant la première."""
+    idx = np.where(mask, np.arange(len(mask)), -1)
+    np.maximum.accumulate(idx, out=idx)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], initial)
+
+
+def rule_alerts(rule, values, ts, carry):
+    """
+    Équivalent vectorisé de CompiledRule.step sur un paquet.
+    carry : {"firing": bool, "since": epoch|None} en sortie du paquet précédent.
+    """
+    with np.errstate(invalid="ignore"):  # NaN (vitesse inconnue) : ni déclenche ni rétablit
+        trips = rule.trips(values)
+        clears = rule.clears(values)
+
+    # Début de chaque série de mesures consécutives qui remplissent la condition
+    previous = np.concatenate(([carry["since"] is not None], trips[:-1]))
+    starts = trips & ~previous
+    initial_since = carry["since"] if carry["since"] is not None else np.nan
+    since = ffill(ts, starts, initial_since)
+    armed = trips & (ts - since >= rule.duration)
+
+    firing = ffill(armed.astype(float), armed | clears, float(carry["firing"])).astype(bool)
+
+    carry["firing"] = bool(firing[-1])
+    carry["since"] = float(since[-1]) if trips[-1] and not firing[-1] else None
+    return firing
+
+
+def rates(temperatures, ts, last):
+    """Variation (°C/min) depuis la mesure précédente, NaN si moins de MIN_RATE_INTERVAL."""
+    prev_t = np.concatenate(([last[0] if last else np.nan], temperatures[:-1]))
+    prev_ts = np.concatenate(([last[1] if last else np.nan], ts[:-1]))
+    dt = ts - prev_ts
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(dt >= MIN_RATE_INTERVAL, (temperatures - prev_t) / (dt / 60), np.nan)
+
+
+def adjust_rollups(sensor_pk, changed):
+    """Corrige alert_count des agrégats pour les mesures déjà intégrées : [(timestamp, +1|-1)]."""
+    for resolution in RESOLUTIONS:
+        deltas = {}
+        for timestamp, delta in changed:
+            bucket = bucket_start(timestamp, resolution)
+            deltas[bucket] = deltas.get(bucket, 0) + delta
+        rollups = list(MeasurementRollup.objects.filter(
+            sensor_id=sensor_pk, resolution=resolution, bucket__gte=min(deltas), bucket__lte=max(deltas)
+        ))
+        rollups = [r for r in rollups if deltas.get(r.bucket)]
+        for rollup in rollups:
+            rollup.alert_count = max(0, rollup.alert_count + deltas[rollup.bucket])
+        MeasurementRollup.objects.bulk_update(rollups, ["alert_count"])
+
+
+def reevaluate_sensor(sensor, chunk_size=50000):
+    """
+    Recalcule le statut de toutes les mesures du capteur. Retourne (mesures lues, statuts modifiés).
+    """
+    ruleset = compile_rules(sensor, sensor.alert_rules.all())
+    carries = {rule.key: {"firing": False, "since": None} for rule in ruleset.rules}
+    last = None
+    watermark = RollupWatermark.objects.filter(name=WATERMARK).values_list("last_id", flat=True).first() or 0
+    history = MeasurementHistory.objects.filter(sensor_id=sensor.pk).order_by("timestamp", "id")
+
+    seen = changed_total = 0
+    position = None
+    while True:
+        qs = history
+        if position:
+            qs = qs.filter(Q(timestamp__gt=position[0]) | Q(timestamp=position[0], id__gt=position[1]))
+        rows = list(qs.values_list("id", "timestamp", "temperature", "humidity", "status")[:chunk_size])
+        if not rows:
+            break
+        ids, timestamps, temperatures, humidities, statuses = zip(*rows)
+
+        ids = np.array(ids)
+        ts = np.fromiter((t.timestamp() for t in timestamps), dtype=float, count=len(rows))
+        values = {
+            "temperature": np.array(temperatures, dtype=float),
+            "humidity": np.array(humidities, dtype=float),
+        }
+        if ruleset.uses_rate:
+            values["rate"] = rates(values["temperature"], ts, last)
+
+        alert = np.zeros(len(rows), dtype=bool)
+        for rule in ruleset.rules:
+            alert |= rule_alerts(rule, values[rule.metric], ts, carries[rule.key])
+        was_alert = np.array(statuses) == "ALERT"
+        changed = np.flatnonzero(alert != was_alert)
+
+        if changed.size:
+            with transaction.atomic():
+                for status, selected in (("ALERT", alert[changed]), ("OK", ~alert[changed])):
+                    targets = ids[changed][selected].tolist()
+                    for start in range(0, len(targets), UPDATE_BATCH):
+                        set_status(targets[start:start + UPDATE_BATCH], status)
+                compacted = [
+                    (timestamps[i], 1 if alert[i] else -1) for i in changed if ids[i] <= watermark
+                ]
+                if compacted:
+                    adjust_rollups(sensor.pk, compacted)
+
+        seen += len(rows)
+        changed_total += int(changed.size)
+        position = (timestamps[-1], rows[-1][0])
+        last = (values["temperature"][-1], ts[-1])
+
+    if changed_total:
+        # Listes en cache (ETag) et dernière mesure à rafraîchir
+        Sensor.objects.filter(pk=sensor.pk).update(generation=F("generation") + 1)
+        latest.forget(sensor.sensor_id)
+    return seen, changed_total
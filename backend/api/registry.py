@@ -0,0 +1,146 @@
+"""
+Cache en mémoire de la configuration des capteurs (seuils, règles d'alerte compilées,
+responsable, chaîne d'escalade).
+
+Évite toute lecture en base sur le chemin d'ingestion en régime établi.
+Invalidé par les signaux post_save / post_delete (Sensor, AlertRule, Profile, User) dans ce
+processus ; le TTL (SENSOR_REGISTRY_TTL) borne la durée de vie d'une entrée modifiée
+par un autre processus (API web vs subscriber MQTT).
+"""
+import threading
+import time
+
+from django.conf import settings
+
+from .models import Sensor, Profile
+from .rules import compile_rules
+
+
+class SensorEntry:
+    """Configuration figée d'un capteur au moment du chargement."""
+
+    def __init__(self, sensor, chain, rules):
+        self.pk = sensor.pk
+        self.sensor_id = sensor.sensor_id
+        self.min_temp = sensor.min_temp
+        self.max_temp = sensor.max_temp
+        self.user_id = sensor.user_id
+        self.chain = chain  # {"USER": User|None, "MANAGER": User|None, "SUPERVISOR": User|None}
+        self.rules = rules  # RuleSet compilé (api/rules.py)
+        self.values = [getattr(sensor, f.attname) for f in Sensor._meta.concrete_fields]
+        self.loaded_at = time.monotonic()
+
+    def as_sensor(self):
+        """Instance Sensor reconstruite depuis le cache, sans requête."""
+        return Sensor.from_db("default", [f.attname for f in Sensor._meta.concrete_fields], self.values)
+
+
+def resolve_chain(sensor):
+    """
+    Chaîne d'escalade USER → MANAGER → SUPERVISOR du responsable du capteur, en une requête.
+    USER vaut None si le responsable n'a pas de profil (pas d'escalade).
+    """
+    return resolve_chains([sensor])[sensor.user_id]
+
+
+def resolve_chains(sensors):
+    """Chaînes d'escalade de plusieurs capteurs en une seule requête : {user_id: chaîne}."""
+    user_ids = {sensor.user_id for sensor in sensors if sensor.user_id}
+    profiles = {}
+    if user_ids:
+        profiles = {
+            profile.user_id: profile
+            for profile in Profile.objects.select_related("user", "manager__profile__manager").filter(user_id__in=user_ids)
+        }
+
+    chains = {}
+    for sensor in sensors:
+        chain = chains[sensor.user_id] = {"USER": None, "MANAGER": None, "SUPERVISOR": None}
+        profile = profiles.get(sensor.user_id)
+        if profile is None:
+            continue
+
+        chain["USER"] = profile.user
+        if profile.manager:
+            chain["MANAGER"] = profile.manager
+            manager_profile = getattr(profile.manager, "profile", None)
+            if manager_profile and manager_profile.manager:
+                chain["SUPERVISOR"] = manager_profile.manager
+
+    return chains
+
+
+class SensorRegistry:
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return getattr(settings, "SENSOR_REGISTRY_TTL", 300)
+
+    def get(self, sensor_id):
+        """
+        Entrée du capteur `sensor_id` (identifiant matériel), ou None s'il n'existe pas.
+        Ne touche la base qu'en cas d'absence ou d'expiration.
+        """
+        entry = self._entries.get(sensor_id)
+        if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+            return entry
+
+        sensor = Sensor.objects.select_related("user").prefetch_related("alert_rules").filter(sensor_id=sensor_id).first()
+        if sensor is None:
+            self.invalidate(sensor_id)
+            return None
+        return self.load(sensor)
+
+    def get_many(self, sensor_ids):
+        """
+        Entrées de plusieurs capteurs : {sensor_id: entrée}, sans les capteurs inexistants.
+        Les absents sont chargés ensemble (capteurs + règles, puis chaînes d'escalade),
+        quel que soit leur nombre.
+        """
+        now = time.monotonic()
+        entries, missing = {}, set()
+        for sensor_id in sensor_ids:
+            entry = self._entries.get(sensor_id)
+            if entry is not None and now - entry.loaded_at < self.ttl:
+                entries[sensor_id] = entry
+            else:
+                missing.add(sensor_id)
+        if not missing:
+            return entries
+
+        sensors = Sensor.objects.select_related("user").prefetch_related("alert_rules").filter(sensor_id__in=missing)
+        loaded = self.load_many(sensors)
+        for sensor_id in missing - loaded.keys():
+            self.invalidate(sensor_id)
+        entries.update(loaded)
+        return entries
+
+    def load(self, sensor):
+        """Met en cache un capteur déjà chargé (ex: après get_or_create)."""
+        return self.load_many([sensor])[sensor.sensor_id]
+
+    def load_many(self, sensors):
+        """Met en cache des capteurs déjà chargés (règles préchargées) : {sensor_id: entrée}."""
+        sensors = list(sensors)
+        chains = resolve_chains(sensors)
+        entries = {
+            sensor.sensor_id: SensorEntry(sensor, chains[sensor.user_id], compile_rules(sensor, sensor.alert_rules.all()))
+            for sensor in sensors
+        }
+        with self._lock:
+            self._entries.update(entries)
+        return entries
+
+    def invalidate(self, sensor_id=None):
+        with self._lock:
+            if sensor_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(sensor_id, None)
+
+
+registry = SensorRegistry()
@@ -0,0 +1,127 @@
+"""
+Agrégats minute / heure / jour des mesures (MeasurementRollup).
+
+compact() reprend depuis le watermark (dernier id intégré) et fusionne les nouvelles
+mesures dans les agrégats existants : chaque mesure n'est lue qu'une fois.
+"""
+from django.db import transaction
+
+from .models import Measurement, MeasurementRollup, RollupWatermark
+
+RESOLUTIONS = ["minute", "hour", "day"]
+WATERMARK = "measurement_rollups"
+
+
+def bucket_start(timestamp, resolution):
+    if resolution == "minute":
+        return timestamp.replace(second=0, microsecond=0)
+    if resolution == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def accumulate(rows):
+    """
+    rows : (sensor_id, timestamp, temperature, humidity, status)
+    Retourne {(sensor_id, resolution, bucket): agrégat partiel}.
+    """
+    aggregates = {}
+    for sensor_id, timestamp, temperature, humidity, status in rows:
+        for resolution in RESOLUTIONS:
+            key = (sensor_id, resolution, bucket_start(timestamp, resolution))
+            agg = aggregates.get(key)
+            if agg is None:
+                aggregates[key] = {
+                    "count": 1,
+                    "alert_count": int(status == "ALERT"),
+                    "temperature_min": temperature,
+                    "temperature_max": temperature,
+                    "temperature_sum": temperature,
+                    "humidity_min": humidity,
+                    "humidity_max": humidity,
+                    "humidity_sum": humidity,
+                }
+                continue
+            agg["count"] += 1
+            agg["alert_count"] += int(status == "ALERT")
+            agg["temperature_min"] = min(agg["temperature_min"], temperature)
+            agg["temperature_max"] = max(agg["temperature_max"], temperature)
+            agg["temperature_sum"] += temperature
+            agg["humidity_min"] = min(agg["humidity_min"], humidity)
+            agg["humidity_max"] = max(agg["humidity_max"], humidity)
+            agg["humidity_sum"] += humidity
+    return aggregates
+
+
+def merge(rollup, agg):
+    rollup.count += agg["count"]
+    rollup.alert_count += agg["alert_count"]
+    rollup.temperature_min = min(rollup.temperature_min, agg["temperature_min"])
+    rollup.temperature_max = max(rollup.temperature_max, agg["temperature_max"])
+    rollup.temperature_sum += agg["temperature_sum"]
+    rollup.humidity_min = min(rollup.humidity_min, agg["humidity_min"])
+    rollup.humidity_max = max(rollup.humidity_max, agg["humidity_max"])
+    rollup.humidity_sum += agg["humidity_sum"]
+
+
+def apply(aggregates):
+    """Fusionne des agrégats partiels dans la table (un SELECT + bulk_update/bulk_create par résolution)."""
+    for resolution in RESOLUTIONS:
+        keys = {k: v for k, v in aggregates.items() if k[1] == resolution}
+        if not keys:
+            continue
+
+        buckets = [k[2] for k in keys]
+        existing = {
+            (r.sensor_id, resolution, r.bucket): r
+            for r in MeasurementRollup.objects.filter(
+                resolution=resolution,
+                sensor_id__in={k[0] for k in keys},
+                bucket__gte=min(buckets),
+                bucket__lte=max(buckets),
+            )
+        }
+
+        updated, created = [], []
+        for key, agg in keys.items():
+            rollup = existing.get(key)
+            if rollup is None:
+                created.append(MeasurementRollup(sensor_id=key[0], resolution=resolution, bucket=key[2], **agg))
+            else:
+                merge(rollup, agg)
+                updated.append(rollup)
+
+        MeasurementRollup.objects.bulk_create(created)
+        MeasurementRollup.objects.bulk_update(updated, [
+            "count", "alert_count",
+            "temperature_min", "temperature_max", "temperature_sum",
+            "humidity_min", "humidity_max", "humidity_sum",
+        ])
+
+
+def compact(batch_size=5000, max_batches=None):
+    """
+    Intègre les mesures postérieures au watermark, par lots de `batch_size`.
+    Chaque lot (agrégats + watermark) est écrit dans une transaction.
+    Retourne le nombre de mesures intégrées.
+    """
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            watermark, _ = RollupWatermark.objects.get_or_create(name=WATERMARK)
+            rows = list(
+                Measurement.objects.filter(id__gt=watermark.last_id)
+                .order_by("id")
+                .values_list("id", "sensor_id", "timestamp", "temperature", "humidity", "status")[:batch_size]
+            )
+            if not rows:
+                break
+
+            apply(accumulate(row[1:] for row in rows))
+            watermark.last_id = rows[-1][0]
+            watermark.save(update_fields=["last_id", "updated_at"])
+
+        total += len(rows)
+        batches += 1
+    return total
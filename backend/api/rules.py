@@ -0,0 +1,143 @@
+"""
+Règles d'alerte compilées (AlertRule) : seuils température / humidité / vitesse de variation,
+hystérésis et durée minimale.
+
+Les règles d'un capteur sont compilées une fois en évaluateurs (fermetures) et gardées
+dans son entrée du registre : aucune requête sur le chemin d'ingestion en régime établi,
+recompilation quand une règle ou le capteur change (signaux → registry.invalidate).
+L'état d'exécution (alerte en cours, condition vraie depuis...) est gardé à part dans
+`engine`, il survit donc au rechargement de l'entrée du registre.
+"""
+import threading
+from collections import namedtuple
+
+MIN_RATE_INTERVAL = 1.0  # secondes, comme api/anomaly.py
+
+# Résultat de l'évaluation d'une mesure :
+# - triggered : passage OK → ALERT (accusés de réception, audit, ticket)
+# - sustained : alerte déjà en cours et seuil encore franchi, comme à la mesure précédente
+#   (l'escalade continue) ; une mesure maintenue en alerte par la seule hystérésis n'est ni l'un ni l'autre
+Verdict = namedtuple("Verdict", ["status", "triggered", "sustained"])
+
+
+class RuleState:
+    __slots__ = ("since", "firing")
+
+    def __init__(self):
+        self.since = None   # début de la condition (epoch), pour la durée minimale
+        self.firing = False
+
+
+class CompiledRule:
+
+    def __init__(self, key, metric, operator, threshold, hysteresis=0.0, duration=0):
+        self.key = key
+        self.metric = metric
+        self.duration = duration
+        if operator == "gt":
+            clear_at = threshold - hysteresis
+            self.trips = lambda value: value > threshold
+            self.clears = lambda value: value <= clear_at
+        else:
+            clear_at = threshold + hysteresis
+            self.trips = lambda value: value < threshold
+            self.clears = lambda value: value >= clear_at
+
+    def step(self, state, value, ts):
+        """Fait avancer l'état de la règle ; retourne True tant que l'alerte est active."""
+        if value is None:
+            return state.firing
+        if state.firing:
+            if self.clears(value):
+                state.firing, state.since = False, None
+            return state.firing
+        if self.trips(value):
+            if state.since is None:
+                state.since = ts
+            state.firing = ts - state.since >= self.duration
+        else:
+            state.since = None
+        return state.firing
+
+
+class RuleSet:
+    """Évaluateurs compilés d'un capteur."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.uses_rate = any(rule.metric == "rate" for rule in rules)
+
+
+def compile_rules(sensor, rules):
+    """
+    Compile les AlertRule actives d'un capteur. Sans règle de seuil sur la température,
+    min_temp / max_temp deviennent deux règles sans hystérésis ni durée (comportement d'origine).
+    """
+    compiled = [
+        CompiledRule(rule.pk, rule.metric, rule.operator, rule.threshold, rule.hysteresis, rule.duration)
+        for rule in rules if rule.active
+    ]
+    if not any(rule.metric == "temperature" for rule in compiled):
+        compiled += [
+            CompiledRule("min_temp", "temperature", "lt", sensor.min_temp),
+            CompiledRule("max_temp", "temperature", "gt", sensor.max_temp),
+        ]
+    return RuleSet(compiled)
+
+
+class RuleEngine:
+
+    def __init__(self):
+        self._states = {}  # sensor pk -> {"rules": {clé: RuleState}, "last": (température, ts)}
+        self._lock = threading.Lock()
+
+    def evaluate(self, sensor_pk, ruleset, readings, moment):
+        """
+        Verdicts (statut "OK" / "ALERT" et transitions) d'une suite de mesures
+        (température, humidité) d'un capteur, dans l'ordre, toutes horodatées à `moment`.
+        """
+        ts = moment.timestamp()
+        verdicts = []
+        with self._lock:
+            state = self._states.setdefault(
+                sensor_pk, {"rules": {}, "last": None, "alert": False, "tripping": False}
+            )
+            rule_states = state["rules"]
+            for temperature, humidity in readings:
+                rate = None
+                if ruleset.uses_rate and state["last"] is not None:
+                    last_temperature, last_ts = state["last"]
+                    if ts - last_ts >= MIN_RATE_INTERVAL:
+                        rate = (temperature - last_temperature) / ((ts - last_ts) / 60)
+                values = {"temperature": temperature, "humidity": humidity, "rate": rate}
+
+                alert = tripping = False
+                for rule in ruleset.rules:
+                    rule_state = rule_states.get(rule.key)
+                    if rule_state is None:
+                        rule_state = rule_states[rule.key] = RuleState()
+                    # Toutes les règles avancent, même si une autre a déjà déclenché
+                    value = values[rule.metric]
+                    if rule.step(rule_state, value, ts):
+                        alert = True
+                        # Seuil franchi par cette mesure, et non simple maintien dans la bande d'hystérésis
+                        tripping = tripping or (value is not None and rule.trips(value))
+                verdicts.append(Verdict(
+                    "ALERT" if alert else "OK",
+                    alert and not state["alert"],
+                    alert and state["alert"] and tripping and state["tripping"],
+                ))
+                state["alert"], state["tripping"] = alert, tripping
+                if state["last"] is None or ts - state["last"][1] >= MIN_RATE_INTERVAL:
+                    state["last"] = (temperature, ts)
+        return verdicts
+
+    def forget(self, sensor_pk=None):
+        with self._lock:
+            if sensor_pk is None:
+                self._states.clear()
+            else:
+                self._states.pop(sensor_pk, None)
+
+
+engine = RuleEngine()
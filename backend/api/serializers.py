@@ -1,10 +1,9 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Dht11, Sensor, Measurement, AuditLog
+from .models import Dht11, Sensor, Measurement, AuditLog, MeasurementRollup, AlertRule
 from django.utils import timezone
 from .utils import send_alert_notification
-from .audit import create_audit
-from .escalation import escalation_process
+from .ingest import ingest_reading
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import Profile, Ticket, IncidentAcknowledgement
 
@@ -54,6 +53,11 @@ class MeasurementSerializer(serializers.ModelSerializer):
             "created_at",
             "sensor_alert_count"
         ]
+        # Le pipeline d'ingestion lit les deux valeurs : le défaut 0 du modèle ne les rend pas facultatives
+        extra_kwargs = {
+            "temperature": {"required": True},
+            "humidity": {"required": True},
+        }
 
     def validate_temperature(self, value):
         # Validation simple — ajustez selon cahier des charges
@@ -67,75 +71,63 @@ class MeasurementSerializer(serializers.ModelSerializer):
         return value
 
     def create(self, validated_data):
-        sensor_id = validated_data.pop("sensor_id")
-        timestamp = validated_data.pop("timestamp", None)
-
-        # find or create sensor
-        sensor, created = Sensor.objects.get_or_create(
-            sensor_id=sensor_id,
-            defaults={
-                "name": f"Sensor-{sensor_id}",
-                "user": self.context['request'].user
-            }
-        )
-
-        # si pas de timestamp fourni
-        if timestamp is None:
-            timestamp = timezone.now()
-
-        measurement = Measurement.objects.create(
-            sensor=sensor,
-            timestamp=timestamp,
-            **validated_data
+        # Pipeline commun avec le lot du Bridge et le subscriber MQTT (api/ingest.py)
+        return ingest_reading(
+            validated_data["sensor_id"],
+            validated_data["temperature"],
+            validated_data["humidity"],
+            user=self.context['request'].user,
         )
 
-        create_audit(
-            action="MEASUREMENT_RECEIVED",
-            sensor=sensor,
-            details=f"Temp={measurement.temperature}, Hum={measurement.humidity}"
-        )
-
-        # Vérification alerte
-        if measurement.temperature < sensor.min_temp or measurement.temperature > sensor.max_temp:
-            measurement.status = "ALERT"
-            measurement.save()
-            for level in ["USER", "MANAGER", "SUPERVISOR"]:
-                IncidentAcknowledgement.objects.get_or_create(
-                    measurement=measurement,
-                    level=level
-                )
-            create_audit(
-                action="ALERT_TRIGGERED",
-                sensor=sensor,
-                details=f"Temp={measurement.temperature} dépasse les seuils autorisés : [{sensor.min_temp} - {sensor.max_temp}]"
-            )
+# Colonnes lues par values_list() pour le format compact
+COMPACT_FIELDS = ("id", "sensor_id", "timestamp", "temperature", "humidity", "status")
+
+
+def compact_measurements(rows):
+    """
+    Format compact (?compact=1) : métadonnées de chaque capteur une seule fois,
+    mesures en tableaux parallèles, sans sérialiseur par ligne.
+    rows : tuples values_list(*COMPACT_FIELDS).
+    """
+    sensors = Sensor.objects.in_bulk({row[1] for row in rows})
+    timestamp = serializers.DateTimeField()
+    ids, sensor_ids, timestamps, temperatures, humidities, statuses = [], [], [], [], [], []
+    for pk, sensor_pk, ts, temperature, humidity, status in rows:
+        ids.append(pk)
+        sensor_ids.append(sensors[sensor_pk].sensor_id)
+        timestamps.append(timestamp.to_representation(ts))
+        temperatures.append(temperature)
+        humidities.append(humidity)
+        statuses.append(status)
+    return {
+        "sensors": SensorSerializer(sensors.values(), many=True).data,
+        "ids": ids,
+        "sensor_ids": sensor_ids,
+        "timestamps": timestamps,
+        "temperatures": temperatures,
+        "humidities": humidities,
+        "statuses": statuses,
+    }
+
+
+class MeasurementRollupSerializer(serializers.ModelSerializer):
+    temperature_avg = serializers.FloatField(read_only=True)
+    humidity_avg = serializers.FloatField(read_only=True)
 
-            # Notifications et escalade
-            escalation_process(sensor, measurement)
-
-            # Créer un ticket seulement s'il n'y en a pas déjà un ouvert pour ce sensor
-            existing_ticket = Ticket.objects.filter(
-                sensor=sensor,
-                status__in=["OPEN", "ASSIGNED"]
-            ).first()
-
-            if not existing_ticket:
-                Ticket.objects.create(
-                    title="Dépassement température",
-                    description=f"Température = {measurement.temperature}°C",
-                    sensor=sensor,
-                    priority="HIGH",
-                    status="OPEN"
-                )
-
-        else:
-            measurement.status = "NORMAL"
-            measurement.save()
-            if sensor.alert_count > 0:
-                sensor.alert_count = 0
-            sensor.save()
-
-        return measurement
+    class Meta:
+        model = MeasurementRollup
+        fields = [
+            "bucket",
+            "resolution",
+            "count",
+            "alert_count",
+            "temperature_min",
+            "temperature_max",
+            "temperature_avg",
+            "humidity_min",
+            "humidity_max",
+            "humidity_avg",
+        ]
 
 class IncidentAcknowledgementSerializer(serializers.ModelSerializer):
     class Meta:
@@ -247,4 +239,14 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
 class TicketSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ticket
-        fields = "__all__"
\ No newline at end of file
+        fields = "__all__"
+
+class AlertRuleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AlertRule
+        fields = "__all__"
+
+    def validate_hysteresis(self, value):
+        if value < 0:
+            raise serializers.ValidationError("L'hystérésis doit être positive")
+        return value
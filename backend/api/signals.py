@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from .models import Sensor, Profile, AlertRule
+from .registry import registry
+from . import latest, partitions
+from .anomaly import engine as anomaly_engine
+from .rules import engine as rules_engine
+
+
+@receiver([post_save, post_delete], sender=Sensor)
+def invalidate_sensor(sender, instance, **kwargs):
+    registry.invalidate(instance.sensor_id)
+    latest.forget(instance.sensor_id)
+
+
+@receiver(pre_delete, sender=Sensor)
+def delete_partitioned_measurements(sender, instance, **kwargs):
+    # Dans la transaction de la suppression (cascade User → Sensor comprise)
+    partitions.delete_sensor_rows(instance.pk)
+
+
+@receiver(post_delete, sender=Sensor)
+def forget_anomaly_state(sender, instance, **kwargs):
+    anomaly_engine.forget(instance.pk)
+    rules_engine.forget(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=AlertRule)
+def recompile_rules(sender, instance, **kwargs):
+    # Modifications rares : tout le registre est rechargé (règles recompilées)
+    registry.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Profile)
+@receiver([post_save, post_delete], sender=User)
+def invalidate_escalation_chains(sender, instance, **kwargs):
+    # Un profil/utilisateur peut apparaître dans la chaîne de plusieurs capteurs
+    registry.invalidate()
@@ -1,3 +1,1353 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import tempfile
+import io
+import threading
+import time
+import unittest
+from unittest import mock
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.contrib.auth.models import User
+from rest_framework.test import APIClient
+
+from .models import Sensor, Measurement, MeasurementHistory, Profile, AuditLog, IncidentAcknowledgement, Notification, MeasurementRollup, RollupWatermark, SensorEscalationState, Ticket, AnomalyCheckpoint, AlertRule
+from .ingest import broadcast, ingest_batch, ingest_reading
+from . import events
+from .registry import registry
+from .escalation import record_alert, reset_escalation
+from .anomaly import DetectorState, engine as anomaly_engine
+from .rules import compile_rules, engine as rules_engine
+from .reevaluate import reevaluate_sensor
+from .notifications import dispatch_pending
+from .audit import create_audit, flush_audit
+from .workers import PartitionedWorkerPool
+from .rollups import compact
+from .pagination import seek
+from .latest import get_latest
+from .archive import archive_table, read_archive
+from . import partitions
+from django.core.cache import caches
+from .management.commands.mqtt_subscriber import Command as MqttSubscriberCommand
+import mqtt_bridge
+
+
+@override_settings(AUDIT_SYNC=True)
+class IngestServiceTests(TestCase):
+
+    def setUp(self):
+        registry.invalidate()
+        self.user = User.objects.create_user("owner", "owner@example.com", "pass")
+        Profile.objects.create(user=self.user)
+        self.sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=self.user, min_temp=15, max_temp=25)
+        registry.get(1)  # régime établi : configuration déjà en cache
+        anomaly_engine.forget()
+        anomaly_engine.prime([self.sensor.pk])
+        rules_engine.forget()
+
+    def test_normal_reading_query_count(self):
+        # SAVEPOINT, INSERT mesure, INSERT audit, UPDATE génération + compteur,
+        # UPDATE conditionnel de l'état d'escalade (aucune ligne écrite), RELEASE
+        with self.assertNumQueries(6):
+            m = ingest_reading(1, 20.0, 40.0)
+        self.assertEqual(m.status, "OK")
+
+    def test_batch_query_count_does_not_grow_with_size(self):
+        readings = [{"sensor_id": 1, "temperature": 20.0, "humidity": 40.0}] * 50
+        with self.assertNumQueries(6):
+            ingest_batch(readings)
+        self.assertEqual(Measurement.objects.count(), 50)
+
+    def test_alert_reading_writes_acks_and_audits(self):
+        m = ingest_reading(1, 30.0, 40.0)
+
+        self.assertEqual(m.status, "ALERT")
+        self.assertEqual(IncidentAcknowledgement.objects.filter(measurement=m).count(), 3)
+        self.assertEqual(
+            set(AuditLog.objects.values_list("action", flat=True)),
+            {"MEASUREMENT_RECEIVED", "ALERT_TRIGGERED", "TICKET_CREATED"},
+        )
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.alert_count, 1)
+        # Notifications mises en file, aucun envoi pendant l'ingestion
+        self.assertEqual(
+            sorted(Notification.objects.values_list("channel", flat=True)),
+            ["EMAIL", "TELEGRAM"],
+        )
+
+    def test_alert_storm_escalates_without_hierarchy_queries(self):
+        supervisor = User.objects.create_user("sup", "sup@example.com", "pass")
+        manager = User.objects.create_user("boss", "boss@example.com", "pass")
+        Profile.objects.create(user=manager, manager=supervisor)
+        Profile.objects.filter(user=self.user).update(manager=manager)
+        registry.invalidate()
+        registry.get(1)
+
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(7):
+                ingest_reading(1, 30.0, 40.0)
+
+        self.assertFalse([q["sql"] for q in queries if "api_profile" in q["sql"]])
+        self.assertEqual(
+            list(Ticket.objects.filter(priority__in=["MEDIUM", "HIGH"]).values_list("assigned_to__username", flat=True)),
+            ["boss", "boss", "boss", "sup"],
+        )
+
+    def test_escalation_state_records_levels_and_resets(self):
+        for _ in range(4):
+            ingest_reading(1, 30.0, 40.0)
+        state = SensorEscalationState.objects.get(sensor=self.sensor)
+        self.assertEqual((state.alert_count, state.level), (4, "MANAGER"))
+        self.assertEqual(state.level_reached_at, Measurement.objects.order_by("-id")[0].timestamp)
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.alert_count, 4)
+
+        ingest_reading(1, 20.0, 40.0)
+        state.refresh_from_db()
+        self.assertEqual((state.alert_count, state.level), (0, "NONE"))
+        # Déjà à la normale : l'UPDATE conditionnel n'écrit aucune ligne
+        self.assertEqual(reset_escalation([self.sensor.pk]), 0)
+
+    def test_batch_escalation_matches_one_by_one(self):
+        other = Sensor.objects.create(sensor_id=2, name="Cave", user=self.user, min_temp=15, max_temp=25)
+        values = [30.0, 30.0, 30.0, 20.0, 30.0]
+
+        ingest_batch([{"sensor_id": 1, "temperature": v, "humidity": 40.0} for v in values])
+        for v in values:
+            ingest_reading(2, v, 40.0)
+
+        states = [SensorEscalationState.objects.get(sensor_id=pk) for pk in (self.sensor.pk, other.pk)]
+        self.assertEqual([(s.alert_count, s.level) for s in states], [(1, "USER")] * 2)
+        self.assertEqual(
+            list(Sensor.objects.filter(pk__in=[self.sensor.pk, other.pk]).values_list("alert_count", flat=True)),
+            [1, 1],
+        )
+
+    def test_concurrent_alerts_are_not_lost(self):
+        # Deux ingestions partant du même état en mémoire : les deux incréments comptent
+        stale = Sensor.objects.get(pk=self.sensor.pk)
+        record_alert(stale)
+        record_alert(stale)
+        self.assertEqual(SensorEscalationState.objects.get(sensor=self.sensor).alert_count, 2)
+
+    def test_cold_registry_loads_batch_sensors_together(self):
+        for sid in range(2, 7):
+            Sensor.objects.create(sensor_id=sid, name=f"Capteur {sid}", user=self.user)
+        registry.invalidate()
+        readings = [{"sensor_id": sid, "temperature": 20.0, "humidity": 40.0} for sid in range(1, 7)]
+
+        with CaptureQueriesContext(connection) as queries:
+            ingest_batch(readings)
+
+        tables = ('FROM "api_sensor"', 'FROM "api_alertrule"', 'FROM "api_profile"')
+        reads = [q["sql"] for q in queries if q["sql"].startswith("SELECT") and any(t in q["sql"] for t in tables)]
+        # Capteurs, règles préchargées, chaînes d'escalade : une requête chacun pour les 6 capteurs
+        self.assertEqual(len(reads), 3)
+        self.assertEqual(len(registry.get_many(range(1, 7))), 6)
+
+    def test_unknown_sensor_is_skipped_without_user(self):
+        self.assertIsNone(ingest_reading(99, 20.0, 40.0))
+        self.assertFalse(Sensor.objects.filter(sensor_id=99).exists())
+
+    def test_rest_endpoint_uses_ingest_service(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post("/api/mesures/", {"sensor_id": 1, "temperature": 20, "humidity": 40}, format="json")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["status"], "OK")
+
+    def test_mqtt_subscriber_query_count(self):
+        command = MqttSubscriberCommand(stdout=io.StringIO())
+        # INSERT Dht11 + pipeline d'ingestion
+        with self.assertNumQueries(7):
+            command.process_reading(("sensors/1/dht11", 1, 20.0, 40.0))
+        self.assertEqual(Measurement.objects.get().status, "OK")
+
+
+@override_settings(AUDIT_SYNC=True)
+class BulkIngestTests(TestCase):
+
+    def setUp(self):
+        registry.invalidate()
+        rules_engine.forget()
+        self.user = User.objects.create_user("owner", "owner@example.com", "pass")
+        Profile.objects.create(user=self.user)
+        Sensor.objects.create(sensor_id=1, name="Salon", user=self.user, min_temp=15, max_temp=25)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, data):
+        return self.client.post("/api/mesures/bulk/", data, format="json")
+
+    def test_mixed_batch_returns_per_item_results(self):
+        response = self.post([
+            {"sensor_id": 1, "temperature": 20, "humidity": 40},
+            {"sensor_id": 1, "temperature": "chaud", "humidity": 40},
+            {"sensor_id": 1, "temperature": 30, "humidity": 40},
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data["created"], 2)
+        results = response.data["results"]
+        self.assertEqual([r["index"] for r in results], [0, 1, 2])
+        self.assertEqual(results[0]["status"], "OK")
+        self.assertIn("temperature", results[1]["errors"])
+        self.assertEqual(results[2]["status"], "ALERT")
+        self.assertEqual(Measurement.objects.count(), 2)
+
+    def test_all_invalid_batch_is_rejected(self):
+        response = self.post([{"sensor_id": 1}, {"temperature": 20, "humidity": 40}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["created"], 0)
+        self.assertFalse(Measurement.objects.exists())
+
+    @override_settings(MEASUREMENT_BULK_MAX_ITEMS=2)
+    def test_oversized_batch_is_rejected(self):
+        response = self.post([{"sensor_id": 1, "temperature": 20, "humidity": 40}] * 3)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Measurement.objects.exists())
+
+    def test_unknown_sensors_are_created_for_user(self):
+        response = self.post({"measurements": [
+            {"sensor_id": 7, "temperature": 20, "humidity": 40},
+            {"sensor_id": 8, "temperature": 21, "humidity": 40},
+        ]})
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(Sensor.objects.filter(sensor_id__in=[7, 8]).values_list("sensor_id", "user")),
+            [(7, self.user.pk), (8, self.user.pk)],
+        )
+        self.assertEqual([r["sensor_id"] for r in response.data["results"]], [7, 8])
+
+    def test_wrapper_and_empty_payloads(self):
+        response = self.post({"measurements": [{"sensor_id": 1, "temperature": 20, "humidity": 40}]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 1)
+
+        self.assertEqual(self.post({"measurements": []}).status_code, 400)
+        self.assertEqual(self.post({"sensor_id": 1}).status_code, 400)
+
+
+class FakeTransport:
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    def __call__(self, notification):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("transport indisponible")
+        self.sent.append(notification)
+
+
+@override_settings(AUDIT_SYNC=True)
+class NotificationOutboxTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user("owner", "owner@example.com", "pass")
+        self.sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=user)
+
+    def notify(self, channel="EMAIL"):
+        return Notification.objects.create(channel=channel, recipient="owner@example.com",
+                                           body="Alerte", level="USER", sensor=self.sensor)
+
+    def test_dispatch_sends_and_audits(self):
+        email, telegram = FakeTransport(), FakeTransport()
+        self.notify("EMAIL")
+        self.notify("TELEGRAM")
+
+        sent, failed = dispatch_pending(transports={"EMAIL": email, "TELEGRAM": telegram})
+
+        self.assertEqual((sent, failed), (2, 0))
+        self.assertEqual(len(email.sent) + len(telegram.sent), 2)
+        self.assertFalse(Notification.objects.exclude(status="SENT").exists())
+        self.assertEqual(
+            sorted(AuditLog.objects.values_list("action", flat=True)),
+            ["EMAIL_SENT", "TELEGRAM_SENT"],
+        )
+
+    def test_failure_is_retried_with_exponential_backoff(self):
+        transport = FakeTransport(failures=2)
+        notification = self.notify()
+
+        with self.settings(NOTIFICATION_BACKOFF_BASE=10):
+            self.assertEqual(dispatch_pending(transports={"EMAIL": transport}), (0, 1))
+            notification.refresh_from_db()
+            self.assertEqual(notification.status, "PENDING")
+            first_delay = notification.next_attempt_at - timezone.now()
+
+            # Pas encore échue : rien n'est renvoyé
+            self.assertEqual(dispatch_pending(transports={"EMAIL": transport}), (0, 0))
+
+            Notification.objects.update(next_attempt_at=timezone.now())
+            dispatch_pending(transports={"EMAIL": transport})
+            notification.refresh_from_db()
+            second_delay = notification.next_attempt_at - timezone.now()
+
+            Notification.objects.update(next_attempt_at=timezone.now())
+            self.assertEqual(dispatch_pending(transports={"EMAIL": transport}), (1, 0))
+
+        self.assertAlmostEqual(first_delay.total_seconds(), 10, delta=1)
+        self.assertAlmostEqual(second_delay.total_seconds(), 20, delta=1)
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), ("SENT", 3))
+
+    def test_gives_up_after_max_attempts(self):
+        notification = self.notify()
+
+        dispatch_pending(transports={"EMAIL": FakeTransport(failures=1)}, max_attempts=1)
+
+        notification.refresh_from_db()
+        self.assertEqual(notification.status, "FAILED")
+        self.assertEqual(notification.last_error, "transport indisponible")
+
+
+class AuditSinkTests(TestCase):
+
+    def tearDown(self):
+        flush_audit()
+
+    def test_entries_are_buffered_until_flush(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                create_audit("MEASUREMENT_RECEIVED", details=str(i))
+        self.assertEqual(AuditLog.objects.count(), 0)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(flush_audit(), 3)
+        self.assertEqual(AuditLog.objects.count(), 3)
+
+    def test_rolled_back_entries_are_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    create_audit("ALERT_TRIGGERED")
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(flush_audit(), 0)
+
+    @override_settings(AUDIT_BUFFER_SIZE=2)
+    def test_size_threshold_flushes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_audit("MEASUREMENT_RECEIVED")
+            create_audit("MEASUREMENT_RECEIVED")
+        self.assertEqual(AuditLog.objects.count(), 2)
+
+    @override_settings(AUDIT_SYNC=True)
+    def test_sync_mode_writes_immediately(self):
+        create_audit("MEASUREMENT_RECEIVED")
+        self.assertEqual(AuditLog.objects.count(), 1)
+
+
+class WorkerPoolTests(SimpleTestCase):
+
+    def test_items_of_a_key_are_processed_in_order(self):
+        processed = []
+
+        def handler(item):
+            time.sleep(0.001)
+            processed.append(item)
+
+        pool = PartitionedWorkerPool(handler, workers=3)
+        pool.start()
+        for n in range(20):
+            for key in ("a", "b", "c", "d"):
+                pool.submit(key, (key, n))
+        pool.stop(timeout=5)
+
+        self.assertEqual(len(processed), 80)
+        for key in ("a", "b", "c", "d"):
+            self.assertEqual([n for k, n in processed if k == key], list(range(20)))
+
+    def test_full_queue_drops_and_counts(self):
+        pool = PartitionedWorkerPool(lambda item: None, workers=1, queue_depth=2, put_timeout=0.01)
+
+        self.assertEqual([pool.submit(1, n) for n in range(3)], [True, True, False])
+        stats = pool.stats()
+        self.assertEqual((stats["submitted"], stats["dropped"], stats["queued"]), (2, 1, [2]))
+
+    def test_stop_drains_queued_items(self):
+        release = threading.Event()
+        processed = []
+
+        def handler(item):
+            release.wait(5)
+            processed.append(item)
+
+        pool = PartitionedWorkerPool(handler, workers=2)
+        pool.start()
+        for n in range(10):
+            pool.submit(n, n)
+        threading.Timer(0.05, release.set).start()
+        pool.stop(timeout=5)
+
+        self.assertEqual(sorted(processed), list(range(10)))
+        self.assertEqual(pool.stats()["processed"], 10)
+        self.assertFalse(any(t.is_alive() for t in pool.threads))
+
+    def test_lag_and_failure_stats(self):
+        def handler(item):
+            time.sleep(0.05)
+            if item == "boom":
+                raise ValueError(item)
+
+        pool = PartitionedWorkerPool(handler, workers=1)
+        for item in ("a", "b", "boom"):
+            pool.submit("capteur", item)
+        pool.start()
+        with redirect_stdout(io.StringIO()):
+            pool.stop(timeout=5)
+
+        stats = pool.stats()
+        self.assertEqual((stats["processed"], stats["failed"]), (2, 1))
+        # Le dernier élément a attendu le traitement des deux premiers
+        self.assertGreaterEqual(stats["lag_max"], 0.1)
+        self.assertGreater(stats["lag_avg"], 0)
+        self.assertLess(stats["lag_avg"], stats["lag_max"])
+        self.assertEqual(stats["queued"], [0])
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user("owner", "owner@example.com", "pass")
+        self.sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=user)
+
+    def add(self, temperature, status="OK"):
+        return Measurement.objects.create(sensor=self.sensor, temperature=temperature, humidity=50, status=status)
+
+    def test_compact_is_incremental(self):
+        self.add(20)
+        self.add(30, "ALERT")
+        self.assertEqual(compact(), 2)
+
+        last = self.add(10)
+        # Seule la nouvelle mesure est relue, puis fusionnée dans les agrégats existants
+        self.assertEqual(compact(), 1)
+        self.assertEqual(compact(), 0)
+
+        hour = MeasurementRollup.objects.get(resolution="hour")
+        self.assertEqual((hour.count, hour.alert_count), (3, 1))
+        self.assertEqual((hour.temperature_min, hour.temperature_max), (10, 30))
+        self.assertAlmostEqual(hour.temperature_avg, 20)
+        self.assertEqual(RollupWatermark.objects.get().last_id, last.id)
+
+    def test_rollups_endpoint(self):
+        self.add(20)
+        compact()
+        client = APIClient()
+        client.force_authenticate(self.sensor.user)
+
+        response = client.get("/api/measurements/rollups/", {"sensor": 1, "resolution": "day"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]["count"], 1)
+        self.assertEqual(client.get("/api/measurements/rollups/", {"sensor": 1, "from": "hier"}).status_code, 400)
+        self.assertEqual(client.get("/api/measurements/rollups/", {"sensor": 1, "from": "2020-13-01T00:00"}).status_code, 400)
+        self.assertEqual(client.get("/api/measurements/", {"to": "2020-02-30T00:00"}).status_code, 400)
+
+
+class AlertRunCollapseTests(TestCase):
+
+    def test_keeps_first_alert_of_each_run(self):
+        user = User.objects.create_user("owner", "owner@example.com", "pass")
+        sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=user)
+        statuses = ["OK", "ALERT", "ALERT", "ALERT", "OK", "ALERT", "ALERT"]
+        ids = [Measurement.objects.create(sensor=sensor, status=s).id for s in statuses]
+
+        qs = Measurement.objects.filter(sensor=sensor).collapse_alert_runs().order_by("timestamp", "id")
+
+        self.assertEqual(list(qs.values_list("id", flat=True)), [ids[0], ids[1], ids[4], ids[5]])
+        # Un filtre ajouté après coup ne fait pas réapparaître la suite d'une série
+        self.assertEqual(list(qs.filter(id__gt=ids[1]).values_list("id", flat=True)), [ids[4], ids[5]])
+
+
+class MeasurementPaginationTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("owner", "owner@example.com", "pass")
+        self.sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=self.user)
+        for i in range(7):
+            Measurement.objects.create(sensor=self.sensor, temperature=i)
+        # Horodatages identiques : l'id départage les lignes
+        Measurement.objects.filter(temperature__lt=4).update(timestamp=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_walks_every_row_once(self):
+        seen, url = [], "/api/mesures/?sensor=1&limit=3"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen += [m["id"] for m in response.data["results"]]
+            url = response.data["next"]
+
+        expected = list(Measurement.objects.order_by("-timestamp", "-id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+        # Retour en arrière depuis la deuxième page
+        second = self.client.get(self.client.get("/api/mesures/?limit=3").data["next"])
+        previous = self.client.get(second.data["previous"])
+        self.assertEqual([m["id"] for m in previous.data["results"]], expected[:3])
+
+    def test_list_stays_a_plain_array_with_link_header(self):
+        response = self.client.get("/api/measurements/", {"sensor": 1, "limit": 5})
+
+        self.assertEqual(len(response.data), 5)
+        self.assertIn('rel="next"', response["Link"])
+        self.assertEqual(self.client.get("/api/measurements/", {"to": "pas une date"}).status_code, 400)
+
+
+@unittest.skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN est propre à SQLite")
+class QueryPlanTests(TestCase):
+    """Les requêtes fréquentes doivent passer par un index, jamais par un parcours complet."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user("owner", "owner@example.com", "pass")
+        sensors = Sensor.objects.bulk_create(
+            [Sensor(sensor_id=i, name=f"Capteur {i}", user=user) for i in range(1, 11)]
+        )
+        Measurement.objects.bulk_create(
+            [Measurement(sensor=sensors[i % 10], temperature=20, humidity=40,
+                         status="ALERT" if i % 7 == 0 else "OK") for i in range(2000)]
+        )
+        AuditLog.objects.bulk_create([AuditLog(action="MEASUREMENT_RECEIVED", sensor=sensors[i % 10]) for i in range(500)])
+        Ticket.objects.bulk_create(
+            [Ticket(sensor=sensors[i % 10], status="CLOSED" if i % 5 else "OPEN") for i in range(200)]
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertNoFullScan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        scans = [step for step in plan if step.startswith("SCAN api_") and "USING" not in step]
+        sorts = [step for step in plan if "TEMP B-TREE FOR ORDER BY" in step]
+        self.assertFalse(scans + sorts, "\n".join(plan))
+        return plan
+
+    def test_measurement_history(self):
+        qs = Measurement.objects.filter(sensor__sensor_id=3)
+        self.assertNoFullScan(qs.order_by("-timestamp", "-id")[:20])
+        self.assertNoFullScan(seek(qs, timezone.now(), 1000)[:20])
+        self.assertNoFullScan(qs.filter(timestamp__gte=timezone.now() - timedelta(hours=1)).collapse_alert_runs())
+
+    def test_latest_measurements(self):
+        self.assertNoFullScan(Measurement.objects.filter(sensor__sensor_id=3).order_by("-timestamp")[:1])
+        self.assertNoFullScan(Measurement.objects.order_by("-timestamp", "-id")[:20])
+
+    def test_audit_log(self):
+        self.assertNoFullScan(AuditLog.objects.order_by("-created_at")[:20])
+
+    def test_tickets(self):
+        sensor = Sensor.objects.get(sensor_id=3)
+        # Ticket déjà ouvert ? (à chaque déclenchement d'alerte) : servi par l'index (sensor, status)
+        plan = self.assertNoFullScan(Ticket.objects.filter(sensor=sensor, status__in=["OPEN", "ASSIGNED"]).values("id")[:1])
+        self.assertTrue(any("ticket_sensor_status_idx" in step for step in plan), "\n".join(plan))
+        self.assertNoFullScan(Ticket.objects.filter(sensor=sensor, status="CLOSED"))
+        self.assertNoFullScan(Ticket.objects.order_by("-created_at")[:20])
+
+    def test_notification_outbox(self):
+        self.assertNoFullScan(
+            Notification.objects.filter(status="PENDING", next_attempt_at__lte=timezone.now())
+            .order_by("next_attempt_at", "id")[:50]
+        )
+
+
+@override_settings(AUDIT_SYNC=True)
+class LatestReadingCacheTests(TestCase):
+
+    def setUp(self):
+        caches["latest"].clear()
+        registry.invalidate()
+        self.user = User.objects.create_user("owner", "owner@example.com", "pass")
+        Profile.objects.create(user=self.user)
+        Sensor.objects.create(sensor_id=1, name="Salon", user=self.user, min_temp=15, max_temp=25)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_ingest_fills_cache_and_endpoint_skips_database(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_reading(1, 20.0, 40.0)
+            m = ingest_reading(1, 21.0, 41.0)
+
+        self.assertEqual(get_latest(1)["id"], m.id)
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/measurements/latest/", {"sensor": 1})
+        self.assertEqual(response.data["temperature"], 21.0)
+        self.assertEqual(response.data["sensor_alert_count"], 0)
+
+    def test_miss_falls_back_to_database(self):
+        m = ingest_reading(1, 20.0, 40.0)  # pas de COMMIT : cache vide
+
+        response = self.client.get("/api/measurements/latest/", {"sensor": 1})
+
+        self.assertEqual(response.data["id"], m.id)
+        # Mémoire locale (défaut) : la lecture en base n'est pas mise en cache
+        self.assertIsNone(get_latest(1))
+
+    def test_miss_fills_shared_cache(self):
+        m = ingest_reading(1, 20.0, 40.0)
+        with tempfile.TemporaryDirectory() as location, self.settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "latest": {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": location},
+        }):
+            self.client.get("/api/measurements/latest/", {"sensor": 1})
+            self.assertEqual(get_latest(1)["id"], m.id)
+
+    def test_cache_failure_after_commit_is_logged_not_raised(self):
+        # Lot déjà validé : une panne du cache ne doit pas remonter au client (renvoi en double)
+        with mock.patch("api.latest.caches") as broken, redirect_stdout(io.StringIO()) as out:
+            broken.__getitem__.return_value.set_many.side_effect = ConnectionError("cache indisponible")
+            with self.captureOnCommitCallbacks(execute=True):
+                m = ingest_reading(1, 20.0, 40.0)
+        self.assertIn("cache indisponible", out.getvalue())
+        self.assertTrue(Measurement.objects.filter(pk=m.pk).exists())
+
+    def test_publish_failure_does_not_skip_cache(self):
+        m = ingest_reading(1, 20.0, 40.0)
+        with mock.patch.object(events.broker, "has_subscribers", return_value=True), \
+                mock.patch.object(events.broker, "publish", side_effect=RuntimeError("abonné en erreur")), \
+                redirect_stdout(io.StringIO()) as out:
+            broadcast([m])
+
+        self.assertIn("Diffusion temps réel", out.getvalue())
+        self.assertEqual(get_latest(1)["id"], m.id)
+
+    def test_any_sensor_entry_is_last_reading_of_batch(self):
+        Sensor.objects.create(sensor_id=2, name="Cave", user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_batch([
+                {"sensor_id": 1, "temperature": 20.0, "humidity": 1.0},
+                {"sensor_id": 2, "temperature": 20.0, "humidity": 2.0},
+                {"sensor_id": 1, "temperature": 20.0, "humidity": 3.0},
+            ])
+
+        self.assertEqual(get_latest()["humidity"], 3.0)
+        self.assertEqual(get_latest(2)["humidity"], 2.0)
+
+    def test_sensor_update_evicts_entry(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_reading(1, 20.0, 40.0)
+        Sensor.objects.get(sensor_id=1).save()
+        self.assertIsNone(get_latest(1))
+
+
+@override_settings(AUDIT_SYNC=True)
+class EventStreamTests(TestCase):
+
+    def setUp(self):
+        caches["latest"].clear()
+        registry.invalidate()
+        user = User.objects.create_user("owner", "owner@example.com", "pass")
+        Profile.objects.create(user=user)
+        Sensor.objects.create(sensor_id=1, name="Salon", user=user, min_temp=15, max_temp=25)
+        Sensor.objects.create(sensor_id=2, name="Cave", user=user)
+
+    def collect(self, measurements, sensor_filters):
+        """Abonne un client par filtre, diffuse le lot, retourne les trames reçues par client."""
+        async def scenario():
+            streams = [events.stream(f) for f in sensor_filters]
+            for s in streams:
+                await anext(s)  # "retry:" : l'abonnement est actif
+            # Contexte asynchrone : la moindre requête SQL lèverait SynchronousOnlyOperation
+            broadcast(measurements)
+            received = []
+            for s in streams:
+                frames = []
+                while True:
+                    try:
+                        frames.append(await asyncio.wait_for(anext(s), 0.1))
+                    except asyncio.TimeoutError:
+                        break
+                    if frames[-1].startswith(b":"):
+                        frames.pop()
+                        break
+                received.append(frames)
+                await s.aclose()
+            return received
+
+        with self.settings(EVENT_STREAM_HEARTBEAT=0.05):
+            return asyncio.run(scenario())
+
+    def test_one_event_fans_out_to_every_subscriber(self):
+        m = ingest_reading(1, 20.0, 40.0)
+
+        first, second, other = self.collect([m], [[1], None, [2]])
+
+        self.assertEqual(len(first), 1)
+        self.assertIs(first[0], second[0])  # encodé une seule fois
+        self.assertIn(b"event: measurement", first[0])
+        self.assertEqual(other, [])
+        self.assertFalse(events.broker.has_subscribers())
+
+    def test_alert_transition_event(self):
+        m = ingest_reading(1, 30.0, 40.0)
+
+        (frames,) = self.collect([m], [[1]])
+
+        self.assertEqual([f.split(b"\n")[1] for f in frames], [b"event: measurement", b"event: alert"])
+
+
+class LedLongPollTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_etag_and_not_modified(self):
+        first = self.client.get("/api/led/status/")
+        self.assertEqual(first.status_code, 200)
+
+        started = time.monotonic()
+        response = self.client.get("/api/led/status/", {"wait": 0.3}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+
+        since = self.client.get("/api/led/status/", {"since": first.data["last_updated"].isoformat()})
+        self.assertEqual(since.status_code, 304)
+
+    def test_out_of_range_since_is_rejected(self):
+        response = self.client.get("/api/led/status/", {"since": "2020-13-45T00:00:00"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_changed_state_is_returned(self):
+        etag = self.client.get("/api/led/status/")["ETag"]
+        self.client.post("/api/led/control/", {"command": "ON"}, format="json")
+
+        response = self.client.get("/api/led/status/", {"wait": 5}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["state"], "ON")
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_command_wakes_waiting_requests(self):
+        seen = events.led_version()
+        threading.Timer(0.1, events.notify_led, args=("ON", timezone.now())).start()
+        started = time.monotonic()
+
+        self.assertTrue(events.wait_led(seen, 5))
+        self.assertLess(time.monotonic() - started, 1)
+
+
+@override_settings(AUDIT_SYNC=True)
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        caches["latest"].clear()
+        registry.invalidate()
+        self.user = User.objects.create_user("owner", "owner@example.com", "pass")
+        Profile.objects.create(user=self.user)
+        self.sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=self.user)
+        ingest_reading(1, 20.0, 40.0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertRevalidates(self, url, params=None, queries=1):
+        first = self.client.get(url, params)
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(queries):
+            again = self.client.get(url, params, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        return first["ETag"]
+
+    def test_sensor_and_measurement_lists(self):
+        for url, params in [("/api/sensors/", None), ("/api/measurements/", {"sensor": 1}),
+                            ("/api/mesures/", {"sensor": 1}), ("/api/measurements/", None)]:
+            etag = self.assertRevalidates(url, params)
+
+            ingest_reading(1, 21.0, 40.0)  # nouvelle génération du capteur
+            changed = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(changed.status_code, 200, url)
+
+    def test_sensor_update_changes_validator(self):
+        etag = self.assertRevalidates("/api/sensors/")
+        self.sensor.name = "Cuisine"
+        self.sensor.save()
+        self.assertEqual(self.sensor.generation, 2)
+        self.assertEqual(self.client.get("/api/sensors/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_measurement_update_changes_validators(self):
+        m = Measurement.objects.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_reading(1, 22.0, 40.0)  # cache "latest" rempli
+        latest_m = Measurement.objects.latest("id")
+        etags = {
+            url: self.assertRevalidates(url, {"sensor": 1}, queries=queries)
+            for url, queries in (("/api/mesures/", 1), ("/api/measurements/latest/", 0))
+        }
+
+        for target in (m, latest_m):
+            response = self.client.patch(f"/api/mesures/{target.pk}/", {"temperature": 30.0}, format="json")
+            self.assertEqual(response.status_code, 200)
+
+        for url, etag in etags.items():
+            changed = self.client.get(url, {"sensor": 1}, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(changed.status_code, 200, url)
+            self.assertNotEqual(changed["ETag"], etag)
+        self.assertEqual(self.client.get("/api/measurements/latest/", {"sensor": 1}).data["temperature"], 30.0)
+
+    def test_latest_from_cache_needs_no_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ingest_reading(1, 22.0, 40.0)
+        self.assertRevalidates("/api/measurements/latest/", {"sensor": 1}, queries=0)
+
+
+class CompactFormatTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user("owner", "owner@example.com", "pass")
+        sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=self.user)
+        for i in range(5):
+            Measurement.objects.create(sensor=sensor, temperature=20 + i, humidity=40, status="OK")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_parallel_arrays_match_full_format(self):
+        full = self.client.get("/api/measurements/", {"sensor": 1}).data
+        compact = self.client.get("/api/measurements/", {"sensor": 1, "compact": 1}).data
+
+        self.assertEqual(len(compact["sensors"]), 1)
+        self.assertEqual(compact["ids"], [m["id"] for m in full])
+        self.assertEqual(compact["timestamps"], [m["timestamp"] for m in full])
+        self.assertEqual(compact["temperatures"], [m["temperature"] for m in full])
+        self.assertEqual(compact["sensor_ids"], [1] * 5)
+
+    def test_compact_pages_with_cursor(self):
+        first = self.client.get("/api/mesures/", {"compact": 1, "limit": 3}).data
+        second = self.client.get(first["next"]).data
+
+        self.assertEqual(len(first["ids"]) + len(second["ids"]), 5)
+        self.assertIsNone(second["next"])
+
+
+class StreamingExportTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user("owner", "owner@example.com", "pass")
+        salon = Sensor.objects.create(sensor_id=1, name="Salon", user=user)
+        cave = Sensor.objects.create(sensor_id=2, name="Cave", user=user)
+        for sensor in (salon, cave, salon):
+            Measurement.objects.create(sensor=sensor, temperature=20, humidity=40)
+            AuditLog.objects.create(action="MEASUREMENT_RECEIVED", sensor=sensor, details="Temp=20")
+        AuditLog.objects.create(action="ALERT_TRIGGERED")
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def download(self, url, params):
+        response = self.client.get(url, params)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_audit_csv(self):
+        response, body = self.download("/api/audit/export/", {})
+        lines = body.decode().splitlines()
+
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(lines[0], "ID,Action,Sensor,Details,Created At")
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[1].split(",")[2] == "")  # entrée sans capteur, la plus récente
+
+    def test_measurements_jsonl_gzip_with_sensor_filter(self):
+        response, body = self.download("/api/measurements/export/", {"output": "jsonl", "sensor": 1})
+        rows = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+
+        self.assertIn(".jsonl.gz", response["Content-Disposition"])
+        self.assertEqual([r["sensor_id"] for r in rows], [1, 1])
+
+    def test_unknown_output(self):
+        self.assertEqual(self.client.get("/api/audit/export/", {"output": "xml"}).status_code, 400)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = self.settings(ARCHIVE_DIR=self.tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        user = User.objects.create_user("owner", "owner@example.com", "pass")
+        self.sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=user)
+        self.old = timezone.now() - timedelta(days=100)
+
+    def add(self, status="OK", compacted=True):
+        m = Measurement.objects.create(sensor=self.sensor, temperature=20, humidity=40, status=status)
+        Measurement.objects.filter(pk=m.pk).update(timestamp=self.old)
+        if compacted:
+            compact()
+        return m
+
+    def test_old_measurements_are_archived_and_readable(self):
+        kept_ack = self.add("ALERT")
+        IncidentAcknowledgement.objects.create(measurement=kept_ack, level="USER")
+        archived = [self.add(), self.add()]
+        not_compacted = self.add(compacted=False)
+        generation = Sensor.objects.get(pk=self.sensor.pk).generation
+
+        self.assertEqual(archive_table("measurement", 90, batch_size=1), 2)
+        # Un lot supprimé = une nouvelle génération : les ETag des listes ne sont plus valides
+        self.assertEqual(Sensor.objects.get(pk=self.sensor.pk).generation, generation + 2)
+
+        self.assertEqual(
+            set(Measurement.objects.values_list("id", flat=True)), {kept_ack.id, not_compacted.id}
+        )
+        self.assertEqual(MeasurementRollup.objects.get(resolution="day").count, 3)
+
+        records = list(read_archive("measurement", self.old - timedelta(hours=1), self.old + timedelta(hours=1), 1))
+        self.assertEqual([r["id"] for r in records], [m.id for m in archived])
+        self.assertEqual(list(read_archive("measurement", sensor_id=2)), [])
+
+    def test_archive_endpoint(self):
+        self.add()
+        self.add()
+        archive_table("measurement", 90)
+        client = APIClient()
+        client.force_authenticate(self.sensor.user)
+
+        response = client.get("/api/archive/measurement/", {"sensor": 1})
+
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(client.get("/api/archive/unknown/").status_code, 404)
+
+
+class PartitionTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        override = self.settings(ARCHIVE_DIR=self.tmp.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user("owner", "owner@example.com", "pass")
+        self.sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=self.user)
+        today = timezone.localdate()
+        self.month = date(today.year - (today.month <= 2), (today.month - 3) % 12 + 1, 1)
+        self.old = timezone.make_aware(datetime(self.month.year, self.month.month, 10, 12))
+
+    def add(self, timestamp=None, compacted=True):
+        m = Measurement.objects.create(sensor=self.sensor, temperature=20, humidity=40)
+        if timestamp:
+            Measurement.objects.filter(pk=m.pk).update(timestamp=timestamp)
+        if compacted:
+            compact()
+        return m
+
+    def test_seal_moves_month_and_view_reads_everything(self):
+        sealed = [self.add(self.old), self.add(self.old + timedelta(days=1))]
+        recent = self.add()
+        kept = self.add(self.old, compacted=False)
+
+        self.assertEqual(partitions.seal_month(self.month, batch_size=1), 2)
+
+        self.assertEqual(set(Measurement.objects.values_list("id", flat=True)), {kept.id, recent.id})
+        self.assertEqual(
+            set(MeasurementHistory.objects.values_list("id", flat=True)), {m.id for m in sealed + [kept, recent]}
+        )
+        self.assertEqual([name for _, name in partitions.partitions()], [partitions.partition_table(self.month)])
+        with self.assertRaises(ValueError):
+            partitions.seal_month(timezone.localdate().replace(day=1))
+
+    def test_router_and_list_cover_partitions(self):
+        old = self.add(self.old)
+        recent = self.add()
+        partitions.seal_month(self.month)
+
+        self.assertIs(partitions.measurement_source(timezone.now() - timedelta(hours=1)).model, Measurement)
+        self.assertIs(partitions.measurement_source(self.old).model, MeasurementHistory)
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        ids = [m["id"] for m in client.get("/api/measurements/", {"sensor": 1}).json()]
+        self.assertEqual(ids, [recent.id, old.id])
+        page = client.get("/api/mesures/", {"sensor": 1, "limit": 1}).json()
+        self.assertEqual([m["id"] for m in page["results"]], [recent.id])
+        self.assertEqual([m["id"] for m in client.get(page["next"]).json()["results"]], [old.id])
+
+    def test_range_query_seeks_each_partition(self):
+        self.add(self.old)
+        partitions.seal_month(self.month)
+        qs = partitions.measurement_source(self.old).filter(
+            sensor_id=self.sensor.pk, timestamp__gte=self.old
+        ).order_by("-timestamp", "-id")[:10]
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        scans = [step for step in plan if step.startswith("SCAN api_measurement")]
+        self.assertEqual(scans, [], plan)
+
+    def test_drop_partition_archives_then_drops(self):
+        old = self.add(self.old)
+        partitions.seal_month(self.month)
+
+        self.assertEqual(partitions.drop_partition(self.month, archive=True), 1)
+
+        self.assertEqual(partitions.partitions(), [])
+        self.assertFalse(MeasurementHistory.objects.filter(pk=old.pk).exists())
+        self.assertEqual([r["id"] for r in read_archive("measurement", sensor_id=1)], [old.id])
+
+    def test_empty_month_creates_no_partition(self):
+        self.add()
+        self.assertEqual(partitions.seal_month(self.month), 0)
+        self.assertEqual(partitions.partitions(), [])
+
+    def test_sensor_delete_removes_sealed_rows(self):
+        old = self.add(self.old)
+        partitions.seal_month(self.month)
+
+        self.user.delete()  # cascade User → Sensor → mesures, partitions comprises
+
+        self.assertFalse(Sensor.objects.exists())
+        self.assertFalse(MeasurementHistory.objects.filter(pk=old.pk).exists())
+
+    def test_archive_retention_covers_sealed_months(self):
+        old = self.add(self.old)
+        partitions.seal_month(self.month)
+        generation = Sensor.objects.get(pk=self.sensor.pk).generation
+
+        self.assertEqual(archive_table("measurement", 1, dry_run=True), 1)
+        self.assertEqual(archive_table("measurement", 1), 1)
+
+        self.assertEqual(partitions.partitions(), [])
+        self.assertEqual([r["id"] for r in read_archive("measurement", sensor_id=1)], [old.id])
+        self.assertEqual(Sensor.objects.get(pk=self.sensor.pk).generation, generation + 1)
+
+
+@override_settings(AUDIT_SYNC=True, ANOMALY_WARMUP=10, ANOMALY_STUCK_COUNT=5)
+class AnomalyDetectionTests(TestCase):
+
+    def setUp(self):
+        anomaly_engine.forget()
+        user = User.objects.create_user("owner", "owner@example.com", "pass")
+        self.sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=user, min_temp=15, max_temp=25)
+
+    def feed(self, state, values, start=None):
+        start = start or timezone.now()
+        found = []
+        for i, value in enumerate(values):
+            found += state.update(value, 40.0, start + timedelta(minutes=i))
+        return [kind for kind, _ in found]
+
+    def test_spike_and_rate_inside_static_thresholds(self):
+        state = DetectorState()
+        self.assertEqual(self.feed(state, [20.0, 20.4] * 10), [])
+
+        # 24.5 °C reste sous max_temp : seuls les détecteurs en flux le signalent
+        self.assertEqual(self.feed(state, [24.5], timezone.now() + timedelta(minutes=20)), ["SPIKE", "RATE"])
+
+    def test_stuck_sensor_is_flagged_once(self):
+        for _ in range(8):
+            ingest_reading(1, 20.0, 40.0)
+
+        details = list(AuditLog.objects.filter(action="ANOMALY_DETECTED").values_list("details", flat=True))
+        self.assertEqual(len(details), 1)
+        self.assertTrue(details[0].startswith("STUCK"))
+
+    def test_checkpoint_restores_state_without_history(self):
+        for value in (20.0, 21.0, 22.0):
+            ingest_reading(1, value, 40.0)
+        before = anomaly_engine._states[self.sensor.pk].as_dict()
+
+        self.assertEqual(anomaly_engine.checkpoint(force=True), 1)
+        anomaly_engine.forget()
+        with self.assertNumQueries(1):
+            anomaly_engine.prime([self.sensor.pk])
+
+        self.assertEqual(anomaly_engine._states[self.sensor.pk].as_dict(), before)
+        self.assertEqual(AnomalyCheckpoint.objects.get().state["count"], 3)
+
+
+@override_settings(AUDIT_SYNC=True)
+class AlertRuleTests(TestCase):
+
+    def setUp(self):
+        registry.invalidate()
+        rules_engine.forget()
+        user = User.objects.create_user("owner", "owner@example.com", "pass")
+        Profile.objects.create(user=user)
+        self.sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=user, min_temp=15, max_temp=25)
+
+    def run_rules(self, values, step=timedelta(seconds=10)):
+        ruleset = compile_rules(self.sensor, self.sensor.alert_rules.all())
+        start = timezone.now()
+        return [
+            rules_engine.evaluate(self.sensor.pk, ruleset, [(value, 40.0)], start + i * step)[0].status
+            for i, value in enumerate(values)
+        ]
+
+    def test_default_rules_are_sensor_thresholds(self):
+        self.assertEqual(self.run_rules([20, 26, 24, 14]), ["OK", "ALERT", "OK", "ALERT"])
+
+    def test_hysteresis_stops_flapping(self):
+        AlertRule.objects.create(sensor=self.sensor, metric="temperature", operator="gt", threshold=25, hysteresis=1)
+        self.assertEqual(
+            self.run_rules([25.2, 24.8, 25.1, 24.9, 23.9, 24.9]),
+            ["ALERT", "ALERT", "ALERT", "ALERT", "OK", "OK"],
+        )
+
+    def test_duration_and_rate_rules(self):
+        AlertRule.objects.create(sensor=self.sensor, metric="humidity", operator="gt", threshold=30, duration=30)
+        # Humidité à 40 % : alerte seulement après 30 s de condition vraie
+        self.assertEqual(self.run_rules([20, 20, 20, 20]), ["OK", "OK", "OK", "ALERT"])
+
+        rules_engine.forget()
+        AlertRule.objects.all().delete()
+        AlertRule.objects.create(sensor=self.sensor, metric="rate", operator="gt", threshold=2)
+        # +1 °C en 10 s = 6 °C/min ; min/max restent actifs (pas de règle de température)
+        self.assertEqual(self.run_rules([20, 20.1, 21.1, 21.1]), ["OK", "OK", "ALERT", "OK"])
+
+    def test_ingest_uses_cached_rules_until_changed(self):
+        rule = AlertRule.objects.create(sensor=self.sensor, metric="temperature", operator="gt", threshold=22)
+        registry.get(1)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ingest_reading(1, 23.0, 40.0).status, "ALERT")
+        self.assertFalse([q["sql"] for q in queries if "api_alertrule" in q["sql"]])
+
+        rule.threshold = 24
+        rule.save()
+        self.assertEqual(ingest_reading(1, 23.0, 40.0).status, "OK")
+
+    def test_flapping_in_hysteresis_band_writes_only_on_transition(self):
+        AlertRule.objects.create(sensor=self.sensor, metric="temperature", operator="gt", threshold=25, hysteresis=2)
+
+        with CaptureQueriesContext(connection) as queries:
+            statuses = [ingest_reading(1, value, 40.0).status for value in [26, 24.5] * 4]
+        self.assertEqual(statuses, ["ALERT"] * 8)
+
+        acks = [q["sql"] for q in queries if q["sql"].startswith('INSERT INTO "api_incidentacknowledgement"')]
+        self.assertEqual(len(acks), 1)
+        self.assertEqual(IncidentAcknowledgement.objects.count(), 3)
+        self.assertEqual(AuditLog.objects.filter(action="ALERT_TRIGGERED").count(), 1)
+        self.assertEqual(SensorEscalationState.objects.get(sensor=self.sensor).alert_count, 1)
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.alert_count, 1)
+        self.assertEqual(Ticket.objects.count(), 1)
+
+        # Seuil franchi à chaque mesure : l'escalade continue, sans nouvel accusé de réception
+        for _ in range(3):
+            ingest_reading(1, 26.0, 40.0)
+        self.assertEqual(SensorEscalationState.objects.get(sensor=self.sensor).alert_count, 3)
+        self.assertEqual(IncidentAcknowledgement.objects.count(), 3)
+
+
+class ReevaluateStatusTests(TestCase):
+
+    def setUp(self):
+        rules_engine.forget()
+        self.user = User.objects.create_user("owner", "owner@example.com", "pass")
+        self.sensor = Sensor.objects.create(sensor_id=1, name="Salon", user=self.user, min_temp=15, max_temp=25)
+        self.start = timezone.now() - timedelta(days=1)
+
+    def add(self, values, status=None, step=timedelta(seconds=10), offset=0):
+        created = Measurement.objects.bulk_create([
+            Measurement(sensor=self.sensor, temperature=value, humidity=40,
+                        status=status or ("ALERT" if value > self.sensor.max_temp else "OK"))
+            for value in values
+        ])
+        for i, m in enumerate(created):
+            Measurement.objects.filter(pk=m.pk).update(timestamp=self.start + (offset + i) * step)
+        return created
+
+    def statuses(self):
+        return list(MeasurementHistory.objects.filter(sensor=self.sensor).order_by("timestamp", "id")
+                    .values_list("status", flat=True))
+
+    def test_only_changed_rows_are_written_and_rollups_follow(self):
+        self.add([20, 24, 26, 23])
+        compact()
+        Sensor.objects.filter(pk=self.sensor.pk).update(max_temp=22)
+        self.sensor.refresh_from_db()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(reevaluate_sensor(self.sensor, chunk_size=3), (4, 2))
+        updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "api_measurement"')]
+        self.assertEqual(len(updates), 2)  # un UPDATE par paquet modifié, lignes inchangées jamais écrites
+
+        self.assertEqual(self.statuses(), ["OK", "ALERT", "ALERT", "ALERT"])
+        self.assertEqual(MeasurementRollup.objects.get(resolution="day").alert_count, 3)
+        self.assertEqual(reevaluate_sensor(self.sensor), (4, 0))
+
+    def test_vectorized_rules_match_streaming_engine(self):
+        AlertRule.objects.create(sensor=self.sensor, metric="temperature", operator="gt",
+                                 threshold=25, hysteresis=1, duration=20)
+        values = [24, 25.5, 26, 26, 24.5, 25.2, 23.9, 26, 26.5, 24.2, 26, 23, 27, 27, 27]
+        self.add(values, status="OK")
+
+        ruleset = compile_rules(self.sensor, self.sensor.alert_rules.all())
+        expected = [
+            rules_engine.evaluate(-1, ruleset, [(value, 40)], self.start + i * timedelta(seconds=10))[0].status
+            for i, value in enumerate(values)
+        ]
+        reevaluate_sensor(self.sensor, chunk_size=4)
+        self.assertEqual(self.statuses(), expected)
+
+    def test_sealed_partitions_are_reevaluated(self):
+        today = timezone.localdate()
+        month = date(today.year - (today.month <= 2), (today.month - 3) % 12 + 1, 1)
+        self.start = timezone.make_aware(datetime(month.year, month.month, 10, 12))
+        self.add([20, 26])
+        compact()
+        partitions.seal_month(month)
+        self.assertFalse(Measurement.objects.exists())
+
+        Sensor.objects.filter(pk=self.sensor.pk).update(max_temp=30)
+        self.sensor.refresh_from_db()
+        self.assertEqual(reevaluate_sensor(self.sensor), (2, 1))
+        self.assertEqual(self.statuses(), ["OK", "OK"])
+
+
+class BridgeSpoolTests(SimpleTestCase):
+    """File d'attente locale du bridge MQTT -> API."""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = f"{tmp.name}/spool.sqlite3"
+
+    def open(self, max_rows=100):
+        spool = mqtt_bridge.Spool(self.path, max_rows)
+        self.addCleanup(spool.conn.close)
+        return spool
+
+    def test_pending_rows_replayed_in_order_after_restart(self):
+        spool = self.open()
+        for i in range(3):
+            spool.put({"temperature": i})
+        spool.conn.close()
+
+        restarted = self.open()
+        self.assertEqual(len(restarted), 3)
+        self.assertEqual([p["temperature"] for _, p in restarted.peek(10)], [0, 1, 2])
+
+    def test_row_cap_drops_oldest_rows(self):
+        spool = self.open(max_rows=3)
+        with redirect_stdout(io.StringIO()):
+            for i in range(5):
+                spool.put({"temperature": i})
+        self.assertEqual(len(spool), 3)
+        self.assertEqual([p["temperature"] for _, p in spool.peek(10)], [2, 3, 4])
+
+    def test_ack_only_removes_sent_rows(self):
+        spool = self.open()
+        for i in range(2):
+            spool.put({"temperature": i})
+        sent = spool.peek(10)
+        spool.put({"temperature": 2})  # arrivée pendant l'envoi
+
+        spool.ack(row_id for row_id, _ in sent)
+        self.assertEqual(len(spool), 1)
+        self.assertEqual([p["temperature"] for _, p in spool.peek(10)], [2])
+
+    def test_full_spool_does_not_wake_flusher_during_backoff(self):
+        spool = self.open()
+        event = asyncio.Event()
+        msg = mock.Mock(topic="sensors/1/dht11", payload=b'{"temperature": 20, "humidity": 40}')
+        with mock.patch.multiple(mqtt_bridge, spool=spool, flush_event=event, BATCH_SIZE=1, backing_off=True), \
+                redirect_stdout(io.StringIO()):
+            mqtt_bridge.on_local_message(None, None, msg)
+            self.assertFalse(event.is_set())
+
+            mqtt_bridge.backing_off = False
+            mqtt_bridge.on_local_message(None, None, msg)
+            self.assertTrue(event.is_set())
+        self.assertEqual(len(spool), 2)
+
+
+class FakeBridgeApi(mqtt_bridge.ApiClient):
+    """ApiClient sans réseau : login renvoie un nouveau token, le bulk exige le token courant."""
+
+    def __init__(self, token, bulk_status=201):
+        super().__init__(max_concurrency=2)
+        self.token = token
+        self.bulk_status = bulk_status
+        self.logins = 0
+
+    async def _call(self, method, url, limited=True, **kwargs):
+        await asyncio.sleep(0)
+        if url == mqtt_bridge.API_LOGIN_URL:
+            self.logins += 1
+            await asyncio.sleep(0.01)  # les autres requêtes reçoivent leur 401 pendant ce temps
+            return mock.Mock(status_code=200, json=lambda: {"access": f"token-{self.logins}"})
+        if kwargs["headers"]["Authorization"] != f"Bearer token-{self.logins}":
+            return mock.Mock(status_code=401, text="expired")
+        return mock.Mock(status_code=self.bulk_status, text="",
+                         json=lambda: {"created": len(kwargs["json"]), "results": []})
+
+
+class BridgeApiClientTests(SimpleTestCase):
+    """Renouvellement du token et découpage des lots côté bridge."""
+
+    def api(self, **kwargs):
+        api = FakeBridgeApi(**kwargs)
+        self.addCleanup(api.close)
+        return api
+
+    def test_concurrent_401_share_a_single_refresh(self):
+        async def scenario():
+            api = self.api(token="stale")
+            results = await asyncio.gather(*(
+                mqtt_bridge.send_batch_to_api(api, [{"sensor_id": i}]) for i in range(4)
+            ))
+            return api, results
+
+        with redirect_stdout(io.StringIO()):
+            api, results = asyncio.run(scenario())
+        self.assertEqual(results, [True] * 4)
+        self.assertEqual(api.logins, 1)
+        self.assertEqual(api.token, "token-1")
+
+    def test_persistent_401_keeps_batch_in_spool(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        spool = mqtt_bridge.Spool(f"{tmp.name}/spool.sqlite3", 100)
+        self.addCleanup(spool.conn.close)
+        spool.put({"sensor_id": 1, "temperature": 20})
+
+        async def scenario(api):
+            event = asyncio.Event()
+            event.set()
+            with mock.patch.multiple(mqtt_bridge, spool=spool, flush_event=event, backing_off=False):
+                task = asyncio.create_task(mqtt_bridge.flush_spool(api))
+                while not mqtt_bridge.backing_off:
+                    await asyncio.sleep(0.01)
+                task.cancel()
+
+        # Le serveur refuse aussi le nouveau token : le lot ne doit pas être perdu
+        api = self.api(token="stale")
+        api._call = mock.AsyncMock(side_effect=lambda method, url, **kwargs: (
+            mock.Mock(status_code=200, json=lambda: {"access": "refused"})
+            if url == mqtt_bridge.API_LOGIN_URL else mock.Mock(status_code=401, text="expired")
+        ))
+        with redirect_stdout(io.StringIO()):
+            asyncio.run(scenario(api))
+        self.assertEqual(len(spool), 1)
+        self.assertEqual([p["temperature"] for _, p in spool.peek(10)], [20])
+        logins = [c for c in api._call.await_args_list if c.args[1] == mqtt_bridge.API_LOGIN_URL]
+        self.assertEqual(len(logins), 1)
+
+    def test_split_by_sensor_caps_each_batch(self):
+        rows = [(i, {"sensor_id": 1}) for i in range(5)] + [(5, {"sensor_id": 2})]
+        batches = mqtt_bridge.split_by_sensor(rows, parts=4, size=2)
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        sensor_1 = next(batch for batch in batches if batch[0][1]["sensor_id"] == 1)
+        self.assertEqual([row_id for row_id, _ in sensor_1], [0, 1])
+        self.assertEqual(sum(len(batch) for batch in batches), 3)
@@ -11,7 +11,7 @@ from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
 )
-from .views import CustomTokenObtainPairView, me, UserRetrieveUpdateView, TicketViewSet
+from .views import CustomTokenObtainPairView, me, UserRetrieveUpdateView, TicketViewSet, AlertRuleViewSet
 
 router = DefaultRouter()
 router.register(r"sensors", SensorViewSet, basename="sensors")
@@ -19,6 +19,7 @@ router.register(r"mesures", MeasurementViewSet, basename="mesures")
 router.register(r"audit", AuditLogViewSet)
 router.register("users", UserViewSet, basename="users")
 router.register(r'tickets', TicketViewSet)
+router.register(r"alert-rules", AlertRuleViewSet)
 
 urlpatterns = [
     path("auth/login/", CustomTokenObtainPairView.as_view(), name="login"),
@@ -27,6 +28,9 @@ urlpatterns = [
     path("auth/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
     path('measurements/', measurement_list, name='measurements'),
     path('measurements/latest/', measurement_latest, name='measurement-latest'),
+    path('measurements/rollups/', views.measurement_rollups, name='measurement-rollups'),
+    path('measurements/export/', views.export_measurements, name='export_measurements'),
+    path('stream/', views.measurement_stream, name='measurement-stream'),
     path(
         "measurements/<int:measurement_id>/acknowledgements/",
         incident_acknowledgement
@@ -37,6 +41,7 @@ urlpatterns = [
         name="acknowledge-incident"
     ),
     path("audit/export/", views.export_audit_logs, name="export_audit_logs"),
+    path("archive/<str:table>/", views.read_archived, name="read_archived"),
     # path('api/', api.Dlist,name='json'),
     path("", include(router.urls)),
     path('users/<int:pk>/', UserRetrieveUpdateView.as_view(), name='user-detail'),
@@ -3,7 +3,8 @@ from django.conf import settings
 from django.core.mail import send_mail
 from .audit import create_audit
 
-def send_alert_email(user, sensor, measurement, msg):
+def alert_email_content(sensor, measurement, msg):
+    """Sujet et corps de l'email d'alerte."""
     subject = f"⚠️ Alerte Température - Capteur #{sensor.sensor_id}"
     message = (
         f"Alerte : {msg}\n"
@@ -14,6 +15,10 @@ def send_alert_email(user, sensor, measurement, msg):
         f"Heure : {measurement.timestamp}\n\n"
         f"⚠️ Valeur en dehors des seuils autorisés !"
     )
+    return subject, message
+
+def send_alert_email(user, sensor, measurement, msg):
+    subject, message = alert_email_content(sensor, measurement, msg)
 
     send_mail(
         subject,
@@ -34,11 +39,9 @@ def send_telegram(text: str) -> bool:
         return r.ok
     except Exception:
         return False
-def send_alert_telegram(user, sensor, measurement, msg):
-    token = settings.TELEGRAM_BOT_TOKEN
-    chat_id = settings.TELEGRAM_CHAT_ID
-
-    text = (
+def alert_telegram_text(user, sensor, measurement, msg):
+    """Texte (Markdown) du message Telegram d'alerte."""
+    return (
         f"⚠️ *ALERTE TEMPÉRATURE : {msg}*\n"
         f"Capteur: {sensor.name} (ID {sensor.sensor_id})\n"
         f"Température : {measurement.temperature}°C\n"
@@ -47,6 +50,12 @@ def send_alert_telegram(user, sensor, measurement, msg):
         f"User Email address : {user.email}\n"
     )
 
+def send_alert_telegram(user, sensor, measurement, msg):
+    token = settings.TELEGRAM_BOT_TOKEN
+    chat_id = settings.TELEGRAM_CHAT_ID
+
+    text = alert_telegram_text(user, sensor, measurement, msg)
+
     url = f"https://api.telegram.org/bot{token}/sendMessage"
     payload = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
 
@@ -57,6 +66,10 @@ def send_alert_telegram(user, sensor, measurement, msg):
         pass
 
 
+def alert_twiml(sensor, measurement):
+    """Message TwiML pour le TTS (Text-To-Speech) de l'appel Twilio."""
+    return f"<Response><Say language='fr-FR'>Alerte Critique sur le capteur {sensor.name}. Température de {measurement.temperature} degrés. Veuillez intervenir immédiatement.</Say></Response>"
+
 def send_twilio_alert(msg, sensor, measurement):
     """
     Envoie un appel vocal via Twilio.
@@ -76,7 +89,7 @@ def send_twilio_alert(msg, sensor, measurement):
         client = Client(account_sid, auth_token)
 
         # Message TwiML pour le TTS (Text-To-Speech)
-        twiml_msg = f"<Response><Say language='fr-FR'>Alerte Critique sur le capteur {sensor.name}. Température de {measurement.temperature} degrés. Veuillez intervenir immédiatement.</Say></Response>"
+        twiml_msg = alert_twiml(sensor, measurement)
 
         call = client.calls.create(
             twiml=twiml_msg,
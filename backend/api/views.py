@@ -13,58 +13,124 @@ from django.contrib.auth.models import User
 from rest_framework.viewsets import ModelViewSet
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from .models import Sensor, Measurement, AuditLog, User, Ticket, IncidentAcknowledgement, LedState
-from .serializers import SensorSerializer, MeasurementSerializer, AuditLogSerializer, CustomTokenObtainPairSerializer, UserSerializer, TicketSerializer, IncidentAcknowledgementSerializer
+from .models import Sensor, Measurement, AuditLog, User, Ticket, IncidentAcknowledgement, LedState, MeasurementRollup, AlertRule
+from .serializers import SensorSerializer, MeasurementSerializer, AuditLogSerializer, CustomTokenObtainPairSerializer, UserSerializer, TicketSerializer, IncidentAcknowledgementSerializer, MeasurementRollupSerializer, AlertRuleSerializer
+from .serializers import COMPACT_FIELDS, compact_measurements
 from rest_framework.decorators import action, api_view, permission_classes
 from django.utils.dateparse import parse_datetime
 from django.utils import timezone
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from .permissions import IsManagerOrSupervisor
+from .ingest import ingest_batch
+from .escalation import reset_escalation
+from .reevaluate import reevaluate_sensor
+from .audit import create_audit
+from .pagination import MeasurementCursorPagination
+from .conditional import conditional, make_etag, sensor_version, sensors_version
+from django.db.models import F
+from django.utils.http import quote_etag
+from . import events, latest
+from .exports import OUTPUTS, gzip_jsonl, stream_export
+from .archive import ARCHIVES, read_archive
+from .partitions import measurement_source
+from django.http import StreamingHttpResponse
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView
 from django.shortcuts import get_object_or_404
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
 import csv
+import time
 from django.http import HttpResponse
 from django.utils.timezone import now
 import paho.mqtt.publish as publish
 
 
+def parse_time_range(request):
+    """
+    Bornes ?from= / ?to= (ISO 8601). Lève ValidationError si une date est invalide.
+    """
+    bounds = []
+    for param in ("from", "to"):
+        value = request.query_params.get(param)
+        if not value:
+            bounds.append(None)
+            continue
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:  # bien formée mais hors limites (mois 13, 30 février...)
+            parsed = None
+        if parsed is None:
+            raise ValidationError({param: "Date invalide (format ISO 8601 attendu)"})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        bounds.append(parsed)
+    return bounds
+
+
+def filter_measurements(request, qs=None):
+    """
+    Filtres ?sensor= / ?from= / ?to= puis regroupement des alertes successives.
+    Les bornes sont appliquées avant le regroupement pour que la fenêtre LAG ne lise
+    que l'intervalle demandé (servi par l'index (sensor, timestamp, id)).
+    Sans `qs`, la source dépend de ?from= : table active seule ou vue des partitions.
+    """
+    sensor_id = request.query_params.get("sensor")
+    start, end = parse_time_range(request)
+    if qs is None:
+        qs = measurement_source(start).select_related("sensor")
+
+    if sensor_id:
+        qs = qs.filter(sensor__sensor_id=sensor_id)
+    if start:
+        qs = qs.filter(timestamp__gte=start)
+    if end:
+        qs = qs.filter(timestamp__lte=end)
+
+    # Gestion des alertes successives : seule la première alerte de chaque série est gardée
+    if sensor_id and Sensor.objects.filter(sensor_id=sensor_id, alert_count__gt=0).exists():
+        qs = qs.collapse_alert_runs()
+    return qs
+
+
+def is_compact(request):
+    return request.query_params.get("compact", "").lower() in ("1", "true")
+
+
+def compact_page(request, qs, paginator):
+    """?compact=1 : page de mesures en tableaux parallèles, capteurs décrits une seule fois."""
+    paginator.position = lambda row: (row[2], row[0])  # (timestamp, id) du tuple COMPACT_FIELDS
+    rows = paginator.paginate_queryset(qs.values_list(*COMPACT_FIELDS), request)
+    data = compact_measurements(rows)
+    data["next"] = paginator.get_next_link()
+    data["previous"] = paginator.get_previous_link()
+    return Response(data)
+
+
+def list_measurements(request):
+    qs = filter_measurements(request)
+
+    # Liste simple (plus récentes d'abord), bornée ; la page suivante est dans l'en-tête Link
+    paginator = MeasurementCursorPagination(page_size=getattr(settings, "MEASUREMENT_LIST_LIMIT", 1000))
+    if is_compact(request):
+        response = compact_page(request, qs, paginator)
+    else:
+        page = paginator.paginate_queryset(qs, request)
+        response = Response(MeasurementSerializer(page, many=True).data)
+    links = [f'<{url}>; rel="{rel}"' for rel, url in
+             (("next", paginator.get_next_link()), ("prev", paginator.get_previous_link())) if url]
+    if links:
+        response["Link"] = ", ".join(links)
+    return response
+
+
 @api_view(['GET', 'POST'])
 def measurement_list(request):
     if request.method == 'GET':
         sensor_id = request.query_params.get("sensor")
-        qs = Measurement.objects.all().select_related("sensor").order_by("timestamp")
-
-        if sensor_id:
-            qs = qs.filter(sensor__sensor_id=sensor_id)
-            try:
-                sensor = Sensor.objects.get(sensor_id=sensor_id)
-            except Sensor.DoesNotExist:
-                sensor = None
-        else:
-            sensor = None
-
-        # Gestion des alertes successives
-        if sensor and getattr(sensor, "alert_count", 0) > 0:
-            measurements = list(qs)
-            filtered = []
-            last_status = None
-            for m in measurements:
-                if m.status == "ALERT":
-                    if last_status != "ALERT":
-                        filtered.append(m)
-                else:  # OK/NORMAL
-                    filtered.append(m)
-                last_status = m.status
-
-            # Retour en ordre décroissant pour l'affichage
-            qs = Measurement.objects.filter(id__in=[m.id for m in filtered]).order_by("-timestamp")
-        else:
-             # Force descending order for non-alert case too
-             qs = qs.order_by("-timestamp")
-
-        serializer = MeasurementSerializer(qs, many=True)
-        return Response(serializer.data)
+        version = sensor_version(sensor_id) if sensor_id else sensors_version()
+        return conditional(request, make_etag(request, "measurements", version), lambda: list_measurements(request))
 
     elif request.method == 'POST':
         serializer = MeasurementSerializer(data=request.data, context={'request': request})
@@ -73,25 +139,90 @@ def measurement_list(request):
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def measurement_rollups(request):
+    """
+    Agrégats d'un capteur : ?sensor=1&resolution=minute|hour|day&from=...&to=...
+    (min / max / moyenne température et humidité, nombre de mesures et d'alertes)
+    """
+    sensor_id = request.query_params.get("sensor")
+    resolution = request.query_params.get("resolution", "hour")
+    if not sensor_id:
+        return Response({"error": "Paramètre sensor requis"}, status=400)
+    if resolution not in dict(MeasurementRollup.RESOLUTION_CHOICES):
+        return Response({"error": "resolution doit être minute, hour ou day"}, status=400)
+
+    start, end = parse_time_range(request)
+    qs = MeasurementRollup.objects.filter(sensor__sensor_id=sensor_id, resolution=resolution)
+    if start:
+        qs = qs.filter(bucket__gte=start)
+    if end:
+        qs = qs.filter(bucket__lte=end)
+
+    # Les plus récents d'abord pour borner la réponse, puis remis dans l'ordre chronologique
+    max_points = getattr(settings, "ROLLUP_MAX_POINTS", 5000)
+    rollups = list(qs.order_by("-bucket")[:max_points])[::-1]
+    return Response(MeasurementRollupSerializer(rollups, many=True).data)
+
+
 @api_view(['GET'])
 def measurement_latest(request):
+    """
+    Dernière mesure (?sensor=) depuis le cache "latest" ; la base n'est lue qu'en cas
+    d'absence. L'authentification reste celle par défaut (compte supprimé ou désactivé refusé).
+    """
     sensor_id = request.query_params.get("sensor")
 
-    qs = Measurement.objects.all().select_related("sensor")
+    data = latest.get_latest(sensor_id)
+    if data is None:
+        qs = measurement_source().select_related("sensor")
 
-    if sensor_id:
-        qs = qs.filter(sensor__sensor_id=sensor_id)
+        if sensor_id:
+            qs = qs.filter(sensor__sensor_id=sensor_id)
 
-    latest_measurement = qs.order_by("-timestamp").first()
+        latest_measurement = qs.order_by("-timestamp", "-id").first()
+
+        if not latest_measurement:
+            return Response(
+                {"message": "Aucune mesure trouvée"},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        data = MeasurementSerializer(latest_measurement).data
+        # Cache local : d'autres processus ingèrent sans l'invalider, la lecture n'y est pas gardée
+        if latest.shared():
+            latest.store(sensor_id, data)
+
+    # Nouvelle mesure => nouvel id ; capteur modifié => nouvelle génération
+    etag = quote_etag(f"latest-{data['id']}-{data['sensor'].get('generation')}")
+    return conditional(request, etag, lambda: Response(data))
+
+
+async def measurement_stream(request):
+    """
+    Flux temps réel (Server-Sent Events) : événements measurement, alert et led.
+    ?sensor=1,2 pour filtrer (tous les capteurs par défaut).
+    Jeton JWT dans l'en-tête Authorization ou ?token= (EventSource n'envoie pas d'en-tête).
+    Nécessite un serveur ASGI (uvicorn backend.asgi:application).
+    """
+    raw_token = request.GET.get("token") or request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    try:
+        AccessToken(raw_token)
+    except TokenError:
+        return JsonResponse({"detail": "Jeton invalide ou expiré"}, status=401)
+
+    try:
+        sensor_ids = [int(sid) for sid in request.GET.get("sensor", "").split(",") if sid]
+    except ValueError:
+        return JsonResponse({"error": "sensor doit être une liste d'identifiants"}, status=400)
+
+    response = StreamingHttpResponse(events.stream(sensor_ids or None), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
-    if not latest_measurement:
-        return Response(
-            {"message": "Aucune mesure trouvée"},
-            status=status.HTTP_404_NOT_FOUND
-        )
 
-    serializer = MeasurementSerializer(latest_measurement)
-    return Response(serializer.data)
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def incident_acknowledgement(request, measurement_id):
@@ -178,16 +309,47 @@ class SensorViewSet(viewsets.ModelViewSet):
     lookup_field = "sensor_id"  # permettre GET /sensors/1/ via sensor_id
     permission_classes = [IsAuthenticated]  # besoin JWT
 
+    def list(self, request, *args, **kwargs):
+        etag = make_etag(request, "sensors", sensors_version())
+        return conditional(request, etag, lambda: super(SensorViewSet, self).list(request, *args, **kwargs))
+
     @action(detail=True, methods=['post'])
     def resolve_alert(self, request, pk=None):
         sensor = self.get_object()
         sensor.alert_count = 0
         sensor.save()
+        reset_escalation([sensor.pk])
         return Response({"message": "Alerte résolue et compteur remis à zéro."})
 
+    @action(detail=True, methods=['post'])
+    def reevaluate(self, request, sensor_id=None):
+        """Recalcule le statut de tout l'historique du capteur avec ses règles actuelles."""
+        sensor = self.get_object()
+        seen, changed = reevaluate_sensor(sensor)
+        create_audit(
+            action="STATUS_REEVALUATED",
+            sensor=sensor,
+            details=f"{changed} statut(s) modifié(s) sur {seen} mesure(s)"
+        )
+        return Response({"measurements": seen, "changed": changed})
+
+class AlertRuleViewSet(viewsets.ModelViewSet):
+    """Règles d'alerte des capteurs (?sensor= pour filtrer par sensor_id)."""
+    queryset = AlertRule.objects.select_related("sensor").order_by("sensor__sensor_id", "id")
+    serializer_class = AlertRuleSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        sensor_id = self.request.query_params.get("sensor")
+        if sensor_id:
+            qs = qs.filter(sensor__sensor_id=sensor_id)
+        return qs
+
 class MeasurementViewSet(viewsets.ModelViewSet):
     queryset = Measurement.objects.all().select_related("sensor")
     serializer_class = MeasurementSerializer
+    pagination_class = MeasurementCursorPagination
 
     def get_permissions(self):
         if self.action == "create":
@@ -195,36 +357,29 @@ class MeasurementViewSet(viewsets.ModelViewSet):
         return [IsAuthenticated()]
 
     def get_queryset(self):
-        qs = super().get_queryset()
-        sensor_id = self.request.query_params.get("sensor")
-
-        if sensor_id:
-            qs = qs.filter(sensor__sensor_id=sensor_id)
-            try:
-                sensor = Sensor.objects.get(sensor_id=sensor_id)
-            except Sensor.DoesNotExist:
-                sensor = None
-        else:
-            sensor = None
-
-        if sensor and getattr(sensor, "alert_count", 0) > 0:
-            # Parcours chronologique pour détecter correctement la première alerte de chaque série
-            measurements = list(qs.order_by("timestamp"))
-            filtered = []
-            last_status = None
+        # Listes : table active ou vue des partitions selon ?from= ; le reste sur la table active
+        qs = None if self.action == "list" else super().get_queryset()
+        return filter_measurements(self.request, qs).order_by("-timestamp", "-id")
 
-            for m in measurements:
-                if m.status == "ALERT":
-                    if last_status != "ALERT":
-                        filtered.append(m)  # Première alerte d’une série
-                else:  # OK/NORMAL
-                    filtered.append(m)
-                last_status = m.status
+    def list(self, request, *args, **kwargs):
+        sensor_id = request.query_params.get("sensor")
+        version = sensor_version(sensor_id) if sensor_id else sensors_version()
+        etag = make_etag(request, "mesures", version)
+        if is_compact(request):
+            return conditional(request, etag, lambda: compact_page(request, self.get_queryset(), self.paginator))
+        return conditional(request, etag, lambda: super(MeasurementViewSet, self).list(request, *args, **kwargs))
 
-            # Retour en QuerySet pour DRF, trié par timestamp décroissant
-            return qs.filter(id__in=[m.id for m in filtered]).order_by("-timestamp")
+    def perform_update(self, serializer):
+        measurement = serializer.save()
+        # Les listes de mesures de ce capteur ont changé (ETag), la dernière mesure peut-être aussi
+        Sensor.objects.filter(pk=measurement.sensor_id).update(generation=F("generation") + 1)
+        latest.forget(measurement.sensor.sensor_id)
 
-        return qs.order_by("-timestamp")
+    def perform_destroy(self, instance):
+        instance.delete()
+        # Les listes de mesures de ce capteur ont changé
+        Sensor.objects.filter(pk=instance.sensor_id).update(generation=F("generation") + 1)
+        latest.forget(instance.sensor.sensor_id)
 
     def create(self, request, *args, **kwargs):
         """
@@ -236,6 +391,53 @@ class MeasurementViewSet(viewsets.ModelViewSet):
         out_serializer = self.get_serializer(measurement)
         return Response(out_serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk(self, request):
+        """
+        Ingestion par lot (Bridge) :
+        [{"sensor_id":1,"temperature":22.5,"humidity":40.0}, {"sensor_id":2,...}]
+        ou {"measurements": [...]}. Résultat renvoyé élément par élément.
+        """
+        items = request.data.get("measurements") if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({"error": "Liste de mesures attendue"}, status=400)
+
+        max_items = getattr(settings, "MEASUREMENT_BULK_MAX_ITEMS", 1000)
+        if len(items) > max_items:
+            return Response({"error": f"Maximum {max_items} mesures par lot"}, status=400)
+
+        results = [None] * len(items)
+        valid, positions = [], []
+        for index, item in enumerate(items):
+            serializer = MeasurementSerializer(data=item)
+            if serializer.is_valid():
+                valid.append(serializer.validated_data)
+                positions.append(index)
+            else:
+                results[index] = {"index": index, "errors": serializer.errors}
+
+        measurements = ingest_batch(valid, request.user)
+
+        for index, measurement in zip(positions, measurements):
+            if measurement is None:
+                results[index] = {"index": index, "errors": {"sensor_id": ["Capteur inconnu"]}}
+                continue
+            results[index] = {
+                "index": index,
+                "id": measurement.id,
+                "sensor_id": measurement.sensor.sensor_id,
+                "status": measurement.status,
+            }
+
+        created = sum(1 for m in measurements if m is not None)
+        if not created:
+            code = status.HTTP_400_BAD_REQUEST
+        elif created < len(items):
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_201_CREATED
+        return Response({"created": created, "results": results}, status=code)
+
 
 class AuditLogViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = AuditLog.objects.all().order_by("-created_at")
@@ -298,34 +500,91 @@ def me(request):
         "role": profile.role if profile else None
     })
 
+def export_output(request):
+    output = request.query_params.get("output", "csv")
+    if output not in OUTPUTS:
+        raise ValidationError({"output": "Valeurs possibles : csv, jsonl"})
+    return output
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def export_audit_logs(request):
-    response = HttpResponse(content_type="text/csv")
-    response["Content-Disposition"] = 'attachment; filename="audit_logs.csv"'
-
-    writer = csv.writer(response, delimiter=",")
-    writer.writerow([
-        "ID",
-        "Action",
-        "Sensor",
-        "Details",
-        "Created At"
-    ])
-
-    logs = AuditLog.objects.select_related("sensor").order_by("-created_at")
-
-    for log in logs:
-        writer.writerow([
-            log.id,
-            log.action,
-            log.sensor.name if log.sensor else "",
-            log.details,
-            log.created_at.strftime("%Y-%m-%d %H:%M:%S")
-        ])
+    """
+    Export du journal d'audit en flux : ?output=csv|jsonl&sensor=&from=&to=
+    """
+    output = export_output(request)
+    start, end = parse_time_range(request)
+    sensor_id = request.query_params.get("sensor")
+
+    logs = AuditLog.objects.order_by("-created_at")
+    if sensor_id:
+        logs = logs.filter(sensor__sensor_id=sensor_id)
+    if start:
+        logs = logs.filter(created_at__gte=start)
+    if end:
+        logs = logs.filter(created_at__lte=end)
+
+    return stream_export(
+        logs,
+        fields=("id", "action", "sensor__name", "details", "created_at"),
+        header=["ID", "Action", "Sensor", "Details", "Created At"],
+        filename="audit_logs",
+        output=output,
+        formatters=[None, None, lambda name: name or "", None, lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S")],
+        keys=("id", "action", "sensor", "details", "created_at"),
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def export_measurements(request):
+    """
+    Export des mesures en flux, ordre chronologique : ?output=csv|jsonl&sensor=&from=&to=
+    """
+    output = export_output(request)
+    start, end = parse_time_range(request)
+    sensor_id = request.query_params.get("sensor")
+
+    measurements = measurement_source(start).order_by("timestamp", "id")
+    if sensor_id:
+        measurements = measurements.filter(sensor__sensor_id=sensor_id)
+    if start:
+        measurements = measurements.filter(timestamp__gte=start)
+    if end:
+        measurements = measurements.filter(timestamp__lte=end)
+
+    return stream_export(
+        measurements,
+        fields=("id", "sensor__sensor_id", "timestamp", "temperature", "humidity", "status"),
+        header=["ID", "Sensor", "Timestamp", "Temperature", "Humidity", "Status"],
+        filename="measurements",
+        output=output,
+        formatters=[None, None, lambda dt: dt.strftime("%Y-%m-%d %H:%M:%S"), None, None, None],
+        keys=("id", "sensor_id", "timestamp", "temperature", "humidity", "status"),
+    )
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def read_archived(request, table):
+    """
+    Lignes archivées par archive_data, en flux JSONL gzip : ?sensor=&from=&to=
+    Seuls les fichiers des jours demandés sont lus.
+    """
+    if table not in ARCHIVES:
+        return Response({"error": f"Table inconnue, valeurs possibles : {', '.join(sorted(ARCHIVES))}"}, status=404)
+    start, end = parse_time_range(request)
+    keys = ARCHIVES[table].keys
+    records = read_archive(table, start, end, request.query_params.get("sensor"))
+
+    response = StreamingHttpResponse(
+        gzip_jsonl(keys, (tuple(r[k] for k in keys) for r in records)),
+        content_type="application/gzip",
+    )
+    response["Content-Disposition"] = f'attachment; filename="{table}_archive.jsonl.gz"'
     return response
 
+
 class TicketViewSet(viewsets.ModelViewSet):
     queryset = Ticket.objects.all().order_by('-created_at')
     serializer_class = TicketSerializer
@@ -342,7 +601,7 @@ class TicketViewSet(viewsets.ModelViewSet):
         ticket.status = "ASSIGNED"
         ticket.save()
 
-        AuditLog.objects.create(
+        create_audit(
             action="TICKET_ASSIGNED",
             sensor=ticket.sensor,
             details=f"Ticket #{ticket.id} assigné manuellement"
@@ -361,7 +620,7 @@ class TicketViewSet(viewsets.ModelViewSet):
         ticket.closed_at = now()
         ticket.save()
 
-        AuditLog.objects.create(
+        create_audit(
             action="TICKET_CLOSED",
             sensor=ticket.sensor,
             details=f"Ticket #{ticket.id} clôturé"
@@ -387,6 +646,7 @@ def control_led(request):
         led_state, created = LedState.objects.get_or_create(id=1)
         led_state.state = command
         led_state.save()
+        events.notify_led(command, led_state.last_updated)
         
         return Response({
             'status': 'success',
@@ -396,15 +656,48 @@ def control_led(request):
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
+def led_etag(led_state):
+    return f'"{led_state.state}-{led_state.last_updated.timestamp():.6f}"'
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny]) # Sécuriser avec IsAuthenticated si possible, le bridge a un token
 def get_led_status(request):
     """
-    Endpoint pour le Bridge Local (Polling)
+    Endpoint pour le Bridge Local.
+    Long-poll : avec ?wait=<s> et If-None-Match (ou ?since=<last_updated>), la requête reste
+    ouverte jusqu'à la prochaine commande ; 304 si rien n'a changé à l'expiration.
     """
+    known_etag = request.headers.get("If-None-Match")
+    try:
+        since = parse_datetime(request.query_params.get("since", ""))
+    except ValueError:
+        return Response({"error": "since doit être une date ISO 8601 valide"}, status=400)
+    try:
+        wait = min(max(float(request.query_params.get("wait", 0)), 0), settings.LED_LONGPOLL_MAX_WAIT)
+    except ValueError:
+        return Response({"error": "wait doit être un nombre de secondes"}, status=400)
+
+    def already_known(led_state):
+        return known_etag == led_etag(led_state) or since == led_state.last_updated
+
+    deadline = time.monotonic() + wait
+    seen = events.led_version()
     led_state, created = LedState.objects.get_or_create(id=1)
-    return Response({
-        'state': led_state.state,
-        'last_updated': led_state.last_updated
-    })
 
+    while already_known(led_state) and (remaining := deadline - time.monotonic()) > 0:
+        # Réveil immédiat par control_led dans ce processus ; relecture périodique
+        # de la base pour les commandes reçues par un autre worker
+        events.wait_led(seen, min(remaining, settings.LED_LONGPOLL_RECHECK))
+        seen = events.led_version()
+        led_state.refresh_from_db()
+
+    if already_known(led_state):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response({
+            'state': led_state.state,
+            'last_updated': led_state.last_updated
+        })
+    response["ETag"] = led_etag(led_state)
+    return response
@@ -0,0 +1,102 @@
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .audit import flush_audit
+
+_STOP = object()
+
+
+class PartitionedWorkerPool:
+    """
+    Pool de threads avec une file bornée par worker.
+    Une même clé (ex: sensor_id) est toujours traitée par le même worker :
+    l'ordre de traitement est garanti par clé, pas entre clés.
+    """
+
+    def __init__(self, handler, workers=4, queue_depth=1000, put_timeout=1.0, name="worker"):
+        self.handler = handler
+        self.put_timeout = put_timeout
+        self.name = name
+        self.queues = [queue.Queue(maxsize=queue_depth) for _ in range(workers)]
+        self.threads = []
+        self.lock = threading.Lock()
+        self.counters = {
+            "submitted": 0,
+            "processed": 0,
+            "failed": 0,
+            "dropped": 0,
+            "lag_total": 0.0,
+            "lag_max": 0.0,
+        }
+
+    def start(self):
+        for index, q in enumerate(self.queues):
+            t = threading.Thread(target=self._run, args=(q,), name=f"{self.name}-{index}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, key, item):
+        """
+        Place l'élément dans la file de sa partition.
+        Retourne False (élément perdu, compté dans "dropped") si la file reste pleine.
+        """
+        q = self.queues[hash(key) % len(self.queues)]
+        try:
+            q.put((time.monotonic(), item), timeout=self.put_timeout)
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("submitted")
+        return True
+
+    def stop(self, timeout=None):
+        """Traite ce qui reste en file puis arrête les workers."""
+        for q in self.queues:
+            q.put(_STOP)
+        for t in self.threads:
+            t.join(timeout)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        done = stats["processed"] + stats["failed"]
+        stats["lag_avg"] = stats["lag_total"] / done if done else 0.0
+        stats["queued"] = [q.qsize() for q in self.queues]
+        return stats
+
+    def _count(self, key, value=1):
+        with self.lock:
+            self.counters[key] += value
+
+    def _run(self, q):
+        try:
+            while True:
+                try:
+                    entry = q.get(timeout=getattr(settings, "AUDIT_BUFFER_MAX_AGE", 5))
+                except queue.Empty:
+                    # Worker inactif : on écrit l'audit en attente
+                    flush_audit()
+                    continue
+                if entry is _STOP:
+                    break
+
+                enqueued_at, item = entry
+                lag = time.monotonic() - enqueued_at
+                with self.lock:
+                    self.counters["lag_total"] += lag
+                    self.counters["lag_max"] = max(self.counters["lag_max"], lag)
+
+                close_old_connections()
+                try:
+                    self.handler(item)
+                    self._count("processed")
+                except Exception as e:
+                    print(f"❌ Erreur worker {threading.current_thread().name}: {e}")
+                    self._count("failed")
+        finally:
+            flush_audit()
+            connection.close()
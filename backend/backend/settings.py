@@ -64,6 +64,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.audit.AuditFlushMiddleware',
 ]
 
 ROOT_URLCONF = 'backend.urls'
@@ -93,6 +94,10 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Plusieurs writers (API + workers MQTT) : attendre le verrou plutôt qu'échouer
+            'timeout': 20,
+        },
     }
 }
 
@@ -181,3 +186,82 @@ MQTT_CLOUD_PORT = int(os.getenv('MQTT_CLOUD_PORT', 8883))
 MQTT_CLOUD_USER = os.getenv('MQTT_CLOUD_USER', "soufiane")
 MQTT_CLOUD_PASSWORD = os.getenv('MQTT_CLOUD_PASSWORD', "Souf0000")
 MQTT_CLOUD_TOPIC_CMD = "devices/esp8266-001/cmd/led"
+
+# Ingestion par lot (/api/mesures/bulk/)
+MEASUREMENT_BULK_MAX_ITEMS = int(os.getenv('MEASUREMENT_BULK_MAX_ITEMS', 1000))
+
+# Subscriber MQTT : workers partitionnés par capteur
+MQTT_WORKERS = int(os.getenv('MQTT_WORKERS', 4))
+MQTT_QUEUE_DEPTH = int(os.getenv('MQTT_QUEUE_DEPTH', 1000))
+
+# Cache de configuration des capteurs (api/registry.py), durée de vie max d'une entrée en secondes
+SENSOR_REGISTRY_TTL = int(os.getenv('SENSOR_REGISTRY_TTL', 300))
+
+# Outbox des notifications (commande dispatch_notifications)
+NOTIFICATION_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 5))
+NOTIFICATION_BACKOFF_BASE = int(os.getenv('NOTIFICATION_BACKOFF_BASE', 30))   # secondes
+NOTIFICATION_BACKOFF_MAX = int(os.getenv('NOTIFICATION_BACKOFF_MAX', 3600))   # secondes
+
+# Journal d'audit tamponné (api/audit.py) : un bulk_create par requête / worker,
+# ou dès AUDIT_BUFFER_SIZE entrées / AUDIT_BUFFER_MAX_AGE secondes.
+# AUDIT_SYNC=True : un INSERT immédiat par entrée (tests).
+AUDIT_SYNC = os.getenv('AUDIT_SYNC', '0') == '1'
+AUDIT_BUFFER_SIZE = int(os.getenv('AUDIT_BUFFER_SIZE', 100))
+AUDIT_BUFFER_MAX_AGE = float(os.getenv('AUDIT_BUFFER_MAX_AGE', 5))
+
+# Agrégats minute/heure/jour (/api/measurements/rollups/), nombre max d'intervalles renvoyés
+ROLLUP_MAX_POINTS = int(os.getenv('ROLLUP_MAX_POINTS', 5000))
+
+# Nombre max de mesures renvoyées par /api/measurements/ (page suivante via l'en-tête Link)
+MEASUREMENT_LIST_LIMIT = int(os.getenv('MEASUREMENT_LIST_LIMIT', 1000))
+
+# Cache de la dernière mesure par capteur (api/latest.py), écrit par l'ingestion.
+# Mémoire locale par défaut : chaque processus ne voit que ses propres ingestions, d'où un
+# TTL court (5 s). Avec plusieurs processus (workers web + subscriber MQTT), un cache partagé
+# est nécessaire pour servir la vraie dernière mesure ; son TTL par défaut est alors de 300 s :
+# LATEST_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache  LATEST_CACHE_LOCATION=/tmp/latest
+# LATEST_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache          LATEST_CACHE_LOCATION=redis://127.0.0.1:6379
+LATEST_CACHE_BACKEND = os.getenv('LATEST_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+LATEST_CACHE_SHARED = not LATEST_CACHE_BACKEND.endswith('LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'latest': {
+        'BACKEND': LATEST_CACHE_BACKEND,
+        'LOCATION': os.getenv('LATEST_CACHE_LOCATION', 'latest-readings'),
+        'TIMEOUT': int(os.getenv('LATEST_CACHE_TTL', 300 if LATEST_CACHE_SHARED else 5)),
+    },
+}
+
+# Flux temps réel SSE (/api/stream/) : keep-alive en secondes, événements en attente max par client
+EVENT_STREAM_HEARTBEAT = int(os.getenv('EVENT_STREAM_HEARTBEAT', 15))
+EVENT_STREAM_QUEUE = int(os.getenv('EVENT_STREAM_QUEUE', 100))
+
+# Long-poll de l'état LED (/api/led/status/?wait=) : attente max et relecture de la base (s)
+LED_LONGPOLL_MAX_WAIT = float(os.getenv('LED_LONGPOLL_MAX_WAIT', 30))
+LED_LONGPOLL_RECHECK = float(os.getenv('LED_LONGPOLL_RECHECK', 5))
+
+# Rétention (commande archive_data) : au-delà de N jours, les lignes partent dans
+# ARCHIVE_DIR/<table>/<jour>.jsonl.gz puis sont supprimées. 0 = conservation illimitée.
+ARCHIVE_DIR = Path(os.getenv('ARCHIVE_DIR', BASE_DIR / 'archive'))
+RETENTION_DAYS = {
+    'measurement': int(os.getenv('RETENTION_MEASUREMENT_DAYS', 90)),
+    'auditlog': int(os.getenv('RETENTION_AUDITLOG_DAYS', 180)),
+    'dht11': int(os.getenv('RETENTION_DHT11_DAYS', 30)),
+}
+
+# Partitions mensuelles des mesures (commande seal_partitions) : mois complets gardés
+# dans la table active en plus du mois en cours
+PARTITION_HOT_MONTHS = int(os.getenv('PARTITION_HOT_MONTHS', 1))
+
+# Détection d'anomalies en flux (api/anomaly.py) : lissage EWMA, seuil en écarts-types,
+# mesures avant d'évaluer les pics, variation max (°C/min), répétitions = capteur figé,
+# sauvegarde de l'état des détecteurs (s)
+ANOMALY_ALPHA = float(os.getenv('ANOMALY_ALPHA', 0.1))
+ANOMALY_Z = float(os.getenv('ANOMALY_Z', 4))
+ANOMALY_WARMUP = int(os.getenv('ANOMALY_WARMUP', 20))
+ANOMALY_MIN_STD = float(os.getenv('ANOMALY_MIN_STD', 0.1))
+ANOMALY_MAX_RATE = float(os.getenv('ANOMALY_MAX_RATE', 2))
+ANOMALY_STUCK_COUNT = int(os.getenv('ANOMALY_STUCK_COUNT', 30))
+ANOMALY_CHECKPOINT_INTERVAL = float(os.getenv('ANOMALY_CHECKPOINT_INTERVAL', 60))
@@ -1,10 +1,13 @@
 import os
 import json
 import time
+import sqlite3
+import asyncio
+import functools
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 import paho.mqtt.client as mqtt
-import ssl
-import threading
 import getpass
 
 # --- CONFIGURATION LOCALE (vers ESP8266) ---
@@ -22,58 +25,265 @@ HIVEMQ_TOPIC_CMD = "devices/esp8266-001/cmd/led"
 
 # --- CONFIGURATION API ---
 API_LOGIN_URL = "https://souf.pythonanywhere.com/api/auth/login/"
-API_MEASUREMENT_URL = "https://souf.pythonanywhere.com/api/mesures/"
+API_BULK_URL = "https://souf.pythonanywhere.com/api/mesures/bulk/"
+API_STATUS_URL = "https://souf.pythonanywhere.com/api/led/status/"
 USERNAME = "souf"
 PASSWORD = None  # Sera demandé au lancement
-TOKEN = None
+
+# --- CONFIGURATION HTTP ---
+MAX_CONCURRENT_UPLOADS = int(os.getenv("BRIDGE_MAX_CONCURRENT_UPLOADS", 4))  # Requêtes simultanées vers l'API
+HTTP_TIMEOUT = 30
+PERMANENT_REJECTIONS = (400, 422)  # Seuls codes pour lesquels un lot est retiré du spool sans être traité
+
+# --- CONFIGURATION SPOOL (file d'attente locale sur disque) ---
+SPOOL_PATH = os.getenv("BRIDGE_SPOOL_PATH", "bridge_spool.sqlite3")
+SPOOL_MAX_ROWS = int(os.getenv("BRIDGE_SPOOL_MAX_ROWS", 100000))  # Au-delà, les plus anciennes sont supprimées
+BATCH_SIZE = int(os.getenv("BRIDGE_BATCH_SIZE", 200))               # Nombre max de mesures par envoi
+FLUSH_INTERVAL = float(os.getenv("BRIDGE_FLUSH_INTERVAL", 5))       # Délai max (s) avant envoi d'un lot partiel
+RETRY_MAX_DELAY = 60                                                 # Backoff max (s) quand l'API est indisponible
+LED_POLL_INTERVAL = 2                                               # Pause (s) après une erreur de polling
+LED_LONGPOLL_WAIT = int(os.getenv("BRIDGE_LED_LONGPOLL_WAIT", 25))   # Attente max (s) d'une commande par requête
 
 # --- CLIENTS MQTT ---
 local_client = mqtt.Client(client_id="Bridge_Local")
 hivemq_client = mqtt.Client(client_id="Bridge_HiveMQ", protocol=mqtt.MQTTv5)
 
-# --- FONCTIONS AUTHENTIFICATION ---
+# --- CLIENT API (HTTP keep-alive + JWT) ---
+
+class ApiClient:
+    """
+    Client HTTP partagé par tout le bridge.
+    - une seule Session requests : connexions TLS réutilisées (keep-alive)
+    - au plus MAX_CONCURRENT_UPLOADS requêtes en vol
+    - renouvellement du token unique, partagé par toutes les requêtes en attente
+    """
 
-def get_jwt_token():
-    global TOKEN, PASSWORD
-    print(f"🔑 Authentification sur {API_LOGIN_URL}")
-    
-    if not PASSWORD:
-         PASSWORD = getpass.getpass(prompt=f"Entrez le mot de passe pour l'utilisateur '{USERNAME}': ")
+    def __init__(self, max_concurrency):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency + 1)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # requests est bloquant : les appels tournent dans un pool de threads borné,
+        # la coordination (file, sémaphore, token) reste dans la boucle asyncio
+        # +1 thread : le long-poll LED ne prend pas la place d'un envoi de mesures
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency + 1, thread_name_prefix="bridge-http")
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.token_lock = asyncio.Lock()
+        self.token = None
+
+    async def _call(self, method, url, limited=True, **kwargs):
+        loop = asyncio.get_running_loop()
+        kwargs.setdefault("timeout", HTTP_TIMEOUT)
+        call = functools.partial(self.session.request, method, url, **kwargs)
+        if not limited:
+            return await loop.run_in_executor(self.executor, call)
+        async with self.semaphore:
+            return await loop.run_in_executor(self.executor, call)
+
+    async def login(self):
+        print(f"🔑 Authentification sur {API_LOGIN_URL}")
+        try:
+            response = await self._call("POST", API_LOGIN_URL, data={"username": USERNAME, "password": PASSWORD})
+        except Exception as e:
+            print(f"❌ Erreur connexion API : {e}")
+            return False
 
-    try:
-        response = requests.post(API_LOGIN_URL, data={"username": USERNAME, "password": PASSWORD})
         if response.status_code == 200:
-            TOKEN = response.json().get("access")
+            self.token = response.json().get("access")
             print("✅ Token JWT récupéré avec succès !")
             return True
-        else:
-            print(f"❌ Échec auth : {response.status_code} - {response.text}")
-            return False
-    except Exception as e:
-        print(f"❌ Erreur connexion API : {e}")
+
+        print(f"❌ Échec auth : {response.status_code} - {response.text}")
         return False
 
-def send_data_to_api(payload):
-    global TOKEN
-    if not TOKEN:
-        if not get_jwt_token():
-            return
+    async def refresh_token(self, stale_token):
+        """
+        Un seul renouvellement pour toutes les requêtes qui ont reçu un 401 :
+        celles qui arrivent après le renouvellement réutilisent le nouveau token.
+        """
+        async with self.token_lock:
+            if self.token is not None and self.token != stale_token:
+                return True
+            return await self.login()
+
+    async def request(self, method, url, **kwargs):
+        """
+        Requête authentifiée. Sur 401, renouvelle le token une fois et rejoue la requête.
+        limited=False : hors sémaphore (long-poll qui reste ouvert sans transférer de données).
+        """
+        extra_headers = kwargs.pop("headers", None) or {}
+        for attempt in range(2):
+            token = self.token
+            if token is None:
+                if not await self.refresh_token(None):
+                    return None
+                token = self.token
+
+            headers = dict(extra_headers)
+            headers["Authorization"] = f"Bearer {token}"
+            response = await self._call(method, url, headers=headers, **kwargs)
+
+            if response.status_code != 401 or attempt:
+                return response
 
-    headers = {"Authorization": f"Bearer {TOKEN}"}
-    try:
-        response = requests.post(API_MEASUREMENT_URL, json=payload, headers=headers)
-        
-        if response.status_code == 201:
-            print("🚀 Envoyé vers PythonAnywhere (Code 201)")
-        elif response.status_code == 401:
             print("🔄 Token expiré, renouvellement...")
-            if get_jwt_token():
-                send_data_to_api(payload) # Retry
-        else:
-            print(f"⚠️ Erreur API ({response.status_code}): {response.text}")
+            if not await self.refresh_token(token):
+                return response
+        return response
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
 
+# --- SPOOL LOCAL ---
+
+class Spool:
+    """
+    File d'attente persistante (SQLite en mode WAL).
+    on_local_message ne fait qu'y ajouter les mesures ; le flusher les envoie par lots.
+    Les mesures non envoyées sont rejouées au redémarrage du bridge.
+    """
+
+    def __init__(self, path, max_rows):
+        self.max_rows = max_rows
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA journal_size_limit=4194304")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "payload TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self.size = self.conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+    def put(self, payload):
+        self.conn.execute(
+            "INSERT INTO spool (payload, created_at) VALUES (?, ?)",
+            (json.dumps(payload), time.time())
+        )
+        self.size += 1
+
+        # Borne l'usage disque : on sacrifie les mesures les plus anciennes
+        overflow = self.size - self.max_rows
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM spool WHERE id IN (SELECT id FROM spool ORDER BY id LIMIT ?)",
+                (overflow,)
+            )
+            self.size -= overflow
+            print(f"⚠️ Spool plein : {overflow} mesure(s) ancienne(s) supprimée(s)")
+
+    def peek(self, limit):
+        rows = self.conn.execute(
+            "SELECT id, payload FROM spool ORDER BY id LIMIT ?", (limit,)
+        ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def ack(self, ids):
+        ids = list(ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            deleted = self.conn.execute(f"DELETE FROM spool WHERE id IN ({placeholders})", chunk).rowcount
+            self.size = max(self.size - deleted, 0)
+
+    def __len__(self):
+        return self.size
+
+
+spool = None        # Spool ouvert par la boucle principale (aucun fichier créé à l'import)
+flush_event = None  # asyncio.Event créé par la boucle principale
+backing_off = False # API injoignable : le flusher attend la fin de son backoff
+
+
+async def send_batch_to_api(api, payloads):
+    """
+    Envoie un lot vers /api/mesures/bulk/.
+    Retourne True si le lot peut être retiré du spool (traité ou rejeté définitivement),
+    False s'il faut réessayer plus tard (API indisponible, réseau...).
+    """
+    try:
+        response = await api.request("POST", API_BULK_URL, json=payloads)
     except Exception as e:
         print(f"❌ Erreur Envoi API : {e}")
+        return False
+
+    if response is None:
+        return False
+
+    if response.status_code in (201, 207):
+        data = response.json()
+        print(f"🚀 Lot envoyé vers PythonAnywhere : {data.get('created')}/{len(payloads)} mesure(s)")
+        for result in data.get("results", []):
+            if "errors" in result:
+                print(f"⚠️ Mesure rejetée ({result['index']}) : {result['errors']}")
+        return True
+
+    if response.status_code in PERMANENT_REJECTIONS:
+        # Lot invalide : le renvoyer ne changera rien
+        print(f"⚠️ Lot rejeté ({response.status_code}): {response.text}")
+        return True
+
+    # 408, 413, 429, 5xx... : erreur passagère, le lot reste dans le spool (backoff)
+    print(f"⚠️ Erreur API ({response.status_code}): {response.text}")
+    return False
+
+
+def split_by_sensor(rows, parts, size=BATCH_SIZE):
+    """
+    Répartit les lignes du spool en `parts` lots envoyés en parallèle.
+    Toutes les mesures d'un même capteur vont dans le même lot, dans l'ordre :
+    l'ordre d'arrivée côté serveur est conservé par capteur.
+    Chaque lot est limité à `size` mesures ; le reste attend le tour suivant dans le spool
+    (un second lot du même capteur envoyé en parallèle pourrait arriver avant le premier).
+    """
+    groups = [[] for _ in range(parts)]
+    for row_id, payload in rows:
+        groups[hash(payload.get("sensor_id")) % parts].append((row_id, payload))
+    return [group[:size] for group in groups if group]
+
+
+async def flush_spool(api):
+    """
+    Vide le spool par lots : dès BATCH_SIZE mesures ou toutes les FLUSH_INTERVAL secondes.
+    Jusqu'à MAX_CONCURRENT_UPLOADS lots en parallèle, backoff exponentiel si l'API est injoignable.
+    """
+    global backing_off
+    delay = FLUSH_INTERVAL
+    print(f"📦 Spool : {len(spool)} mesure(s) en attente au démarrage")
+
+    while True:
+        try:
+            await asyncio.wait_for(flush_event.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        flush_event.clear()
+
+        rows = spool.peek(BATCH_SIZE * MAX_CONCURRENT_UPLOADS)
+        if not rows:
+            delay = FLUSH_INTERVAL
+            continue
+
+        batches = split_by_sensor(rows, MAX_CONCURRENT_UPLOADS)
+        results = await asyncio.gather(*(
+            send_batch_to_api(api, [payload for _, payload in batch]) for batch in batches
+        ))
+
+        for batch, ok in zip(batches, results):
+            if ok:
+                spool.ack(row_id for row_id, _ in batch)
+
+        backing_off = not all(results)
+        if not backing_off:
+            delay = FLUSH_INTERVAL
+            if len(spool) >= BATCH_SIZE:
+                flush_event.set()
+        else:
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+            print(f"⏳ Nouvel essai dans {delay:.0f}s ({len(spool)} mesure(s) en attente)")
+
 
 # --- CALLBACKS LOCAL (ESP -> API) ---
 def on_local_connect(client, userdata, flags, rc):
@@ -98,8 +308,12 @@ def on_local_message(client, userdata, msg):
             "status": "OK"
         }
 
-        print(f"📤 Envoi payload : {json.dumps(api_payload)}")
-        send_data_to_api(api_payload)
+        # Mise en file uniquement : l'envoi est fait par le flusher
+        spool.put(api_payload)
+        print(f"📦 Mis en file : {json.dumps(api_payload)} ({len(spool)} en attente)")
+        # Pendant un backoff, le spool reste plein : pas de réveil à chaque message
+        if len(spool) >= BATCH_SIZE and not backing_off:
+            flush_event.set()
 
     except Exception as e:
         print(f"❌ Erreur traitement message : {e}")
@@ -117,7 +331,7 @@ def on_hivemq_message(client, userdata, msg):
     try:
         decoded_cmd = msg.payload.decode()
         print(f"⚡ COMMANDE REÇUE DU CLOUD : {decoded_cmd}")
-        
+
         # Relai vers le broker local (pour que l'ESP l'entende)
         print(f"🔄 Redirection vers Broker Local...")
         local_client.publish(LOCAL_TOPIC_CMD, decoded_cmd)
@@ -125,73 +339,139 @@ def on_hivemq_message(client, userdata, msg):
          print(f"❌ Erreur relais commande : {e}")
 
 # --- POLLING (Cloud -> Local) ---
-def poll_led_status():
+async def poll_led_status(api):
     """
-    Polle régulièrement l'API pour récupérer la dernière commande LED
-    et la publie sur le broker local si elle a changé.
+    Long-poll de la commande LED : le serveur garde la requête ouverte jusqu'à la
+    prochaine commande (ou LED_LONGPOLL_WAIT s, réponse 304), puis on la publie
+    sur le broker local. La requête suivante part aussitôt.
     """
-    global TOKEN
-    last_known_time = ""
-    
-    API_STATUS_URL = "https://souf.pythonanywhere.com/api/led/status/"
-    
-    print(f"👂 Démarrage du Polling sur {API_STATUS_URL} (Toutes les 2s)")
+    etag = None
+    first = True
+
+    print(f"👂 Démarrage du Long-poll sur {API_STATUS_URL} (attente max {LED_LONGPOLL_WAIT}s)")
 
     while True:
         try:
-            if not TOKEN:
-                time.sleep(2)
+            headers = {"If-None-Match": etag} if etag else {}
+            response = await api.request(
+                "GET", API_STATUS_URL,
+                params={"wait": LED_LONGPOLL_WAIT} if etag else None,
+                headers=headers,
+                timeout=LED_LONGPOLL_WAIT + 10,
+                limited=False,
+            )
+
+            if response is not None and response.status_code == 304:
                 continue
 
-            headers = {"Authorization": f"Bearer {TOKEN}"}
-            response = requests.get(API_STATUS_URL, headers=headers, timeout=5)
-
-            if response.status_code == 200:
-                data = response.json()
-                server_state = data.get("state") # ON, OFF
-                server_time = data.get("last_updated")
-
-                # Si c'est la première lecture ou si la commande est plus récente
-                if server_time != last_known_time:
-                    if last_known_time != "": # On ne publie pas au tout premier démarrage pour éviter de spam
-                         print(f"⚡ COMMANDE REÇUE (Polling) : {server_state}")
-                         local_client.publish(LOCAL_TOPIC_CMD, server_state)
-                    
-                    last_known_time = server_time
-            
-            elif response.status_code == 401:
-                print("🔄 Token expiré (Polling), renouvellement...")
-                get_jwt_token()
+            if response is not None and response.status_code == 200:
+                server_state = response.json().get("state") # ON, OFF
+                # On ne publie pas au tout premier démarrage pour éviter de spam
+                if not first:
+                    print(f"⚡ COMMANDE REÇUE (Long-poll) : {server_state}")
+                    local_client.publish(LOCAL_TOPIC_CMD, server_state)
+                first = False
+                etag = response.headers.get("ETag")
+                if etag:
+                    continue  # Sans ETag (ancienne API) : polling classique
 
         except Exception as e:
             print(f"⚠️ Erreur Polling : {e}")
-        
-        time.sleep(2)
 
-def start_polling_thread():
-    t = threading.Thread(target=poll_led_status)
-    t.daemon = True
-    t.start()
+        await asyncio.sleep(LED_POLL_INTERVAL)
 
-# --- MAIN ---
-if __name__ == "__main__":
-    print("--- IOT BRIDGE (LOCAL <-> CLOUD) ---")
-    
-    # Authentification initiale
-    get_jwt_token()
+# --- MQTT DANS LA BOUCLE ASYNCIO ---
 
-    # Démarrage du Polling (Cloud -> Local) en arrière-plan
-    start_polling_thread()
+class AsyncioMqttHelper:
+    """
+    Branche le socket paho sur la boucle asyncio (add_reader/add_writer)
+    au lieu d'un thread loop_forever : une seule boucle pour tout le bridge.
+    """
+
+    def __init__(self, loop, client):
+        self.loop = loop
+        self.client = client
+        self.disconnected = asyncio.Event()
+        self.misc = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client, userdata, sock):
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client, userdata, sock):
+        self.loop.remove_reader(sock)
+        if self.misc:
+            self.misc.cancel()
+        self.disconnected.set()
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self):
+        # Keepalive / retransmissions, équivalent de loop_misc() dans loop_forever
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                break
+
+    async def run(self, host, port):
+        delay = 1
+        while True:
+            self.disconnected.clear()
+            try:
+                print(f"🔄 Connexion au Broker Local ({host})...")
+                self.client.connect(host, port, 60)
+                delay = 1
+                await self.disconnected.wait()
+                print("⚠️ Déconnexion du Broker Local, reconnexion...")
+            except Exception as e:
+                print(f"\n❌ Erreur connexion locale : {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RETRY_MAX_DELAY)
+
+
+async def main():
+    global flush_event, spool
+    spool = Spool(SPOOL_PATH, SPOOL_MAX_ROWS)
+    flush_event = asyncio.Event()
+    if len(spool):
+        flush_event.set()
 
-    # Démarrage du Bridge Local (Local -> API)
+    api = ApiClient(MAX_CONCURRENT_UPLOADS)
+
+    # Authentification initiale
+    await api.login()
+
+    # Bridge Local (Local -> API)
     local_client.on_connect = on_local_connect
     local_client.on_message = on_local_message
+    mqtt_helper = AsyncioMqttHelper(asyncio.get_running_loop(), local_client)
 
     try:
-        print(f"🔄 Connexion au Broker Local ({LOCAL_BROKER})...")
-        local_client.connect(LOCAL_BROKER, LOCAL_PORT, 60)
-        local_client.loop_forever()
+        await asyncio.gather(
+            mqtt_helper.run(LOCAL_BROKER, LOCAL_PORT),  # Réception ESP -> spool
+            flush_spool(api),                           # Envoi des mesures en attente (Local -> API)
+            poll_led_status(api),                       # Long-poll (Cloud -> Local)
+        )
+    finally:
+        local_client.disconnect()
+        api.close()
+
+# --- MAIN ---
+if __name__ == "__main__":
+    print("--- IOT BRIDGE (LOCAL <-> CLOUD) ---")
+
+    PASSWORD = getpass.getpass(prompt=f"Entrez le mot de passe pour l'utilisateur '{USERNAME}': ")
+
+    try:
+        asyncio.run(main())
     except KeyboardInterrupt:
         print("\nArrêt.")
-    except Exception as e:
-        print(f"\n❌ Erreur connexion locale : {e}")